@@ -0,0 +1,237 @@
+import atexit
+import math
+import os
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+
+# Границы корзин гистограммы времени ответа, секунды.
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, math.inf,
+)
+# Как часто процесс сбрасывает накопленное в общий файл, секунды.
+FLUSH_INTERVAL = getattr(settings, "METRICS_FLUSH_INTERVAL", 1.0)
+# Сколько разных рядов можно накопить до сброса раньше срока.
+FLUSH_MAX_PENDING = getattr(settings, "METRICS_FLUSH_MAX_PENDING", 1000)
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+# Имя → (тип, описание) для метрик, которые пишутся при обработке запросов.
+FAMILIES = {
+    "yatube_requests_total": (COUNTER, "HTTP-запросы по имени URL."),
+    "yatube_request_duration_seconds": (
+        HISTOGRAM, "Время ответа по имени URL."
+    ),
+    "yatube_db_queries_total": (
+        COUNTER, "Запросы к базе по имени URL."
+    ),
+}
+
+_collectors = []
+_pending = {}
+_lock = threading.Lock()
+_state = {"connection": None, "key": None, "flushed": time.monotonic()}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    le REAL NOT NULL DEFAULT 0,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, le)
+)
+"""
+
+
+def _connection():
+    """Соединение с файлом метрик, своё у каждого процесса.
+
+    После fork воркера WSGI-сервера соединение открывается заново.
+    """
+
+    path = settings.METRICS_DB_PATH
+    key = (os.getpid(), path)
+    if _state["key"] != key:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        connection = sqlite3.connect(path, timeout=5, isolation_level=None)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute("PRAGMA synchronous=OFF")
+        connection.execute(SCHEMA)
+        _state["connection"], _state["key"] = connection, key
+    return _state["connection"]
+
+
+def _after_fork_in_child():
+    # Новый воркер не должен второй раз сбросить счётчики родителя.
+    _pending.clear()
+    _state["flushed"] = time.monotonic()
+    _lock.release()
+
+
+os.register_at_fork(
+    before=_lock.acquire,
+    after_in_parent=_lock.release,
+    after_in_child=_after_fork_in_child,
+)
+
+
+def format_labels(labels):
+    return ",".join(
+        '{}="{}"'.format(
+            key,
+            str(value)
+            .replace("\\", "\\\\")
+            .replace('"', '\\"')
+            .replace("\n", "\\n"),
+        )
+        for key, value in sorted(labels.items())
+    )
+
+
+def inc(name, labels=None, value=1, le=0):
+    """Прибавляет value к счётчику; в файл попадает при сбросе."""
+
+    key = (name, format_labels(labels or {}), le)
+    with _lock:
+        _pending[key] = _pending.get(key, 0) + value
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS):
+    """Добавляет значение в гистограмму с накопительными корзинами."""
+
+    for bound in buckets:
+        if value <= bound:
+            inc(f"{name}_bucket", labels, le=bound)
+    inc(f"{name}_sum", labels, value)
+    inc(f"{name}_count", labels)
+
+
+def flush():
+    """Записывает накопленное одним запросом в общий файл."""
+
+    with _lock:
+        rows = [
+            (name, labels, le, value)
+            for (name, labels, le), value in _pending.items()
+        ]
+        _pending.clear()
+        _state["flushed"] = time.monotonic()
+    if not rows:
+        return
+    connection = _connection()
+    with connection:
+        connection.executemany(
+            "INSERT INTO samples (name, labels, le, value) "
+            "VALUES (?, ?, ?, ?) "
+            "ON CONFLICT (name, labels, le) "
+            "DO UPDATE SET value = value + excluded.value",
+            rows,
+        )
+
+
+def value(name, labels=None, le=0):
+    """Значение ряда, сложенное по всем процессам."""
+
+    flush()
+    row = _connection().execute(
+        "SELECT value FROM samples WHERE name = ? AND labels = ? AND le = ?",
+        (name, format_labels(labels or {}), le),
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def maybe_flush():
+    if (
+        len(_pending) >= FLUSH_MAX_PENDING
+        or time.monotonic() - _state["flushed"] >= FLUSH_INTERVAL
+    ):
+        flush()
+
+
+# Воркер, завершившийся штатно, не теряет счётчики последней секунды.
+atexit.register(flush)
+
+
+def record_request(view, method, status, duration, queries):
+    labels = {"view": view or "", "method": method}
+    inc("yatube_requests_total", dict(labels, status=status))
+    observe("yatube_request_duration_seconds", labels, duration)
+    inc("yatube_db_queries_total", labels, queries)
+    maybe_flush()
+
+
+def describe(name, kind, description):
+    """Тип и описание метрики, которую пишет приложение через inc."""
+
+    FAMILIES[name] = (kind, description)
+
+
+def register_collector(collector):
+    """Добавляет функцию, которая считает метрики в момент чтения.
+
+    collector() возвращает итерируемое из (имя, тип, описание,
+    [(метки, значение), ...]) — так приложения отдают значения,
+    которые дешевле посчитать, чем накапливать.
+    """
+
+    _collectors.append(collector)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _family(name):
+    for suffix in ("_bucket", "_sum", "_count"):
+        base = name[:-len(suffix)]
+        if name.endswith(suffix) and base in FAMILIES:
+            return base
+    return name
+
+
+def _sample(name, labels, value):
+    if labels:
+        return f"{name}{{{labels}}} {_format_value(value)}"
+    return f"{name} {_format_value(value)}"
+
+
+def render():
+    """Все метрики в текстовом формате Prometheus."""
+
+    flush()
+    rows = _connection().execute(
+        "SELECT name, labels, le, value FROM samples"
+    ).fetchall()
+    families = {}
+    for name, labels, le, value in rows:
+        families.setdefault(_family(name), []).append(
+            (name, labels, le, value)
+        )
+    lines = []
+    for family in sorted(families):
+        kind, description = FAMILIES.get(family, (COUNTER, family))
+        lines.append(f"# HELP {family} {description}")
+        lines.append(f"# TYPE {family} {kind}")
+        bucket = f"{family}_bucket"
+        for name, labels, le, value in sorted(
+            families[family],
+            key=lambda row: (row[1], row[0] != bucket, row[0], row[2]),
+        ):
+            if name == bucket:
+                le_label = f'le="{_format_value(le)}"'
+                labels = f"{labels},{le_label}" if labels else le_label
+            lines.append(_sample(name, labels, value))
+    for collector in _collectors:
+        for name, kind, description, samples in collector():
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in samples:
+                lines.append(_sample(name, format_labels(labels), value))
+    return "\n".join(lines) + "\n"
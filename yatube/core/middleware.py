@@ -0,0 +1,277 @@
+import json
+import logging
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured, MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_cache_control, patch_vary_headers
+
+from . import metrics, timing
+
+request_logger = logging.getLogger("yatube.requests")
+slow_logger = logging.getLogger("yatube.slow")
+budget_logger = logging.getLogger("yatube.budget")
+
+PUBLIC = "public"
+PRIVATE = "private"
+
+# Страницы, одинаковые для всех анонимов, можно отдавать из кэша nginx.
+# Всё остальное — ленты подписок, формы и действия — только браузеру
+# пользователя и без сохранения.
+CACHE_POLICIES = {
+    "posts:index": PUBLIC,
+    "posts:group_list": PUBLIC,
+    "posts:profile": PUBLIC,
+    "posts:post_detail": PUBLIC,
+    "posts:post_comments": PUBLIC,
+    "posts:search": PUBLIC,
+    "posts:post_create": PRIVATE,
+    "posts:post_edit": PRIVATE,
+    "posts:add_comment": PRIVATE,
+    "posts:follow_index": PRIVATE,
+    "posts:profile_follow": PRIVATE,
+    "posts:profile_unfollow": PRIVATE,
+    "about:author": PUBLIC,
+    "about:tech": PUBLIC,
+}
+# Сколько запросов к базе может сделать вид анонимному посетителю,
+# сколько бы ни было постов, комментариев и подписок. Авторизованному
+# добавляются AUTHENTICATED_QUERIES на сессию и пользователя. Имя URL
+# задаёт бюджет GET и HEAD, пара (имя URL, метод) — остальных методов.
+# Бюджеты проверяются тестами на 10 и 1000 строк и QueryBudgetMiddleware.
+QUERY_BUDGETS = {
+    "posts:index": 2,
+    "posts:group_list": 3,
+    "posts:profile": 5,
+    "posts:post_detail": 4,
+    "posts:post_comments": 2,
+    "posts:search": 1,
+    "posts:follow_index": 3,
+    "posts:post_create": 1,
+    "posts:post_edit": 3,
+    "posts:profile_follow": 8,
+    "posts:profile_unfollow": 6,
+    ("posts:add_comment", "POST"): 4,
+    # Раскладка по лентам добавляет два запроса на каждую пачку
+    # из TIMELINE_BATCH_SIZE подписчиков; бюджет рассчитан на одну.
+    ("posts:post_create", "POST"): 11,
+    ("posts:post_edit", "POST"): 8,
+}
+AUTHENTICATED_QUERIES = 2
+BUDGET_LOG = "log"
+BUDGET_RAISE = "raise"
+CACHE_MAX_AGE = getattr(settings, "CACHE_POLICY_MAX_AGE", 60)
+CACHE_STALE_WHILE_REVALIDATE = getattr(
+    settings, "CACHE_POLICY_STALE_WHILE_REVALIDATE", 5 * 60
+)
+# Запрос медленнее или с большим числом запросов к базе попадает
+# в журнал медленных запросов вместе с самыми дорогими SQL.
+SLOW_REQUEST_MS = getattr(settings, "SLOW_REQUEST_MS", 500)
+SLOW_REQUEST_QUERIES = getattr(settings, "SLOW_REQUEST_QUERIES", 50)
+SLOW_REQUEST_TOP_SQL = getattr(settings, "SLOW_REQUEST_TOP_SQL", 5)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+def query_budget(view_name, user=None, method="GET"):
+    """Бюджет запросов вида для метода и пользователя или None."""
+
+    key = view_name if method in ("GET", "HEAD") else (view_name, method)
+    budget = QUERY_BUDGETS.get(key)
+    if budget is not None and user is not None and user.is_authenticated:
+        budget += AUTHENTICATED_QUERIES
+    return budget
+
+
+def _is_authenticated(request):
+    # Ответ мог вернуться раньше AuthenticationMiddleware.
+    user = getattr(request, "user", None)
+    return user is not None and user.is_authenticated
+
+
+class CachePolicyMiddleware:
+    """Ставит Cache-Control и Vary по политике, заданной для имени URL.
+
+    Публичную политику получают только удачные GET-ответы анонимам
+    без cookie и без CSRF-токена в разметке; авторизованный пользователь
+    видит свою разметку, поэтому ему такая страница отдаётся как private
+    с обязательной проверкой по ETag. Вид без политики и заголовки,
+    выставленные самим видом (например never_cache), не трогаются,
+    кроме Vary: Cookie.
+
+    В MIDDLEWARE стоит выше SessionMiddleware и CsrfViewMiddleware:
+    ответ доходит до неё уже с их Set-Cookie.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        match = request.resolver_match
+        policy = CACHE_POLICIES.get(match.view_name) if match else None
+        if policy is None:
+            return response
+        patch_vary_headers(response, ("Cookie",))
+        if response.has_header("Cache-Control"):
+            return response
+        if policy == PRIVATE:
+            patch_cache_control(response, private=True, no_store=True)
+        elif (
+            request.method in ("GET", "HEAD")
+            and response.status_code in (200, 304)
+            and not _is_authenticated(request)
+            and not response.cookies
+            and not request.META.get("CSRF_COOKIE_USED")
+        ):
+            patch_cache_control(
+                response,
+                public=True,
+                max_age=CACHE_MAX_AGE,
+                stale_while_revalidate=CACHE_STALE_WHILE_REVALIDATE,
+            )
+        else:
+            patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 1)
+
+
+class ServerTimingMiddleware:
+    """Замеряет запрос: SQL, отрисовку шаблонов, вид и общее время.
+
+    Запросы к базе считаются через connection.execute_wrapper, шаблоны —
+    бэкендом core.timing.TimedDjangoTemplates. Итог уходит в заголовок
+    Server-Timing, строкой JSON в журнал yatube.requests и в метрики
+    core.metrics; медленные запросы дополнительно пишутся в yatube.slow.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_timing = timing.RequestTiming()
+        token = timing.current.set(request_timing)
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(
+                        request_timing.execute_wrapper
+                    ))
+                response = self.get_response(request)
+        finally:
+            timing.current.reset(token)
+        total = time.perf_counter() - request_timing.started
+        self.report(request, response, request_timing, total)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request_timing = timing.current.get()
+        if request_timing is not None:
+            request_timing.view_started = time.perf_counter()
+
+    def report(self, request, response, request_timing, total):
+        view = 0.0
+        if request_timing.view_started is not None:
+            view = time.perf_counter() - request_timing.view_started
+        response["Server-Timing"] = ", ".join([
+            f'db;dur={_ms(request_timing.sql_time)};'
+            f'desc="{request_timing.queries} queries"',
+            f"tpl;dur={_ms(request_timing.template_time)}",
+            f"view;dur={_ms(view)}",
+            f"total;dur={_ms(total)}",
+        ])
+        match = request.resolver_match
+        record = {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "queries": request_timing.queries,
+            "sql_ms": _ms(request_timing.sql_time),
+            "template_ms": _ms(request_timing.template_time),
+            "view_ms": _ms(view),
+            "total_ms": _ms(total),
+        }
+        request_logger.info(json.dumps(record, ensure_ascii=False))
+        metrics.record_request(
+            record["view"],
+            request.method,
+            response.status_code,
+            total,
+            request_timing.queries,
+        )
+        if (
+            _ms(total) >= SLOW_REQUEST_MS
+            or request_timing.queries >= SLOW_REQUEST_QUERIES
+        ):
+            record["top_sql"] = [
+                {"sql": sql, "count": count, "ms": _ms(duration)}
+                for sql, (count, duration) in request_timing.top_statements(
+                    SLOW_REQUEST_TOP_SQL
+                )
+            ]
+            slow_logger.warning(json.dumps(record, ensure_ascii=False))
+
+
+class QueryBudgetMiddleware:
+    """Сообщает о запросах к базе сверх бюджета из QUERY_BUDGETS.
+
+    Работает только при DEBUG, если задан QUERY_BUDGET_MODE: "log" пишет
+    превышение с самыми частыми SQL в журнал yatube.budget, "raise"
+    прерывает запрос исключением QueryBudgetExceeded. Запросы считает
+    ServerTimingMiddleware, поэтому он должен стоять в MIDDLEWARE выше.
+    """
+
+    def __init__(self, get_response):
+        self.mode = getattr(settings, "QUERY_BUDGET_MODE", None)
+        if not settings.DEBUG or not self.mode:
+            raise MiddlewareNotUsed
+        if self.mode not in (BUDGET_LOG, BUDGET_RAISE):
+            raise ImproperlyConfigured(
+                f"QUERY_BUDGET_MODE: ожидается {BUDGET_LOG!r} "
+                f"или {BUDGET_RAISE!r}, получено {self.mode!r}"
+            )
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        request_timing = timing.current.get()
+        match = request.resolver_match
+        if request_timing is None or match is None:
+            return response
+        budget = query_budget(
+            match.view_name, getattr(request, "user", None), request.method
+        )
+        queries = request_timing.data_queries()
+        if budget is None or queries <= budget:
+            return response
+        message = (
+            f"{match.view_name}: {queries} запросов к базе "
+            f"при бюджете {budget}"
+        )
+        if self.mode == BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+        budget_logger.warning(json.dumps({
+            "view": match.view_name,
+            "path": request.path,
+            "queries": queries,
+            "budget": budget,
+            "statements": sorted(
+                (
+                    {"sql": sql, "count": count}
+                    for sql, (count, duration)
+                    in request_timing.statements.items()
+                    if timing.is_data_query(sql)
+                ),
+                key=lambda statement: statement["count"],
+                reverse=True,
+            )[:SLOW_REQUEST_TOP_SQL],
+        }, ensure_ascii=False))
+        return response
@@ -0,0 +1,79 @@
+import gzip
+import io
+import posixpath
+from urllib.parse import unquote, urlsplit
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Что имеет смысл сжимать: картинки и шрифты уже сжаты.
+COMPRESSIBLE_EXTENSIONS = {
+    ".css", ".js", ".map", ".json", ".svg", ".txt", ".html", ".xml", ".ico",
+}
+# Файлы меньше этого размера сжатие только увеличивает.
+MIN_COMPRESS_SIZE = 256
+
+
+def _gzip(data):
+    # mtime=0: одинаковый файл даёт одинаковый архив при каждой сборке.
+    # GzipFile, а не gzip.compress: mtime у compress есть только с 3.8.
+    buffer = io.BytesIO()
+    with gzip.GzipFile(
+        fileobj=buffer, mode="wb", compresslevel=9, mtime=0
+    ) as archive:
+        archive.write(data)
+    return buffer.getvalue()
+
+
+COMPRESSORS = [(".gz", _gzip)]
+if brotli is not None:
+    COMPRESSORS.insert(0, (".br", lambda data: brotli.compress(data)))
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """Статика с хешем содержимого в имени и сжатыми копиями рядом.
+
+    collectstatic кладёт рядом с каждым текстовым файлом file.gz и,
+    если установлен пакет brotli, file.br; core.views.static_file
+    отдаёт подходящую копию. Файл, которого нет в манифесте (например,
+    collectstatic ещё не запускали), получает URL без хеша.
+    """
+
+    manifest_strict = False
+
+    def stored_name(self, name):
+        clean_name = self.clean_name(unquote(urlsplit(name).path).strip())
+        if self.hash_key(clean_name) not in self.hashed_files:
+            return name
+        return super().stored_name(name)
+
+    def post_process(self, *args, **kwargs):
+        yield from super().post_process(*args, **kwargs)
+        if kwargs.get("dry_run"):
+            return
+        names = set(self.hashed_files) | set(self.hashed_files.values())
+        for name in sorted(names):
+            extension = posixpath.splitext(name)[1].lower()
+            if extension in COMPRESSIBLE_EXTENSIONS:
+                self.compress(name)
+
+    def compress(self, name):
+        with self.open(name) as source:
+            data = source.read()
+        if len(data) < MIN_COMPRESS_SIZE:
+            return
+        for suffix, compress in COMPRESSORS:
+            compressed = compress(data)
+            if len(compressed) >= len(data):
+                continue
+            if self.exists(name + suffix):
+                self.delete(name + suffix)
+            self._save(name + suffix, ContentFile(compressed))
+
+    def is_hashed(self, name):
+        return name in set(self.hashed_files.values())
@@ -0,0 +1,148 @@
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import metrics
+from posts.models import Post
+
+User = get_user_model()
+
+
+def _count_in_child(value):
+    metrics.inc('yatube_test_total', {'worker': 'child'}, value)
+    metrics.flush()
+
+
+class MetricsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.metrics_dir = tempfile.mkdtemp()
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.metrics_dir, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # Счётчики предыдущих тестов уходят в свой файл, а тест начинает
+        # с пустого.
+        with override_settings(METRICS_DB_PATH=os.path.join(
+                self.metrics_dir, 'previous.sqlite3')):
+            metrics.flush()
+        settings_override = override_settings(METRICS_DB_PATH=os.path.join(
+            self.metrics_dir, f'{self._testMethodName}.sqlite3'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_requests_are_counted_per_url_name(self):
+        """В /metrics видны запросы, время ответа и запросы к базе."""
+        author = User.objects.create_user(username='metrics_author')
+        Post.objects.create(author=author, text='Пост для метрик')
+        with override_settings(POSTS_PAGE_CACHE_ENABLED=True, CACHES={
+            alias: {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': f'metrics-{alias}',
+            }
+            for alias in ('default', 'pages', 'page_versions')
+        }):
+            for _ in range(2):
+                self.client.get(reverse('posts:index'))
+        response = self.client.get(reverse('metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        body = response.content.decode()
+        self.assertIn('# TYPE yatube_request_duration_seconds histogram', body)
+        self.assertIn(
+            'yatube_requests_total{method="GET",status="200",'
+            'view="posts:index"} 2',
+            body,
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_bucket{method="GET",'
+            'view="posts:index",le="+Inf"} 2',
+            body,
+        )
+        self.assertIn(
+            'yatube_request_duration_seconds_count{method="GET",'
+            'view="posts:index"} 2',
+            body,
+        )
+        self.assertRegex(
+            body,
+            r'yatube_db_queries_total\{method="GET",'
+            r'view="posts:index"\} [1-9]',
+        )
+        self.assertIn(
+            'yatube_page_cache_requests_total{outcome="hit"} 1', body)
+        self.assertIn(
+            'yatube_page_cache_requests_total{outcome="miss"} 1', body)
+        self.assertIn('yatube_thumbnail_queue_depth ', body)
+
+    def test_counters_from_other_processes_are_summed(self):
+        """Счётчики воркеров складываются в общем файле."""
+        metrics.inc('yatube_test_total', {'worker': 'parent'}, 2)
+        child = multiprocessing.get_context('fork').Process(
+            target=_count_in_child, args=(3,))
+        child.start()
+        child.join()
+        self.assertEqual(child.exitcode, 0)
+        metrics.inc('yatube_test_total', {'worker': 'child'}, 1)
+        body = metrics.render()
+        self.assertIn('yatube_test_total{worker="parent"} 2', body)
+        self.assertIn('yatube_test_total{worker="child"} 4', body)
+
+    def test_metrics_are_not_public(self):
+        """Чужому адресу /metrics недоступны, сотруднику — доступны."""
+        url = reverse('metrics')
+        response = self.client.get(url, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 403)
+        response = self.client.get(
+            url, REMOTE_ADDR='203.0.113.7', HTTP_X_FORWARDED_FOR='127.0.0.1')
+        self.assertEqual(response.status_code, 403)
+        self.client.force_login(
+            User.objects.create_user(username='metrics_staff', is_staff=True))
+        response = self.client.get(url, REMOTE_ADDR='203.0.113.7')
+        self.assertEqual(response.status_code, 200)
+
+    def test_many_pending_rows_are_flushed_early(self):
+        """Накопив FLUSH_MAX_PENDING рядов, процесс сбрасывает их сразу."""
+        with mock.patch.object(metrics, 'FLUSH_MAX_PENDING', 3), \
+                mock.patch.object(metrics, 'FLUSH_INTERVAL', 3600):
+            metrics.flush()
+            metrics.inc('yatube_test_total', {'row': 1})
+            metrics.maybe_flush()
+            self.assertTrue(metrics._pending)
+            metrics.inc('yatube_test_total', {'row': 2})
+            metrics.inc('yatube_test_total', {'row': 3})
+            metrics.maybe_flush()
+            self.assertFalse(metrics._pending)
+
+    def test_counters_are_flushed_at_exit(self):
+        """Воркер, завершившийся раньше срока сброса, счётчики не теряет."""
+        script = (
+            'import django, sys\n'
+            'from django.conf import settings\n'
+            'django.setup()\n'
+            'settings.METRICS_DB_PATH = sys.argv[1]\n'
+            'from core import metrics\n'
+            'metrics.FLUSH_INTERVAL = 3600\n'
+            'metrics.inc("yatube_test_total", {"worker": "exited"}, 5)\n'
+        )
+        subprocess.run(
+            [sys.executable, '-c', script, settings.METRICS_DB_PATH],
+            cwd=settings.BASE_DIR,
+            env=dict(os.environ, DJANGO_SETTINGS_MODULE='yatube.settings'),
+            check=True,
+        )
+        self.assertIn(
+            'yatube_test_total{worker="exited"} 5', metrics.render())
@@ -0,0 +1,142 @@
+import json
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+
+from core import timing
+from core.middleware import QueryBudgetExceeded, query_budget
+from posts.management.commands.bench_views import Command as BenchCommand
+from posts.models import Post
+
+User = get_user_model()
+
+
+class ServerTimingTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='timing_author')
+        Post.objects.create(author=cls.author, text='Пост для замеров')
+        cls.url = reverse(
+            'posts:profile', kwargs={'username': cls.author.username})
+
+    def test_server_timing_header_and_log_line(self):
+        """Заголовок и строка журнала совпадают с реальными запросами."""
+        with CaptureQueriesContext(connection) as queries:
+            with self.assertLogs('yatube.requests', 'INFO') as logs:
+                response = self.client.get(self.url)
+        timing = response['Server-Timing']
+        self.assertRegex(
+            timing,
+            rf'^db;dur=[\d.]+;desc="{len(queries)} queries", '
+            r'tpl;dur=[\d.]+, view;dur=[\d.]+, total;dur=[\d.]+$',
+        )
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['view'], 'posts:profile')
+        self.assertEqual(record['status'], 200)
+        self.assertEqual(record['queries'], len(queries))
+        self.assertGreater(record['template_ms'], 0)
+        self.assertGreaterEqual(record['total_ms'], record['view_ms'])
+
+    def test_slow_request_logs_top_sql(self):
+        """Запрос сверх порога попадает в журнал с самыми дорогими SQL."""
+        with mock.patch('core.middleware.SLOW_REQUEST_QUERIES', 1), \
+                self.assertLogs('yatube.slow', 'WARNING') as logs:
+            self.client.get(self.url)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertTrue(record['top_sql'])
+        self.assertLessEqual(len(record['top_sql']), 5)
+        self.assertTrue(any(
+            'posts_post' in statement['sql']
+            for statement in record['top_sql']
+        ))
+
+    def test_fast_request_is_not_slow(self):
+        """Обычный запрос в журнал медленных не пишется."""
+        with mock.patch('core.middleware.slow_logger') as slow_logger:
+            self.client.get(self.url)
+        slow_logger.warning.assert_not_called()
+
+
+class QueryBudgetTests(TestCase):
+    def count_queries(self, size):
+        """Запросы к базе каждого сценария bench_views при size постов."""
+        counts = {}
+        with transaction.atomic():
+            call_command(
+                'seed', users=max(size // 10, 20), groups=3, posts=size,
+                comments=size, follows=2, stdout=StringIO(),
+            )
+            bench = BenchCommand(stdout=StringIO())
+            for scenario in bench.scenarios():
+                client = Client()
+                if scenario.user is not None:
+                    client.force_login(scenario.user)
+                bench.request(client, scenario)
+                with CaptureQueriesContext(connection) as queries:
+                    bench.request(client, scenario)
+                view_name = resolve(scenario.url.split('?')[0]).view_name
+                counts[scenario.name] = (
+                    sum(timing.is_data_query(query['sql'])
+                        for query in queries),
+                    query_budget(
+                        view_name, scenario.user, scenario.method.upper()),
+                )
+            transaction.set_rollback(True)
+        return counts
+
+    def test_query_counts_fit_budgets_and_do_not_grow(self):
+        """Число запросов в бюджете и одинаково на 10 и 1000 строк."""
+        small = self.count_queries(10)
+        large = self.count_queries(1000)
+        self.assertEqual(small.keys(), large.keys())
+        for name, (count, budget) in small.items():
+            with self.subTest(scenario=name):
+                self.assertEqual(count, large[name][0])
+                self.assertLessEqual(count, budget)
+
+    def test_budget_middleware_raises_or_logs(self):
+        """В DEBUG превышение бюджета видно сразу."""
+        Post.objects.create(
+            author=User.objects.create_user(username='budget_author'),
+            text='Пост')
+        url = reverse('posts:index')
+        with mock.patch.dict('core.middleware.QUERY_BUDGETS',
+                             {'posts:index': 0}):
+            with override_settings(DEBUG=True, QUERY_BUDGET_MODE='raise'):
+                with self.assertRaisesRegex(
+                        QueryBudgetExceeded, 'posts:index: 2 запросов'), \
+                        self.assertLogs('django.request', 'ERROR'):
+                    Client().get(url)
+            with override_settings(DEBUG=True, QUERY_BUDGET_MODE='log'), \
+                    self.assertLogs('yatube.budget', 'WARNING') as logs:
+                Client().get(url)
+            with override_settings(QUERY_BUDGET_MODE='raise'):
+                self.assertEqual(Client().get(url).status_code, 200)
+        record = json.loads(logs.records[-1].getMessage())
+        self.assertEqual(record['budget'], 0)
+        self.assertEqual(record['queries'], 2)
+        self.assertTrue(record['statements'])
+
+    def test_form_submit_has_its_own_budget(self):
+        """Отправка формы сверяется с бюджетом POST, а не формы GET."""
+        author = User.objects.create_user(username='budget_writer')
+        client = Client()
+        client.force_login(author)
+        post = Post.objects.create(author=author, text='Пост')
+        with override_settings(DEBUG=True, QUERY_BUDGET_MODE='raise'):
+            response = client.post(
+                reverse('posts:post_create'), {'text': 'Новый пост'})
+            self.assertEqual(response.status_code, 302)
+            response = client.post(
+                reverse('posts:post_edit', args=[post.pk]), {'text': 'Правка'})
+            self.assertEqual(response.status_code, 302)
+        self.assertEqual(query_budget('posts:post_create', author), 3)
+        self.assertEqual(
+            query_budget('posts:post_create', author, 'POST'), 13)
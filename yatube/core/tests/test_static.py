@@ -0,0 +1,95 @@
+import gzip
+import os
+import shutil
+import tempfile
+
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.management import call_command
+from django.test import Client, TestCase, override_settings
+
+
+class StaticFilesTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.source = tempfile.mkdtemp()
+        cls.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(cls.source, 'css'))
+        os.makedirs(os.path.join(cls.source, 'img'))
+        with open(os.path.join(cls.source, 'img', 'logo.png'), 'wb') as f:
+            f.write(b'\x89PNG' + bytes(range(256)))
+        cls.css = (
+            ".logo { background: url('../img/logo.png'); }\n"
+            + '.card { margin: 0 auto; padding: 1rem; }\n' * 20
+        ).encode()
+        with open(os.path.join(cls.source, 'css', 'site.css'), 'wb') as f:
+            f.write(cls.css)
+        cls.settings = override_settings(
+            STATIC_ROOT=cls.root, STATICFILES_DIRS=[cls.source]
+        )
+        cls.settings.enable()
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.settings.disable()
+        shutil.rmtree(cls.source, ignore_errors=True)
+        shutil.rmtree(cls.root, ignore_errors=True)
+        super().tearDownClass()
+
+    def test_names_are_hashed_and_compressed(self):
+        """collectstatic кладёт файл с хешем и его сжатую копию."""
+        hashed = staticfiles_storage.stored_name('css/site.css')
+        self.assertRegex(hashed, r'^css/site\.[0-9a-f]{12}\.css$')
+        with staticfiles_storage.open(hashed) as f:
+            content = f.read()
+        self.assertIn(
+            staticfiles_storage.stored_name('img/logo.png').encode(), content
+        )
+        with staticfiles_storage.open(hashed + '.gz') as f:
+            self.assertEqual(gzip.decompress(f.read()), content)
+        self.assertFalse(
+            staticfiles_storage.exists(
+                staticfiles_storage.stored_name('img/logo.png') + '.gz'
+            )
+        )
+
+    def test_unknown_file_keeps_its_name(self):
+        """Файла нет в манифесте — URL без хеша, а не ошибка."""
+        self.assertEqual(
+            staticfiles_storage.url('css/missing.css'),
+            '/static/css/missing.css',
+        )
+
+    def test_hashed_file_is_immutable_and_precompressed(self):
+        """Файл с хешем кэшируется на год, сжатая копия по Accept-Encoding."""
+        url = staticfiles_storage.url('css/site.css')
+        response = Client().get(url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(
+            response['Cache-Control'], 'public, max-age=31536000, immutable'
+        )
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['Content-Type'], 'text/css')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        body = b''.join(response.streaming_content)
+        self.assertIn(b'.card', gzip.decompress(body))
+
+        plain = Client().get(url)
+        self.assertNotIn('Content-Encoding', plain)
+        not_modified = Client().get(
+            url, HTTP_IF_MODIFIED_SINCE=plain['Last-Modified']
+        )
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(
+            not_modified['Cache-Control'], response['Cache-Control']
+        )
+        self.assertIn('Accept-Encoding', not_modified['Vary'])
+
+    def test_unhashed_and_missing_files(self):
+        """Исходное имя кэшируется ненадолго, неизвестное — 404."""
+        response = Client().get('/static/css/site.css')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('immutable', response['Cache-Control'])
+        self.assertEqual(
+            Client().get('/static/css/missing.css').status_code, 404
+        )
@@ -0,0 +1,89 @@
+import time
+from contextvars import ContextVar
+
+from django.template.backends.django import DjangoTemplates, Template, reraise
+from django.template import TemplateDoesNotExist
+
+# Замеры запроса, который сейчас обрабатывается; None вне запроса.
+current = ContextVar("request_timing", default=None)
+# Управление вложенными транзакциями: их число зависит от того, есть ли
+# снаружи atomic (в тестах есть), а не от кода вида.
+TRANSACTION_STATEMENTS = (
+    "SAVEPOINT ", "RELEASE SAVEPOINT ", "ROLLBACK TO SAVEPOINT ",
+)
+
+
+def is_data_query(sql):
+    return not sql.startswith(TRANSACTION_STATEMENTS)
+
+
+class RequestTiming:
+    """Время и запросы к базе, накопленные за один HTTP-запрос."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_started = None
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        # SQL без параметров → [количество, суммарное время].
+        self.statements = {}
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.queries += 1
+            self.sql_time += duration
+            statement = self.statements.setdefault(sql, [0, 0.0])
+            statement[0] += 1
+            statement[1] += duration
+
+    def data_queries(self):
+        """Запросы без SAVEPOINT и RELEASE — то, что считает бюджет."""
+
+        return sum(
+            count
+            for sql, (count, duration) in self.statements.items()
+            if is_data_query(sql)
+        )
+
+    def top_statements(self, limit):
+        """Самые дорогие по суммарному времени SQL-запросы."""
+
+        return sorted(
+            self.statements.items(),
+            key=lambda item: item[1][1],
+            reverse=True,
+        )[:limit]
+
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timing = current.get()
+        if timing is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """Шаблоны Django, которые записывают время отрисовки в замеры.
+
+    Время считается только для шаблона верхнего уровня: вложенные
+    include отрисовываются внутри него и дважды не учитываются.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -1,4 +1,27 @@
+import mimetypes
+import os
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import PermissionDenied
+from django.http import (
+    FileResponse,
+    Http404,
+    HttpResponse,
+    HttpResponseNotModified,
+)
 from django.shortcuts import render
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.decorators.cache import never_cache
+from django.views.static import was_modified_since
+
+from . import metrics
+
+# Имя с хешем содержимого не меняется никогда: год и immutable.
+STATIC_IMMUTABLE = "public, max-age=31536000, immutable"
+STATIC_DEFAULT = "public, max-age=3600"
+STATIC_ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
 
 
 def page_not_found(request, exception):
@@ -15,3 +38,69 @@ def permission_denied(request, exception):
 
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
+
+
+def static_file(request, path):
+    """Файл из STATIC_ROOT, по возможности заранее сжатая копия.
+
+    Копии .br и .gz готовит collectstatic (core.storage); какую отдать,
+    решает Accept-Encoding. Файлы с хешем в имени кэшируются на год.
+    """
+
+    storage = staticfiles_storage
+    if not path or not storage.exists(path):
+        raise Http404
+    accepted = {
+        part.split(";")[0].strip()
+        for part in request.META.get("HTTP_ACCEPT_ENCODING", "").split(",")
+    }
+    served, encoding = path, None
+    for candidate, suffix in STATIC_ENCODINGS:
+        if candidate in accepted and storage.exists(path + suffix):
+            served, encoding = path + suffix, candidate
+            break
+    stat = os.stat(storage.path(served))
+    if not was_modified_since(
+        request.META.get("HTTP_IF_MODIFIED_SINCE"),
+        stat.st_mtime,
+        stat.st_size,
+    ):
+        # 304 повторяет заголовки кэширования полного ответа, иначе
+        # браузер и прокси сбросят для файла срок хранения.
+        return _static_cache_headers(HttpResponseNotModified(), storage, path)
+    content_type, _ = mimetypes.guess_type(path)
+    response = FileResponse(
+        storage.open(served),
+        content_type=content_type or "application/octet-stream",
+    )
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    if encoding:
+        response["Content-Encoding"] = encoding
+    return _static_cache_headers(response, storage, path)
+
+
+def _static_cache_headers(response, storage, path):
+    patch_vary_headers(response, ("Accept-Encoding",))
+    is_hashed = getattr(storage, "is_hashed", None)
+    if is_hashed is not None and is_hashed(path):
+        response["Cache-Control"] = STATIC_IMMUTABLE
+    else:
+        response["Cache-Control"] = STATIC_DEFAULT
+    return response
+
+
+@never_cache
+def metrics_view(request):
+    """Метрики всех процессов сервера в формате Prometheus.
+
+    Доступны адресам из METRICS_ALLOWED_IPS и сотрудникам. Адрес берётся
+    из REMOTE_ADDR, а не из X-Forwarded-For, который задаёт клиент.
+    """
+
+    allowed = request.META.get("REMOTE_ADDR") in settings.METRICS_ALLOWED_IPS
+    if not allowed and not request.user.is_staff:
+        raise PermissionDenied
+    return HttpResponse(
+        metrics.render(),
+        content_type="text/plain; version=0.0.4; charset=utf-8",
+    )
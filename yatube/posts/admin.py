@@ -1,32 +1,59 @@
 from django.contrib import admin
 
+from . import search
 from .models import Group, Post, Comment, Follow
+from .utils import EstimatedCountPaginator
 
 
-class PostAdmin(admin.ModelAdmin):
+class ScalableAdmin(admin.ModelAdmin):
+    """Список без точного подсчёта строк во всей таблице."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class PostAdmin(ScalableAdmin):
     list_display = ('pk', 'text', 'pub_date', 'author', 'group')
+    list_select_related = ('author', 'group')
+    autocomplete_fields = ('author', 'group')
     search_fields = ('text',)
     list_filter = ('pub_date',)
     list_editable = ('group',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        """Ищет по индексу FTS5 вместо LIKE по всей таблице постов."""
+
+        if not search.is_enabled() or not search_term.strip():
+            return super().get_search_results(
+                request, queryset, search_term
+            )
+        query = search.match_query(search_term)
+        if not query:
+            return queryset.none(), False
+        return queryset.filter(search__text__match=query), False
+
 
-class GroupAdmin(admin.ModelAdmin):
-    list_display = ("pk", "title", "slug", "description")
+class GroupAdmin(ScalableAdmin):
+    list_display = ("pk", "title", "slug", "description", "posts_count")
     search_fields = ("title",)
-    list_filter = ("title",)
     empty_value_display = "-пусто-"
 
 
-class CommentAdmin(admin.ModelAdmin):
+class CommentAdmin(ScalableAdmin):
     list_display = ("text", "created", "author", "post")
-    search_fields = ("author",)
+    list_select_related = ("author", "post")
+    autocomplete_fields = ("author",)
+    raw_id_fields = ("post",)
+    search_fields = ("author__username",)
     list_filter = ("created",)
 
 
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(ScalableAdmin):
     list_display = ("user", "author",)
-    list_filter = ("author",)
+    list_select_related = ("user", "author")
+    autocomplete_fields = ("user", "author")
+    search_fields = ("^user__username", "^author__username")
 
 
 admin.site.register(Post, PostAdmin)
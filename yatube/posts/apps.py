@@ -3,3 +3,10 @@ from django.apps import AppConfig
 
 class PostsConfig(AppConfig):
     name = "posts"
+
+    def ready(self):
+        from core import metrics as core_metrics
+
+        from . import metrics, signals  # noqa: F401
+
+        core_metrics.register_collector(metrics.collect)
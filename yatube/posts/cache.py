@@ -0,0 +1,267 @@
+import time
+from datetime import datetime, timezone
+from functools import wraps
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.views.decorators.http import condition
+
+from core import metrics
+
+from .models import Group, Post, User
+
+FEED_SCOPE = "feed"
+STATS_METRIC = "yatube_page_cache_requests_total"
+STATS_OUTCOMES = ("hit", "miss")
+
+
+def page_cache():
+    return caches[settings.POSTS_PAGE_CACHE_ALIAS]
+
+
+def version_cache():
+    """Кэш версий областей.
+
+    Он отделён от страниц, чтобы вытеснение страниц не сбрасывало версии.
+    """
+
+    return caches[settings.POSTS_VERSION_CACHE_ALIAS]
+
+
+def group_scope(group_id):
+    return f"group:{group_id}"
+
+
+def author_scope(author_id):
+    return f"author:{author_id}"
+
+
+def post_scope(post_id):
+    return f"post:{post_id}"
+
+
+def follow_scope(user_id):
+    """Подписки пользователя: кнопки «подписаться» и лента подписок."""
+
+    return f"follow:{user_id}"
+
+
+def _version_key(scope):
+    return f"posts:version:{scope}"
+
+
+def get_versions(scopes):
+    """Текущие версии областей кэша.
+
+    Версия — время последнего изменения в наносекундах. Если ключ
+    вытеснен из кэша, версия создаётся заново текущим временем, поэтому
+    после вытеснения старые страницы никогда не отдаются.
+    """
+
+    cache = version_cache()
+    keys = [_version_key(scope) for scope in scopes]
+    versions = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return [versions[key] for key in keys]
+
+
+def _set_versions(scopes):
+    now = time.time_ns()
+    version_cache().set_many(
+        {_version_key(scope): now for scope in scopes}, None
+    )
+
+
+def bump_versions(*scopes):
+    """Помечает области изменёнными: их страницы перестают совпадать.
+
+    Версия меняется сразу и ещё раз после коммита: иначе запрос,
+    прочитавший старые данные до коммита, мог бы сохранить страницу
+    под новой версией.
+    """
+
+    _set_versions(scopes)
+    transaction.on_commit(lambda: _set_versions(scopes))
+
+
+def bump_post_scopes(post_id, author_id, *group_ids):
+    """Помечает изменёнными все страницы, на которых виден пост."""
+
+    bump_versions(
+        FEED_SCOPE,
+        post_scope(post_id),
+        author_scope(author_id),
+        *(group_scope(group_id) for group_id in group_ids if group_id),
+    )
+
+
+def _record(outcome):
+    # Счётчик копится в процессе и сбрасывается в core.metrics пачкой:
+    # запись в файловый кэш на каждое попадание перечисляла бы весь
+    # его каталог.
+    metrics.inc(STATS_METRIC, {"outcome": outcome})
+
+
+def stats():
+    """Количество попаданий и промахов кэша страниц по всем процессам."""
+
+    return {
+        outcome: int(metrics.value(STATS_METRIC, {"outcome": outcome}))
+        for outcome in STATS_OUTCOMES
+    }
+
+
+def _page_key(request, scopes):
+    versions = ".".join(str(version) for version in get_versions(scopes))
+    path = md5(request.get_full_path().encode()).hexdigest()
+    return f"posts:page:{request.resolver_match.view_name}:{path}:{versions}"
+
+
+def index_scopes(request):
+    return [FEED_SCOPE]
+
+
+def group_scopes(request, slug):
+    group_id = (
+        Group.objects.filter(slug=slug).values_list("pk", flat=True).first()
+    )
+    if group_id is None:
+        return None
+    return [group_scope(group_id)]
+
+
+def profile_scopes(request, username):
+    author_id = (
+        User.objects.filter(username=username)
+        .values_list("pk", flat=True)
+        .first()
+    )
+    if author_id is None:
+        return None
+    scopes = [author_scope(author_id)]
+    if request.user.is_authenticated:
+        scopes.append(follow_scope(request.user.pk))
+    return scopes
+
+
+def post_scopes(request, post_id):
+    post = (
+        Post.objects.filter(pk=post_id)
+        .values_list("author_id", "group_id")
+        .first()
+    )
+    if post is None:
+        return None
+    author_id, group_id = post
+    scopes = [post_scope(post_id), author_scope(author_id)]
+    if group_id:
+        scopes.append(group_scope(group_id))
+    return scopes
+
+
+def follow_scopes(request):
+    # Новые посты авторов меняют общую версию ленты, подписки —
+    # версию пользователя.
+    return [FEED_SCOPE, follow_scope(request.user.pk)]
+
+
+def _page_scopes(request, scopes, args, kwargs):
+    """Области страницы; считаются один раз на запрос."""
+
+    if not hasattr(request, "_page_scopes"):
+        request._page_scopes = scopes(request, *args, **kwargs)
+    return request._page_scopes
+
+
+def _page_versions(request, scopes, args, kwargs):
+    if not hasattr(request, "_page_versions"):
+        page_scopes = _page_scopes(request, scopes, args, kwargs)
+        request._page_versions = (
+            None if page_scopes is None else get_versions(page_scopes)
+        )
+    return request._page_versions
+
+
+def cache_anonymous_page(scopes):
+    """Кэширует готовый ответ для анонимных пользователей.
+
+    scopes(request, *args, **kwargs) возвращает области, от которых
+    зависит страница; их версии входят в ключ, поэтому изменение поста
+    сразу делает старую страницу недостижимой. None отключает кэш для
+    запроса, например если группы не существует.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if (
+                not settings.POSTS_PAGE_CACHE_ENABLED
+                or request.method not in ("GET", "HEAD")
+                or request.user.is_authenticated
+            ):
+                return view(request, *args, **kwargs)
+            page_scopes = _page_scopes(request, scopes, args, kwargs)
+            if page_scopes is None:
+                return view(request, *args, **kwargs)
+
+            cache = page_cache()
+            key = _page_key(request, page_scopes)
+            response = cache.get(key)
+            if response is not None:
+                _record("hit")
+                response["X-Page-Cache"] = "HIT"
+                return response
+
+            _record("miss")
+            response = view(request, *args, **kwargs)
+            if (
+                response.status_code == 200
+                and not response.streaming
+                and not response.cookies
+                and not request.META.get("CSRF_COOKIE_USED")
+            ):
+                cache.set(key, response, settings.POSTS_PAGE_CACHE_TIMEOUT)
+            response["X-Page-Cache"] = "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def conditional_page(scopes):
+    """Отвечает 304 на If-None-Match и If-Modified-Since.
+
+    Валидаторы строятся по версиям областей кэша, а не по данным
+    страницы: совпадение проверяется до запросов страницы и шаблона.
+    В ETag входят адрес, пользователь и CSRF-cookie, потому что от них
+    зависит разметка; Last-Modified — время последнего изменения
+    областей. Если scopes вернула None, валидаторов нет.
+    """
+
+    def etag(request, *args, **kwargs):
+        versions = _page_versions(request, scopes, args, kwargs)
+        if versions is None:
+            return None
+        user_id = request.user.pk if request.user.is_authenticated else 0
+        parts = [
+            request.resolver_match.view_name,
+            request.get_full_path(),
+            str(user_id),
+            request.COOKIES.get(settings.CSRF_COOKIE_NAME, ""),
+            *(str(version) for version in versions),
+        ]
+        return md5("|".join(parts).encode()).hexdigest()
+
+    def last_modified(request, *args, **kwargs):
+        versions = _page_versions(request, scopes, args, kwargs)
+        if versions is None:
+            return None
+        return datetime.fromtimestamp(max(versions) / 1e9, timezone.utc)
+
+    return condition(etag_func=etag, last_modified_func=last_modified)
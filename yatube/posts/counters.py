@@ -0,0 +1,100 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .models import Comment, Follow, Group, Post, User, UserStats
+
+# (модель со счётчиком, поле счётчика, исходная модель, поле связи)
+COUNTERS = (
+    (UserStats, "posts_count", Post, "author"),
+    (UserStats, "followers_count", Follow, "author"),
+    (UserStats, "following_count", Follow, "user"),
+    (Group, "posts_count", Post, "group"),
+    (Post, "comments_count", Comment, "post"),
+)
+
+
+def change_counter(queryset, field, delta):
+    """Меняет счётчик одним UPDATE, не опуская его ниже нуля."""
+
+    if delta < 0:
+        queryset = queryset.filter(**{f"{field}__gte": -delta})
+    return queryset.update(**{field: F(field) + delta})
+
+
+def change_user_counter(user_id, field, delta):
+    """Меняет счётчик пользователя.
+
+    Если строки со счётчиками ещё нет, она создаётся с точными
+    значениями. При уменьшении строка не создаётся: пользователь
+    может удаляться каскадом вместе со своими счётчиками.
+    """
+
+    queryset = UserStats.objects.filter(user_id=user_id)
+    if change_counter(queryset, field, delta) or delta < 0:
+        return
+    UserStats.objects.get_or_create(
+        user_id=user_id, defaults=UserStats.counts_for(user_id)
+    )
+
+
+def actual_count(source, fk):
+    """Подзапрос с реальным числом строк source для внешней записи."""
+
+    return Coalesce(
+        Subquery(
+            source.objects.filter(**{fk: OuterRef("pk")})
+            .order_by()
+            .values(fk)
+            .annotate(total=Count("pk"))
+            .values("total"),
+            output_field=IntegerField(),
+        ),
+        0,
+    )
+
+
+def create_missing_user_stats(batch_size):
+    """Создаёт пустые строки счётчиков для пользователей без них."""
+
+    created = 0
+    while True:
+        user_ids = list(
+            User.objects.filter(stats__isnull=True)
+            .order_by("pk")
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        if not user_ids:
+            return created
+        UserStats.objects.bulk_create(
+            [UserStats(user_id=user_id) for user_id in user_ids],
+            ignore_conflicts=True,
+        )
+        created += len(user_ids)
+
+
+def reconcile_counter(model, field, source, fk, batch_size):
+    """Сверяет счётчик с исходной таблицей пачками по первичному ключу.
+
+    Возвращает количество исправленных записей. Исправление делается
+    UPDATE с подзапросом, поэтому параллельные изменения не теряются.
+    """
+
+    fixed = 0
+    last_pk = None
+    while True:
+        batch = model.objects.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        rows = list(
+            batch.annotate(actual=actual_count(source, fk))
+            .values_list("pk", field, "actual")[:batch_size]
+        )
+        if not rows:
+            return fixed
+        last_pk = rows[-1][0]
+        drifted = [pk for pk, stored, actual in rows if stored != actual]
+        if drifted:
+            model.objects.filter(pk__in=drifted).update(
+                **{field: actual_count(source, fk)}
+            )
+            fixed += len(drifted)
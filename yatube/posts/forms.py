@@ -1,6 +1,8 @@
 from django import forms
+from django.core.files.uploadedfile import UploadedFile
 
 from .models import Comment, Post
+from . import uploads
 
 
 class PostForm(forms.ModelForm):
@@ -10,6 +12,27 @@ class PostForm(forms.ModelForm):
         model = Post
         fields = ('group', 'text', 'image')
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Файл сверх лимита обработчик загрузки не дочитал:
+        # его не отдаём полю на декодирование, а сразу сообщаем ошибку.
+        self.oversized = {
+            name: upload for name, upload in self.files.items()
+            if upload.size > uploads.MAX_UPLOAD_SIZE
+        }
+        if self.oversized:
+            self.files = self.files.copy()
+            for name in self.oversized:
+                del self.files[name]
+
+    def clean_image(self):
+        if 'image' in self.oversized:
+            uploads.check_size(self.oversized['image'])
+        image = self.cleaned_data.get('image')
+        if isinstance(image, UploadedFile):
+            return uploads.process_image(image)
+        return image
+
 
 class CommentForm(forms.ModelForm):
     class Meta:
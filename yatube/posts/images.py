@@ -0,0 +1,134 @@
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from sorl.thumbnail.images import deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix
+from sorl.thumbnail.models import KVStore
+
+from core import metrics
+
+from .models import PostImageVariant, StoredFile
+from .thumbnails import THUMBNAIL_PRESETS, backend
+from .variants import VariantSet
+
+# Сколько готовых картинок помнит каждый процесс.
+IMAGE_CACHE_SIZE = getattr(settings, "POSTS_IMAGE_CACHE_SIZE", 1024)
+IMAGE_PRESET = "card"
+
+
+class PostImage:
+    """Готовые к выводу версии картинки поста.
+
+    meta — StoredFile с размерами, основным цветом и заглушкой, если
+    воркер уже их посчитал.
+    """
+
+    def __init__(self, variants=(), thumbnail=None, meta=None):
+        self.variants = VariantSet(variants)
+        self.thumbnail = thumbnail
+        self.meta = meta
+
+    def __bool__(self):
+        return bool(self.variants) or self.thumbnail is not None
+
+
+EMPTY = PostImage()
+
+
+class LRUCache:
+    """Ограниченный по размеру словарь, вытесняющий давно не читанное."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.data)
+
+    def get_many(self, keys):
+        found = {}
+        with self.lock:
+            for key in keys:
+                if key in self.data:
+                    self.data.move_to_end(key)
+                    found[key] = self.data[key]
+        return found
+
+    def set(self, key, value):
+        with self.lock:
+            self.data[key] = value
+            self.data.move_to_end(key)
+            while len(self.data) > self.maxsize:
+                self.data.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.data.clear()
+
+
+cache = LRUCache(IMAGE_CACHE_SIZE)
+
+
+def _load_metadata(names):
+    return {
+        stored.name: stored
+        for stored in StoredFile.objects.filter(name__in=names)
+        .exclude(placeholder="")
+        .only("name", "width", "height", "dominant_color", "placeholder")
+    }
+
+
+def _load_variants(names):
+    variants = {}
+    for variant in PostImageVariant.objects.filter(image__in=names):
+        variants.setdefault(variant.image, []).append(variant)
+    return {
+        name: PostImage(variants=found) for name, found in variants.items()
+    }
+
+
+def _load_thumbnails(names):
+    """Миниатюры из таблицы KV-хранилища sorl одним запросом."""
+
+    geometry, options = THUMBNAIL_PRESETS[IMAGE_PRESET]
+    keys = {
+        add_prefix(backend.thumbnail_file(name, geometry, options)[0].key):
+        name
+        for name in names
+    }
+    return {
+        keys[key]: PostImage(thumbnail=deserialize_image_file(value))
+        for key, value in KVStore.objects.filter(
+            key__in=keys
+        ).values_list("key", "value")
+    }
+
+
+def resolve(images):
+    """Готовые версии картинок: словарь {имя файла: PostImage}.
+
+    Готовые картинки берутся из LRU процесса. Для остальных одним
+    запросом читаются описания из StoredFile и одним — варианты, а для
+    картинок без вариантов ещё одним запросом миниатюры из KV-хранилища
+    sorl. Картинки, которые ещё не готовы, в кэш не попадают, чтобы
+    заглушка сменилась картинкой сразу после воркера.
+    """
+
+    names = {image.name for image in images if image}
+    resolved = cache.get_many(names)
+    missing = names - resolved.keys()
+    metrics.inc("yatube_image_cache_total", {"outcome": "hit"}, len(resolved))
+    metrics.inc("yatube_image_cache_total", {"outcome": "miss"}, len(missing))
+    if missing:
+        metadata = _load_metadata(missing)
+        found = _load_variants(missing)
+        found.update(_load_thumbnails(missing - found.keys()))
+        for name, image in found.items():
+            image.meta = metadata.get(name)
+            cache.set(name, image)
+        resolved.update(found)
+        for name in metadata.keys() - found.keys():
+            resolved[name] = PostImage(meta=metadata[name])
+    return resolved
@@ -0,0 +1,168 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from posts.management.commands.seed import power_law_index
+from posts.models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 5000
+HOT_INDEXES = {
+    Post: ("post_author_pub_date_idx", "post_group_pub_date_idx"),
+    Comment: ("comment_post_created_idx",),
+    Follow: ("follow_author_user_idx",),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу во временной транзакции и сравнивает планы "
+        "и время горячих запросов без составных индексов и с ними. "
+        "Все изменения откатываются."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=2000)
+        parser.add_argument("--groups", type=int, default=50)
+        parser.add_argument("--posts", type=int, default=200000)
+        parser.add_argument("--comments", type=int, default=200000)
+        parser.add_argument("--follows", type=int, default=50000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        with transaction.atomic():
+            self.seed(options)
+            samples = self.pick_samples()
+            self.drop_indexes()
+            before = self.measure(samples, options)
+            self.create_indexes()
+            after = self.measure(samples, options)
+            self.report(before, after)
+            transaction.set_rollback(True)
+
+    def bulk_insert(self, model, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == BATCH_SIZE:
+                model.objects.bulk_create(batch)
+                batch = []
+        model.objects.bulk_create(batch)
+
+    def pick(self, ids):
+        return ids[power_law_index(self.random, len(ids))]
+
+    def seed(self, options):
+        started = time.perf_counter()
+        # Ключи назначает база: явные id не сдвигают последовательности
+        # PostgreSQL. Созданные строки находятся по префиксу запуска.
+        prefix = f"bench-{time.time_ns()}"
+        self.bulk_insert(User, (
+            User(username=f"{prefix}-{i}") for i in range(options["users"])
+        ))
+        user_ids = list(User.objects.filter(
+            username__startswith=f"{prefix}-"
+        ).order_by("pk").values_list("pk", flat=True))
+        self.bulk_insert(Group, (
+            Group(title=f"Группа {i}", slug=f"{prefix}-{i}", description="")
+            for i in range(options["groups"])
+        ))
+        group_ids = list(Group.objects.filter(
+            slug__startswith=f"{prefix}-"
+        ).order_by("pk").values_list("pk", flat=True))
+        self.bulk_insert(Post, (
+            Post(text=f"Пост {i}", author_id=self.pick(user_ids),
+                 group_id=self.pick(group_ids))
+            for i in range(options["posts"])
+        ))
+        post_ids = list(Post.objects.filter(
+            author__username__startswith=f"{prefix}-"
+        ).order_by("-pk").values_list("pk", flat=True))
+        self.bulk_insert(Comment, (
+            Comment(text=f"Комментарий {i}", post_id=self.pick(post_ids),
+                    author_id=self.random.choice(user_ids))
+            for i in range(options["comments"])
+        ))
+        pairs = {
+            (self.random.choice(user_ids), self.pick(user_ids))
+            for _ in range(options["follows"])
+        }
+        self.bulk_insert(Follow, (
+            Follow(user_id=user_id, author_id=author_id)
+            for user_id, author_id in pairs if user_id != author_id
+        ))
+        self.stdout.write(
+            f"Данные созданы за {time.perf_counter() - started:.1f} с"
+        )
+        self.user_ids, self.group_ids, self.post_ids = (
+            user_ids, group_ids, post_ids
+        )
+
+    def pick_samples(self):
+        return {
+            "посты автора": lambda: Post.objects.filter(
+                author_id=self.pick(self.user_ids)
+            ).order_by("-pub_date", "-id")[:10],
+            "посты группы": lambda: Post.objects.filter(
+                group_id=self.pick(self.group_ids)
+            ).order_by("-pub_date", "-id")[:10],
+            "комментарии поста": lambda: Comment.objects.filter(
+                post_id=self.pick(self.post_ids)
+            ).order_by("created", "id")[:20],
+            "подписчики автора": lambda: Follow.objects.filter(
+                author_id=self.pick(self.user_ids)
+            ).order_by("user_id").values_list("user_id", flat=True)[:1000],
+        }
+
+    def index_by_name(self, model, name):
+        return next(
+            index for index in model._meta.indexes if index.name == name
+        )
+
+    def alter_indexes(self, make_sql):
+        # Редактор схемы не открывается как контекст: в SQLite это
+        # запрещено внутри транзакции. Сами CREATE/DROP INDEX
+        # транзакционны и откатываются вместе с данными.
+        editor = connection.schema_editor()
+        with connection.cursor() as cursor:
+            for model, names in HOT_INDEXES.items():
+                for name in names:
+                    index = self.index_by_name(model, name)
+                    cursor.execute(str(make_sql(index, model, editor)))
+
+    def drop_indexes(self):
+        self.alter_indexes(
+            lambda index, model, editor: index.remove_sql(model, editor)
+        )
+
+    def create_indexes(self):
+        self.alter_indexes(
+            lambda index, model, editor: index.create_sql(model, editor)
+        )
+
+    def measure(self, samples, options):
+        # Оба замера идут по одной и той же последовательности ключей.
+        self.random.seed(options["seed"])
+        repeat = options["repeat"]
+        results = {}
+        for title, make_queryset in samples.items():
+            plan = make_queryset().explain()
+            started = time.perf_counter()
+            for _ in range(repeat):
+                list(make_queryset())
+            elapsed = (time.perf_counter() - started) / repeat * 1000
+            results[title] = (plan, elapsed)
+        return results
+
+    def report(self, before, after):
+        for title in before:
+            plan_before, ms_before = before[title]
+            plan_after, ms_after = after[title]
+            self.stdout.write(self.style.MIGRATE_HEADING(title))
+            self.stdout.write(f"  без индексов: {ms_before:.2f} мс")
+            self.stdout.write(f"    {plan_before}".replace("\n", "\n    "))
+            self.stdout.write(f"  с индексами: {ms_after:.2f} мс")
+            self.stdout.write(f"    {plan_after}".replace("\n", "\n    "))
@@ -0,0 +1,294 @@
+import json
+import math
+import time
+from collections import namedtuple
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from posts.models import Follow, Group, Post, User
+from posts.timeline import follow_feed
+from posts.utils import (
+    FEED_ORDERING,
+    PAGINATOR_NUMBERED_PAGES,
+    POST_PER_PAGE,
+    CursorPaginator,
+)
+
+# Сколько страниц ленты пролистать для «глубокой» страницы.
+DEEP_PAGES = 50
+
+Scenario = namedtuple(
+    "Scenario",
+    ("name", "url", "user", "method", "data", "mutates"),
+    defaults=(None, "get", None, False),
+)
+
+
+def percentile(values, fraction):
+    """Значение по рангу: для p95 из 20 замеров — 19-е по возрастанию."""
+
+    ordered = sorted(values)
+    return ordered[max(math.ceil(len(ordered) * fraction) - 1, 0)]
+
+
+def deep_cursor(queryset, ordering=FEED_ORDERING, cursor_attrs=None):
+    """Курсор страницы, до которой пришлось бы листать DEEP_PAGES раз."""
+
+    queryset = queryset.order_by(*ordering)
+    offset = DEEP_PAGES * POST_PER_PAGE
+    row = queryset[offset:offset + 1].first() or queryset.last()
+    if row is None:
+        return ""
+    paginator = CursorPaginator(
+        queryset, POST_PER_PAGE, ordering=ordering, cursor_attrs=cursor_attrs
+    )
+    return paginator.cursor_for(row)
+
+
+class Command(BaseCommand):
+    help = (
+        "Замеряет p50/p95 времени ответа и число запросов видов posts "
+        "на заполненной базе (см. manage.py seed), сохраняет результат "
+        "в JSON и сравнивает с базовым замером."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument(
+            "--output", help="Куда записать результат в формате JSON."
+        )
+        parser.add_argument(
+            "--baseline", help="JSON прошлого замера для сравнения."
+        )
+        parser.add_argument(
+            "--tolerance",
+            type=float,
+            default=0.5,
+            help="Допустимый рост p95, доля от базового значения.",
+        )
+        parser.add_argument(
+            "--min-delta-ms",
+            type=float,
+            default=5.0,
+            help="Рост p95 меньше этого считается шумом.",
+        )
+
+    def handle(self, *args, **options):
+        results = {}
+        for scenario in self.scenarios():
+            results[scenario.name] = self.measure(scenario, options["repeat"])
+            result = results[scenario.name]
+            self.stdout.write(
+                f"{scenario.name:<32} p50 {result['p50_ms']:>8.2f} мс  "
+                f"p95 {result['p95_ms']:>8.2f} мс  "
+                f"запросов {result['queries']}"
+            )
+        report = {
+            "repeat": options["repeat"],
+            "rows": {
+                "users": User.objects.count(),
+                "posts": Post.objects.count(),
+            },
+            "results": results,
+        }
+        if options["output"]:
+            with open(options["output"], "w") as output:
+                json.dump(report, output, ensure_ascii=False, indent=2)
+        if options["baseline"]:
+            with open(options["baseline"]) as baseline:
+                self.compare(json.load(baseline)["results"], results, options)
+
+    def scenarios(self):
+        """Страницы с самыми тяжёлыми данными из текущей базы."""
+
+        viral_post = Post.objects.order_by("-comments_count", "-pk").first()
+        if viral_post is None:
+            raise CommandError(
+                "База пуста: сначала заполните её командой seed."
+            )
+        big_group = Group.objects.order_by("-posts_count", "pk").first()
+        star = User.objects.order_by(
+            "-stats__followers_count", "pk"
+        ).first()
+        reader = User.objects.order_by(
+            "-stats__following_count", "pk"
+        ).first()
+        author = viral_post.author
+        # Подписка и отписка замеряются там, где они что-то меняют:
+        # новая подписка — на автора с постами, которые попадут в ленту.
+        followed = Follow.objects.filter(user=reader).values("author_id")
+        by_followers = ("-stats__followers_count", "pk")
+        new_author = (
+            User.objects.exclude(pk__in=followed)
+            .exclude(pk=reader.pk)
+            .filter(stats__posts_count__gt=0)
+            .order_by(*by_followers)
+            .first()
+        ) or star
+        followed_author = (
+            User.objects.filter(pk__in=followed)
+            .order_by(*by_followers)
+            .first()
+        ) or star
+
+        group_id = big_group.pk if big_group is not None else ""
+
+        index = reverse("posts:index")
+        yield Scenario("index", index)
+        yield Scenario(
+            "index_numbered_deep", f"{index}?page={PAGINATOR_NUMBERED_PAGES}"
+        )
+        yield Scenario(
+            "index_cursor_deep",
+            f"{index}?after={deep_cursor(Post.objects.for_feed())}",
+        )
+        if big_group is not None:
+            url = reverse("posts:group_list", args=[big_group.slug])
+            posts = Post.objects.for_feed().filter(group=big_group)
+            yield Scenario("group_large", url)
+            yield Scenario(
+                "group_large_deep", f"{url}?after={deep_cursor(posts)}"
+            )
+        url = reverse("posts:profile", args=[star.username])
+        posts = Post.objects.for_feed().filter(author=star)
+        yield Scenario("profile_most_followed", url)
+        yield Scenario(
+            "profile_most_followed_deep", f"{url}?after={deep_cursor(posts)}"
+        )
+        yield Scenario(
+            "profile_most_followed_as_reader", url, user=reader
+        )
+        url = reverse("posts:follow_index")
+        posts, ordering, cursor_attrs = follow_feed(reader)
+        yield Scenario("follow_heavy_reader", url, user=reader)
+        yield Scenario(
+            "follow_heavy_reader_deep",
+            f"{url}?after={deep_cursor(posts, ordering, cursor_attrs)}",
+            user=reader,
+        )
+        url = reverse("posts:post_detail", args=[viral_post.pk])
+        yield Scenario("post_viral", url)
+        yield Scenario("post_viral_as_author", url, user=author)
+        yield Scenario(
+            "post_viral_comments",
+            reverse("posts:post_comments", args=[viral_post.pk]),
+        )
+        yield Scenario(
+            "search",
+            "{}?q={}".format(
+                reverse("posts:search"), viral_post.text.split()[0]
+            ),
+        )
+        yield Scenario(
+            "post_create_form", reverse("posts:post_create"), user=author
+        )
+        yield Scenario(
+            "post_edit_form",
+            reverse("posts:post_edit", args=[viral_post.pk]),
+            user=author,
+        )
+        # Действия меняют данные и выполняются в откатываемой транзакции.
+        # Новый пост пишет автор с подписчиками: он расходится по лентам.
+        yield Scenario(
+            "post_create",
+            reverse("posts:post_create"),
+            user=star,
+            method="post",
+            data={"text": "Пост для замера", "group": group_id},
+            mutates=True,
+        )
+        yield Scenario(
+            "post_edit",
+            reverse("posts:post_edit", args=[viral_post.pk]),
+            user=author,
+            method="post",
+            data={"text": "Правка для замера", "group": group_id},
+            mutates=True,
+        )
+        yield Scenario(
+            "add_comment",
+            reverse("posts:add_comment", args=[viral_post.pk]),
+            user=reader,
+            method="post",
+            data={"text": "Комментарий для замера"},
+            mutates=True,
+        )
+        yield Scenario(
+            "profile_follow",
+            reverse("posts:profile_follow", args=[new_author.username]),
+            user=reader,
+            mutates=True,
+        )
+        yield Scenario(
+            "profile_unfollow",
+            reverse("posts:profile_unfollow", args=[followed_author.username]),
+            user=reader,
+            mutates=True,
+        )
+
+    def request(self, client, scenario):
+        send = getattr(client, scenario.method)
+        if not scenario.mutates:
+            return send(scenario.url, scenario.data)
+        with transaction.atomic():
+            response = send(scenario.url, scenario.data)
+            transaction.set_rollback(True)
+        return response
+
+    def measure(self, scenario, repeat):
+        client = Client()
+        if scenario.user is not None:
+            client.force_login(scenario.user)
+        response = self.request(client, scenario)
+        if response.status_code not in (200, 302):
+            raise CommandError(
+                f"{scenario.name}: {scenario.url} ответил "
+                f"{response.status_code}"
+            )
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            with CaptureQueriesContext(connection) as captured:
+                started = time.perf_counter()
+                self.request(client, scenario)
+                timings.append((time.perf_counter() - started) * 1000)
+            queries = max(queries, len(captured))
+        return {
+            "url": scenario.url,
+            "p50_ms": round(percentile(timings, 0.5), 3),
+            "p95_ms": round(percentile(timings, 0.95), 3),
+            "queries": queries,
+        }
+
+    def compare(self, baseline, results, options):
+        """Сравнивает с базовым замером; регрессия завершает команду."""
+
+        regressions = []
+        for name, result in results.items():
+            base = baseline.get(name)
+            if base is None:
+                continue
+            if result["queries"] > base["queries"]:
+                regressions.append(
+                    f"{name}: запросов {base['queries']} → "
+                    f"{result['queries']}"
+                )
+            limit = max(
+                base["p95_ms"] * (1 + options["tolerance"]),
+                base["p95_ms"] + options["min_delta_ms"],
+            )
+            if result["p95_ms"] > limit:
+                regressions.append(
+                    f"{name}: p95 {base['p95_ms']:.2f} → "
+                    f"{result['p95_ms']:.2f} мс"
+                )
+        if regressions:
+            raise CommandError(
+                "Регрессия относительно базового замера:\n"
+                + "\n".join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS("Регрессий нет"))
@@ -0,0 +1,73 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.template.defaultfilters import filesizeformat
+
+from posts import media_gc
+
+KIND_LABELS = {
+    "originals": "Оригиналы",
+    "variants": "Варианты",
+    "thumbnails": "Миниатюры",
+    "kvstore": "Записи KV-хранилища",
+    "records": "Записи заданий, вариантов и учёта файлов",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Удаляет картинки, миниатюры, варианты и записи KV-хранилища, "
+        "на которые не ссылается ни один пост."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Только показать, что будет удалено.",
+        )
+        parser.add_argument(
+            "--min-age",
+            type=int,
+            default=media_gc.GC_MIN_AGE,
+            help="Не трогать файлы и записи моложе стольких секунд.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=media_gc.GC_BATCH_SIZE,
+            help="Сколько файлов или строк проверять одним запросом.",
+        )
+        parser.add_argument(
+            "--pause",
+            type=float,
+            default=0,
+            help="Пауза в секундах между пачками файлов.",
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        collector = media_gc.Collector(
+            min_age=options["min_age"],
+            batch_size=options["batch_size"],
+            dry_run=options["dry_run"],
+            pause=options["pause"],
+        )
+        stats = collector.run()
+        elapsed = time.monotonic() - started
+        verb = "будет удалено" if options["dry_run"] else "удалено"
+        for kind, label in KIND_LABELS.items():
+            kind_stats = stats[kind]
+            line = (
+                f"{label}: проверено {kind_stats.scanned}, "
+                f"{verb} {kind_stats.deleted}"
+            )
+            if kind_stats.freed:
+                line += f" ({filesizeformat(kind_stats.freed)})"
+            self.stdout.write(line)
+        scanned = sum(kind_stats.scanned for kind_stats in stats.values())
+        freed = sum(kind_stats.freed for kind_stats in stats.values())
+        self.stdout.write(self.style.SUCCESS(
+            f"Итого {verb} {filesizeformat(freed)} за {elapsed:.1f} с, "
+            f"{scanned / elapsed if elapsed else scanned:.0f} объектов/с"
+        ))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import BigIntegerField, ExpressionWrapper, F, Sum
+from django.template.defaultfilters import filesizeformat
+
+from posts.models import StoredFile
+
+
+class Command(BaseCommand):
+    help = "Показывает, сколько места экономит хранение картинок по хешу."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--top",
+            type=int,
+            default=10,
+            help="Сколько самых повторяемых файлов показать.",
+        )
+
+    def handle(self, *args, **options):
+        totals = StoredFile.objects.aggregate(
+            physical=Sum("size"),
+            logical=Sum(
+                ExpressionWrapper(
+                    F("size") * F("refcount"), output_field=BigIntegerField()
+                )
+            ),
+        )
+        physical = totals["physical"] or 0
+        logical = totals["logical"] or 0
+        self.stdout.write(
+            f"Файлов: {StoredFile.objects.count()}, "
+            f"на диске: {filesizeformat(physical)}, "
+            f"без дедупликации: {filesizeformat(logical)}, "
+            f"сэкономлено: {filesizeformat(max(logical - physical, 0))}"
+        )
+        duplicated = StoredFile.objects.filter(refcount__gt=1).order_by(
+            "-refcount", "name"
+        )[:options["top"]]
+        for stored in duplicated:
+            self.stdout.write(
+                f"{stored.refcount:>6} × {filesizeformat(stored.size)} "
+                f"{stored.name}"
+            )
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from posts import cache
+
+
+class Command(BaseCommand):
+    help = "Показывает попадания и промахи кэша страниц лент."
+
+    def handle(self, *args, **options):
+        stats = cache.stats()
+        total = stats["hit"] + stats["miss"]
+        ratio = stats["hit"] / total if total else 0
+        self.stdout.write(
+            f"Попаданий: {stats['hit']}, промахов: {stats['miss']}, "
+            f"доля попаданий: {ratio:.1%}"
+        )
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from posts import search
+
+
+class Command(BaseCommand):
+    help = "Пересобирает полнотекстовый индекс постов."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько постов вставлять за один запрос.",
+        )
+
+    def handle(self, *args, **options):
+        if not search.is_enabled():
+            self.stdout.write(self.style.WARNING(
+                "Полнотекстовый индекс поддерживается только в SQLite."
+            ))
+            return
+        indexed = search.rebuild(options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"Постов проиндексировано: {indexed}"
+        ))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from posts import timeline
+from posts.models import Follow
+
+
+class Command(BaseCommand):
+    help = "Пересобирает материализованные ленты подписок."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--user",
+            type=int,
+            action="append",
+            dest="user_ids",
+            help="id пользователя; по умолчанию все подписчики.",
+        )
+
+    def handle(self, *args, **options):
+        user_ids = options["user_ids"]
+        if not user_ids:
+            user_ids = (
+                Follow.objects.order_by("user_id")
+                .values_list("user_id", flat=True)
+                .distinct()
+                .iterator()
+            )
+        users = entries = 0
+        for user_id in user_ids:
+            entries += timeline.rebuild(user_id)
+            users += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Лент пересобрано: {users}, записей: {entries}"
+        ))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from posts.counters import (
+    COUNTERS,
+    create_missing_user_stats,
+    reconcile_counter,
+)
+
+
+class Command(BaseCommand):
+    help = "Сверяет денормализованные счётчики с исходными таблицами."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Сколько записей проверять за один запрос.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        created = create_missing_user_stats(batch_size)
+        if created:
+            self.stdout.write(f"Создано строк счётчиков: {created}")
+        for model, field, source, fk in COUNTERS:
+            fixed = reconcile_counter(model, field, source, fk, batch_size)
+            self.stdout.write(
+                f"{model._meta.label}.{field}: исправлено {fixed}"
+            )
+        self.stdout.write(self.style.SUCCESS("Счётчики сверены"))
@@ -0,0 +1,246 @@
+import random
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.contrib.auth.hashers import UNUSABLE_PASSWORD_PREFIX
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+from faker import Faker
+
+from posts import cache
+from posts.models import Comment, Follow, Group, Post, User
+
+BATCH_SIZE = 5000
+
+
+def _next_pk(model):
+    return (model.objects.aggregate(last=Max("pk"))["last"] or 0) + 1
+
+
+def power_law_index(rng, count):
+    """Индекс от 0 до count - 1 со степенным распределением.
+
+    Первые индексы выпадают намного чаще остальных: так несколько
+    авторов, групп и постов собирают большую часть активности.
+    """
+
+    return int(count * rng.random() ** 3)
+
+
+def set_dates(model, field_name, dated):
+    """Записывает заданные даты в поле auto_now_add.
+
+    bulk_create всегда ставит в такое поле текущее время, а менять
+    само поле модели нельзя: это повлияло бы на весь процесс.
+    """
+
+    quote = connection.ops.quote_name
+    field = model._meta.get_field(field_name)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"UPDATE {quote(model._meta.db_table)} "
+            f"SET {quote(field.column)} = %s "
+            f"WHERE {quote(model._meta.pk.column)} = %s",
+            [
+                (field.get_db_prep_value(date, connection), obj.pk)
+                for obj, date in dated
+            ],
+        )
+
+
+def reset_sequences(*models):
+    """Сдвигает последовательности id за вставленные явно ключи.
+
+    Без этого в PostgreSQL следующий обычный INSERT получит занятый id.
+    """
+
+    statements = connection.ops.sequence_reset_sql(no_style(), models)
+    with connection.cursor() as cursor:
+        for sql in statements:
+            cursor.execute(sql)
+
+
+class Command(BaseCommand):
+    help = (
+        "Заполняет базу правдоподобными данными: пользователи, группы, "
+        "посты, комментарии и подписки со степенным распределением. "
+        "При одинаковом --seed и одинаковой исходной базе данные "
+        "получаются одинаковыми."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--groups", type=int, default=100)
+        parser.add_argument("--posts", type=int, default=100000)
+        parser.add_argument("--comments", type=int, default=200000)
+        parser.add_argument(
+            "--follows",
+            type=int,
+            default=20,
+            help="Сколько авторов в среднем читает пользователь.",
+        )
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=365,
+            help="За сколько дней до сегодняшнего распределить посты.",
+        )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+        parser.add_argument(
+            "--skip-derived",
+            action="store_true",
+            help="Не пересчитывать счётчики, ленты и поисковый индекс.",
+        )
+
+    def handle(self, *args, **options):
+        if options["users"] < 1:
+            raise CommandError("Нужен хотя бы один пользователь.")
+        self.options = options
+        self.random = random.Random(options["seed"])
+        self.fake = Faker("ru_RU")
+        self.fake.seed_instance(options["seed"])
+        self.batch_size = options["batch_size"]
+        self.end = timezone.now().replace(microsecond=0)
+        self.start = self.end - timedelta(days=options["days"])
+
+        # Ключи назначаются заранее: связи строятся по диапазонам id,
+        # и списки созданных объектов держать в памяти не нужно.
+        self.first_user = _next_pk(User)
+        self.first_group = _next_pk(Group)
+        self.first_post = _next_pk(Post)
+        self.first_comment = _next_pk(Comment)
+        self.insert(User, self.users())
+        self.insert(Group, self.groups())
+        self.insert(Post, self.posts(), date_field="pub_date")
+        self.insert(Comment, self.comments(), date_field="created")
+        self.insert(Follow, self.follows())
+        reset_sequences(User, Group, Post, Comment)
+
+        # bulk_create не отправляет сигналы, поэтому производные данные
+        # пересчитываются целиком, а ленты на страницах сбрасываются.
+        cache.bump_versions(cache.FEED_SCOPE)
+        if not options["skip_derived"]:
+            for command in (
+                "reconcile_counters",
+                "rebuild_timelines",
+                "rebuild_search_index",
+            ):
+                started = time.perf_counter()
+                call_command(command, stdout=self.stdout)
+                self.stdout.write(
+                    f"{command}: {time.perf_counter() - started:.1f} с"
+                )
+
+    def insert(self, model, rows, date_field=None):
+        """Вставляет строки пачками.
+
+        Если задан date_field, rows отдаёт пары (объект, дата): поле
+        auto_now_add заполняется отдельным UPDATE после вставки.
+        """
+
+        started = time.perf_counter()
+        inserted = 0
+        while True:
+            batch = list(islice(rows, self.batch_size))
+            if not batch:
+                break
+            with transaction.atomic():
+                if date_field is None:
+                    model.objects.bulk_create(batch)
+                else:
+                    model.objects.bulk_create(obj for obj, _ in batch)
+                    set_dates(model, date_field, batch)
+            inserted += len(batch)
+        elapsed = time.perf_counter() - started
+        rate = inserted / elapsed if elapsed else 0
+        self.stdout.write(
+            f"{model._meta.label}: {inserted} строк за {elapsed:.1f} с "
+            f"({rate:.0f} строк/с)"
+        )
+
+    def ids(self, first, option):
+        return range(first, first + self.options[option])
+
+    def pick(self, first, count):
+        return first + power_law_index(self.random, count)
+
+    def post_date(self, post_id):
+        # Даты растут вместе с id, как у постов, созданных по очереди.
+        position = (post_id - self.first_post) / max(self.options["posts"], 1)
+        return self.start + (self.end - self.start) * position
+
+    def users(self):
+        for pk in self.ids(self.first_user, "users"):
+            yield User(
+                pk=pk,
+                username=f"{self.fake.user_name()}_{pk}",
+                first_name=self.fake.first_name(),
+                last_name=self.fake.last_name(),
+                email=self.fake.email(),
+                password=UNUSABLE_PASSWORD_PREFIX,
+            )
+
+    def groups(self):
+        for pk in self.ids(self.first_group, "groups"):
+            yield Group(
+                pk=pk,
+                title=self.fake.catch_phrase()[:200],
+                slug=f"group-{pk}",
+                description=self.fake.paragraph(),
+            )
+
+    def posts(self):
+        users, groups = self.options["users"], self.options["groups"]
+        for pk in self.ids(self.first_post, "posts"):
+            has_group = groups and self.random.random() < 0.7
+            yield Post(
+                pk=pk,
+                text=self.fake.text(
+                    max_nb_chars=self.random.randint(80, 1000)
+                ),
+                author_id=self.pick(self.first_user, users),
+                group_id=(
+                    self.pick(self.first_group, groups) if has_group else None
+                ),
+            ), self.post_date(pk)
+
+    def comments(self):
+        users, posts = self.options["users"], self.options["posts"]
+        if not posts:
+            return
+        for pk in self.ids(self.first_comment, "comments"):
+            # Свежие посты обсуждают чаще: считаем от последнего.
+            post_id = self.first_post + posts - 1 - self.pick(0, posts)
+            created = min(
+                self.post_date(post_id)
+                + timedelta(minutes=self.random.expovariate(1 / 600)),
+                self.end,
+            )
+            yield Comment(
+                pk=pk,
+                post_id=post_id,
+                author_id=self.first_user + self.random.randrange(users),
+                text=self.fake.sentence(),
+            ), created
+
+    def follows(self):
+        users = self.options["users"]
+        # Среднее power_law_index(rng, n) — около четверти n.
+        most = 4 * self.options["follows"]
+        for user_id in self.ids(self.first_user, "users"):
+            wanted = min(power_law_index(self.random, most), users - 1)
+            authors = set()
+            for _ in range(wanted * 3):
+                if len(authors) == wanted:
+                    break
+                author_id = self.pick(self.first_user, users)
+                if author_id != user_id:
+                    authors.add(author_id)
+            for author_id in sorted(authors):
+                yield Follow(user_id=user_id, author_id=author_id)
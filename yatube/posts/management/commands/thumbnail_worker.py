@@ -0,0 +1,72 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand
+
+from posts import thumbnails
+
+
+class Command(BaseCommand):
+    help = (
+        "Разбирает очередь миниатюр: картинки рисуются пулом процессов, "
+        "результат записывается в KV-хранилище sorl."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Количество процессов пула.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=20,
+            help="Сколько заданий забирать из очереди за раз.",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=5,
+            help="Пауза в секундах, когда очередь пуста.",
+        )
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Разобрать очередь и выйти.",
+        )
+
+    def handle(self, *args, **options):
+        done = failed = 0
+        with ProcessPoolExecutor(
+            max_workers=options["workers"],
+            initializer=thumbnails.init_worker,
+        ) as pool:
+            thumbnails.release_stale()
+            while True:
+                jobs = thumbnails.claim(options["batch_size"])
+                if not jobs:
+                    if options["once"]:
+                        break
+                    time.sleep(options["poll_interval"])
+                    thumbnails.release_stale()
+                    continue
+                futures = {
+                    pool.submit(thumbnails.render_image, job.image): job
+                    for job in jobs
+                }
+                for future in as_completed(futures):
+                    job = futures[future]
+                    try:
+                        thumbnails.complete(job, *future.result())
+                    except Exception as error:
+                        thumbnails.fail(job, repr(error))
+                        failed += 1
+                        self.stderr.write(f"{job.image}: {error!r}")
+                    else:
+                        done += 1
+        self.stdout.write(self.style.SUCCESS(
+            f"Готово: {done}, с ошибкой: {failed}"
+        ))
@@ -0,0 +1,335 @@
+import os
+import posixpath
+import re
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.helpers import deserialize
+from sorl.thumbnail.images import ImageFile, deserialize_image_file
+from sorl.thumbnail.kvstores.base import add_prefix, del_prefix
+from sorl.thumbnail.models import KVStore
+
+from .models import Post, PostImageVariant, StoredFile, ThumbnailJob
+from .storage import INCOMING_PREFIX
+from .variants import IMAGE_VARIANT_DIR
+
+# Сколько секунд не трогать свежие файлы и записи: их может прямо
+# сейчас использовать загрузка или воркер миниатюр.
+GC_MIN_AGE = getattr(settings, "POSTS_MEDIA_GC_MIN_AGE", 60 * 60)
+GC_BATCH_SIZE = 500
+TOMBSTONE_SUFFIX = ".gc"
+# Миниатюры для экранов высокой плотности: <имя>@2x.jpg.
+ALTERNATIVE_RESOLUTION = re.compile(r"@\d+(\.\d+)?x(?=\.[^.]+$)")
+KINDS = ("originals", "variants", "thumbnails", "kvstore", "records")
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def walk(storage, directory, exclude=()):
+    """Файлы каталога хранилища с датой изменения, по одному.
+
+    Каталог читается потоком через os.scandir, список файлов в память
+    целиком не попадает.
+    """
+
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(storage.path(current))
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                name = posixpath.join(current, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    if name not in exclude:
+                        stack.append(name)
+                elif entry.is_file(follow_symlinks=False):
+                    yield name, entry.stat().st_mtime
+
+
+def keyset(queryset, field, batch_size, *fields):
+    """Строки queryset пачками по возрастанию field (первое из fields)."""
+
+    last = None
+    while True:
+        page = queryset.order_by(field)
+        if last is not None:
+            page = page.filter(**{f"{field}__gt": last})
+        rows = list(page.values_list(*fields)[:batch_size])
+        if not rows:
+            return
+        yield rows
+        last = rows[-1][0]
+
+
+class Stats:
+    def __init__(self):
+        self.scanned = 0
+        self.deleted = 0
+        self.freed = 0
+
+
+class Collector:
+    """Находит и удаляет медиа, на которые не ссылается ни один пост.
+
+    Живой считается картинка, имя которой записано в Post.image; всё,
+    что построено для мёртвых картинок (миниатюры sorl с записями
+    KV-хранилища, варианты, задания очереди, учёт StoredFile), тоже
+    мусор. Файлы моложе min_age секунд не трогаются.
+    """
+
+    def __init__(self, min_age=GC_MIN_AGE, batch_size=GC_BATCH_SIZE,
+                 dry_run=False, pause=0):
+        self.min_age = min_age
+        self.cutoff = time.time() - min_age
+        self.batch_size = batch_size
+        self.dry_run = dry_run
+        self.pause = pause
+        self.stats = {kind: Stats() for kind in KINDS}
+        image_field = Post._meta.get_field("image")
+        self.storage = image_field.storage
+        self.directory = image_field.upload_to.strip("/")
+
+    def run(self):
+        self.collect_originals()
+        self.collect_records()
+        self.collect_variant_files()
+        self.collect_thumbnail_files()
+        return self.stats
+
+    def batches(self, iterable):
+        """Пачки с паузой между ними, чтобы не мешать сайту."""
+
+        for index, batch in enumerate(batched(iterable, self.batch_size)):
+            if index and self.pause:
+                time.sleep(self.pause)
+            yield batch
+
+    def live_images(self, names):
+        return set(
+            Post.objects.filter(image__in=names)
+            .values_list("image", flat=True)
+        )
+
+    def remove_file(self, storage, name, kind):
+        """Удаляет старый файл; возвращает True, если файла больше нет.
+
+        Файл сначала переименовывается и только потом проверяется его
+        дата изменения. Загрузка того же содержимого обновляет дату
+        (см. ContentAddressedStorage), поэтому успевший понадобиться
+        файл возвращается на место, а после переименования загрузка
+        просто запишет его заново.
+        """
+
+        path = storage.path(name)
+        stats = self.stats[kind]
+        if self.dry_run:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return True
+            if stat.st_mtime > self.cutoff:
+                return False
+            stats.deleted += 1
+            stats.freed += stat.st_size
+            return True
+        tombstone = path + TOMBSTONE_SUFFIX
+        try:
+            os.replace(path, tombstone)
+        except FileNotFoundError:
+            return True
+        stat = os.stat(tombstone)
+        if stat.st_mtime > self.cutoff:
+            os.replace(tombstone, path)
+            return False
+        os.unlink(tombstone)
+        stats.deleted += 1
+        stats.freed += stat.st_size
+        return True
+
+    def is_recent(self, storage, name):
+        try:
+            return os.stat(storage.path(name)).st_mtime > self.cutoff
+        except FileNotFoundError:
+            return False
+
+    def collect_originals(self):
+        stats = self.stats["originals"]
+        files = walk(self.storage, self.directory, exclude={IMAGE_VARIANT_DIR})
+        for batch in self.batches(files):
+            stats.scanned += len(batch)
+            names = [name for name, mtime in batch if mtime <= self.cutoff]
+            live = self.live_images(names)
+            removed = [
+                name for name in names
+                if name not in live
+                and self.remove_file(self.storage, name, "originals")
+            ]
+            if removed and not self.dry_run:
+                StoredFile.objects.filter(name__in=removed).delete()
+        # Временные файлы загрузок, брошенные упавшим процессом.
+        try:
+            entries = os.scandir(self.storage.location)
+        except FileNotFoundError:
+            return
+        with entries:
+            incoming = [
+                entry.name for entry in entries
+                if entry.name.startswith(INCOMING_PREFIX) and entry.is_file()
+            ]
+        for name in incoming:
+            stats.scanned += 1
+            self.remove_file(self.storage, name, "originals")
+
+    def collect_records(self):
+        live = Post.objects.values("image")
+        cutoff = timezone.now() - timedelta(seconds=self.min_age)
+        records = self.stats["records"]
+
+        jobs = ThumbnailJob.objects.exclude(image__in=live).filter(
+            updated__lt=cutoff
+        )
+        for rows in keyset(jobs, "pk", self.batch_size, "pk"):
+            records.scanned += len(rows)
+            records.deleted += len(rows)
+            if not self.dry_run:
+                ThumbnailJob.objects.filter(
+                    pk__in=[pk for pk, in rows]
+                ).delete()
+
+        variants = PostImageVariant.objects.exclude(image__in=live)
+        for rows in keyset(variants, "pk", self.batch_size, "pk", "file"):
+            records.scanned += len(rows)
+            gone = [
+                pk for pk, name in rows
+                if self.remove_file(default_storage, name, "variants")
+            ]
+            records.deleted += len(gone)
+            if gone and not self.dry_run:
+                PostImageVariant.objects.filter(pk__in=gone).delete()
+
+        self.collect_kvstore()
+
+        stored = StoredFile.objects.exclude(name__in=live)
+        for rows in keyset(stored, "name", self.batch_size, "name"):
+            records.scanned += len(rows)
+            missing = [
+                name for name, in rows if not self.storage.exists(name)
+            ]
+            records.deleted += len(missing)
+            if missing and not self.dry_run:
+                StoredFile.objects.filter(name__in=missing).delete()
+
+    def collect_kvstore(self):
+        """Записи sorl для мёртвых картинок вместе с файлами миниатюр."""
+
+        stats = self.stats["kvstore"]
+        sources = KVStore.objects.filter(
+            key__startswith=add_prefix("", "image")
+        )
+        for rows in keyset(sources, "key", self.batch_size, "key", "value"):
+            stats.scanned += len(rows)
+            images = {}
+            for key, value in rows:
+                image = deserialize_image_file(value)
+                if image.name.startswith(self.directory + "/"):
+                    images[image.name] = del_prefix(key)
+            live = self.live_images(list(images))
+            dead = [
+                key for name, key in images.items()
+                if name not in live and not self.is_recent(self.storage, name)
+            ]
+            if dead:
+                self.delete_sources(dead)
+
+    def delete_sources(self, keys):
+        stats = self.stats["kvstore"]
+        thumbnail_lists = {
+            del_prefix(key): deserialize(value)
+            for key, value in KVStore.objects.filter(
+                key__in=[add_prefix(key, "thumbnails") for key in keys]
+            ).values_list("key", "value")
+        }
+        thumbnails = dict(
+            KVStore.objects.filter(
+                key__in=[
+                    add_prefix(key)
+                    for thumbnail_keys in thumbnail_lists.values()
+                    for key in thumbnail_keys
+                ]
+            ).values_list("key", "value")
+        )
+        raw_keys = []
+        for key in keys:
+            thumbnail_keys = [
+                add_prefix(thumbnail_key)
+                for thumbnail_key in thumbnail_lists.get(key, [])
+            ]
+            # Миниатюру могли только что нарисовать: тогда записи
+            # картинки остаются до следующего запуска.
+            removed = [
+                self.remove_file(
+                    default.storage,
+                    deserialize_image_file(thumbnails[thumbnail_key]).name,
+                    "thumbnails",
+                )
+                for thumbnail_key in thumbnail_keys
+                if thumbnail_key in thumbnails
+            ]
+            if all(removed):
+                raw_keys.append(add_prefix(key))
+                raw_keys.append(add_prefix(key, "thumbnails"))
+                raw_keys.extend(thumbnail_keys)
+        stats.deleted += len(raw_keys)
+        if raw_keys and not self.dry_run:
+            default.kvstore._delete_raw(*raw_keys)
+
+    def collect_variant_files(self):
+        stats = self.stats["variants"]
+        for batch in self.batches(walk(default_storage, IMAGE_VARIANT_DIR)):
+            stats.scanned += len(batch)
+            names = [name for name, mtime in batch if mtime <= self.cutoff]
+            live = set(
+                PostImageVariant.objects.filter(file__in=names)
+                .values_list("file", flat=True)
+            )
+            for name in names:
+                if name not in live:
+                    self.remove_file(default_storage, name, "variants")
+
+    def collect_thumbnail_files(self):
+        stats = self.stats["thumbnails"]
+        storage = default.storage
+        directory = sorl_settings.THUMBNAIL_PREFIX.strip("/")
+        for batch in self.batches(walk(storage, directory)):
+            stats.scanned += len(batch)
+            keys = {}
+            for name, mtime in batch:
+                if mtime <= self.cutoff:
+                    base = ALTERNATIVE_RESOLUTION.sub("", name)
+                    keys.setdefault(
+                        add_prefix(ImageFile(base, storage).key), []
+                    ).append(name)
+            live = set(
+                KVStore.objects.filter(key__in=keys)
+                .values_list("key", flat=True)
+            )
+            for key, names in keys.items():
+                if key not in live:
+                    for name in names:
+                        self.remove_file(storage, name, "thumbnails")
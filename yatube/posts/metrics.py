@@ -0,0 +1,33 @@
+from core import metrics
+
+from . import cache, thumbnails
+from .models import ThumbnailJob
+
+metrics.describe(
+    "yatube_image_cache_total",
+    metrics.COUNTER,
+    "Чтения готовых картинок из LRU процесса: попадания и промахи.",
+)
+metrics.describe(
+    cache.STATS_METRIC,
+    metrics.COUNTER,
+    "Кэш страниц лент для анонимов: попадания и промахи.",
+)
+
+
+def collect():
+    """Значения, которые считаются в момент чтения /metrics."""
+
+    yield (
+        "yatube_thumbnail_queue_depth",
+        metrics.GAUGE,
+        "Картинки, которые ждут воркер миниатюр.",
+        [({}, thumbnails.queue_depth())],
+    )
+    failed = ThumbnailJob.objects.filter(status=ThumbnailJob.FAILED).count()
+    yield (
+        "yatube_thumbnail_failed_jobs",
+        metrics.GAUGE,
+        "Картинки, которые воркер не смог обработать.",
+        [({}, failed)],
+    )
@@ -0,0 +1,52 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:28
+
+import os
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+import posts.storage
+
+
+def register_existing_images(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    StoredFile = apps.get_model('posts', 'StoredFile')
+    images = (
+        Post.objects.exclude(image='')
+        .order_by()
+        .values_list('image')
+        .annotate(refcount=Count('pk'))
+    )
+    stored = []
+    for name, refcount in images.iterator():
+        path = os.path.join(settings.MEDIA_ROOT, name)
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        stored.append(StoredFile(name=name, size=size, refcount=refcount))
+    StoredFile.objects.bulk_create(stored, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0019_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('name', models.CharField(max_length=255, primary_key=True, serialize=False, verbose_name='Имя файла')),
+                ('size', models.BigIntegerField(verbose_name='Размер, байт')),
+                ('refcount', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='image',
+            field=models.ImageField(blank=True, storage=posts.storage.ContentAddressedStorage(), upload_to='posts/', verbose_name='Картинка'),
+        ),
+        migrations.RunPython(
+            register_existing_images, migrations.RunPython.noop
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 2.2.16 on 2026-10-18 03:35
+
+from django.db import migrations, models
+
+
+def requeue_images(apps, schema_editor):
+    ThumbnailJob = apps.get_model('posts', 'ThumbnailJob')
+    ThumbnailJob.objects.filter(status='done').update(status='pending')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0021_post_image_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storedfile',
+            name='dominant_color',
+            field=models.CharField(blank=True, max_length=7, verbose_name='Основной цвет'),
+        ),
+        migrations.AddField(
+            model_name='storedfile',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Высота'),
+        ),
+        migrations.AddField(
+            model_name='storedfile',
+            name='placeholder',
+            field=models.TextField(blank=True, help_text='Крошечный JPEG как data: URI', verbose_name='Заглушка'),
+        ),
+        migrations.AddField(
+            model_name='storedfile',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='Ширина'),
+        ),
+        migrations.RunPython(requeue_images, migrations.RunPython.noop),
+    ]
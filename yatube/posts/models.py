@@ -1,5 +1,8 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import Lookup
+
+from .storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -18,11 +21,35 @@ class Group(models.Model):
     description = models.TextField(
         verbose_name="Описание", help_text="Введите описание группы"
     )
+    posts_count = models.PositiveIntegerField(
+        "Количество постов", default=0, editable=False
+    )
 
     def __str__(self) -> str:
         return self.title
 
 
+class PostQuerySet(models.QuerySet):
+    FEED_FIELDS = (
+        "id",
+        "text",
+        "pub_date",
+        "image",
+        "author",
+        "author__username",
+        "author__first_name",
+        "author__last_name",
+        "group",
+        "group__slug",
+        "group__title",
+    )
+
+    def for_feed(self):
+        """Посты для карточек ленты: автор и группа в том же запросе."""
+
+        return self.select_related("author", "group").only(*self.FEED_FIELDS)
+
+
 class Post(models.Model):
     text = models.TextField(
         verbose_name="Текст записи", help_text="Введите текст поста"
@@ -51,16 +78,71 @@ class Post(models.Model):
     image = models.ImageField(
         verbose_name='Картинка',
         upload_to='posts/',
+        storage=ContentAddressedStorage(),
         blank=True
     )
+    comments_count = models.PositiveIntegerField(
+        "Количество комментариев", default=0, editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="post_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["group", "-pub_date", "-id"],
+                name="post_group_pub_date_idx",
+            ),
+            models.Index(fields=["image"], name="post_image_idx"),
+        ]
 
     def __str__(self) -> str:
         return self.text[:15]
 
 
+class SearchDocumentField(models.TextField):
+    """Колонка виртуальной таблицы FTS5."""
+
+
+@SearchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class PostSearch(models.Model):
+    """Строка полнотекстового индекса постов.
+
+    Таблица — виртуальная таблица SQLite FTS5, её создаёт миграция,
+    а заполняют сигналы и команда rebuild_search_index. rowid строки
+    совпадает с id поста, rank — оценка BM25 в запросе с MATCH
+    (чем меньше, тем релевантнее).
+    """
+
+    post = models.OneToOneField(
+        Post,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search",
+    )
+    text = SearchDocumentField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "posts_post_fts"
+
+
 class Comment(models.Model):
     post = models.ForeignKey(
         Post,
@@ -75,6 +157,14 @@ class Comment(models.Model):
     text = models.TextField()
     created = models.DateTimeField("pub_date", auto_now_add=True)
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["post", "created", "id"],
+                name="comment_post_created_idx",
+            ),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -98,3 +188,201 @@ class Follow(models.Model):
                 name="unique_following",
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=["author", "user"],
+                name="follow_author_user_idx",
+            ),
+        ]
+
+
+class UserStats(models.Model):
+    """Счётчики пользователя, которые дорого считать на лету."""
+
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stats",
+        verbose_name="Пользователь",
+    )
+    posts_count = models.PositiveIntegerField(
+        "Количество постов", default=0
+    )
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков", default=0
+    )
+    following_count = models.PositiveIntegerField(
+        "Количество подписок", default=0
+    )
+
+    def __str__(self):
+        return str(self.user)
+
+    @classmethod
+    def counts_for(cls, user_id):
+        """Точные значения счётчиков, посчитанные по исходным таблицам."""
+
+        return {
+            "posts_count": Post.objects.filter(author_id=user_id).count(),
+            "followers_count": Follow.objects.filter(
+                author_id=user_id
+            ).count(),
+            "following_count": Follow.objects.filter(
+                user_id=user_id
+            ).count(),
+        }
+
+    @classmethod
+    def for_user(cls, user):
+        """Счётчики пользователя; недостающая строка создаётся по данным."""
+
+        try:
+            return cls.objects.get(user=user)
+        except cls.DoesNotExist:
+            stats, _ = cls.objects.get_or_create(
+                user=user, defaults=cls.counts_for(user.pk)
+            )
+            return stats
+
+
+class TimelineEntry(models.Model):
+    """Пост в материализованной ленте подписок пользователя.
+
+    pub_date копируется из поста, чтобы лента читалась диапазоном
+    по индексу (user, -pub_date, -post) без соединения с Follow.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="timeline",
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name="timeline_entries",
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    pub_date = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                name="unique_timeline_post",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["user", "-pub_date", "-post"],
+                name="timeline_user_date_idx",
+            ),
+            models.Index(
+                fields=["user", "author"],
+                name="timeline_user_author_idx",
+            ),
+        ]
+
+
+class ThumbnailJob(models.Model):
+    """Задание на генерацию миниатюр картинки поста.
+
+    Очередь живёт в базе: воркер захватывает задания пачкой,
+    помечая их своим claim_token, и возвращает в очередь упавшие,
+    пока не исчерпаны попытки.
+    """
+
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUSES = (
+        (PENDING, "В очереди"),
+        (RUNNING, "Выполняется"),
+        (DONE, "Готово"),
+        (FAILED, "Ошибка"),
+    )
+
+    image = models.CharField("Картинка", max_length=255, unique=True)
+    status = models.CharField(
+        "Статус", max_length=16, choices=STATUSES, default=PENDING
+    )
+    attempts = models.PositiveSmallIntegerField("Попытки", default=0)
+    claim_token = models.CharField(max_length=32, blank=True)
+    error = models.TextField("Ошибка", blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["status", "id"],
+                name="thumbnail_job_status_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.image} ({self.status})"
+
+
+class PostImageVariant(models.Model):
+    """Уменьшенная копия картинки поста в одном формате и ширине.
+
+    Строки создаёт воркер миниатюр, шаблон строит по ним srcset,
+    не обращаясь к файловой системе.
+    """
+
+    WEBP = "webp"
+    JPEG = "jpeg"
+    FORMATS = (
+        (WEBP, "WebP"),
+        (JPEG, "JPEG"),
+    )
+
+    image = models.CharField("Картинка", max_length=255)
+    format = models.CharField("Формат", max_length=8, choices=FORMATS)
+    width = models.PositiveIntegerField("Ширина")
+    height = models.PositiveIntegerField("Высота")
+    file = models.FileField("Файл", max_length=255)
+    size = models.PositiveIntegerField("Размер, байт")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["image", "format", "width"],
+                name="unique_image_variant",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.image} {self.width}w {self.format}"
+
+
+class StoredFile(models.Model):
+    """Файл хранилища с адресацией по содержимому и число ссылок на него.
+
+    Один файл могут использовать несколько постов; файл без ссылок
+    удаляет сборщик мусора. Размеры, основной цвет и заглушку картинки
+    заполняет воркер миниатюр, чтобы страницам не открывать исходник.
+    """
+
+    name = models.CharField("Имя файла", max_length=255, primary_key=True)
+    size = models.BigIntegerField("Размер, байт")
+    refcount = models.PositiveIntegerField("Ссылок", default=0)
+    created = models.DateTimeField(auto_now_add=True)
+    width = models.PositiveIntegerField("Ширина", null=True, blank=True)
+    height = models.PositiveIntegerField("Высота", null=True, blank=True)
+    dominant_color = models.CharField(
+        "Основной цвет", max_length=7, blank=True
+    )
+    placeholder = models.TextField(
+        "Заглушка", blank=True, help_text="Крошечный JPEG как data: URI"
+    )
+
+    def __str__(self):
+        return f"{self.name} ({self.refcount})"
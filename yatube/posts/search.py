@@ -0,0 +1,115 @@
+import re
+
+from django.db import connection
+from django.db.models import F, Q
+
+from .models import Post, PostSearch
+from .utils import FEED_ORDERING
+
+SEARCH_TABLE = PostSearch._meta.db_table
+SEARCH_ORDERING = ("search__rank", "-id")
+SEARCH_CURSOR_ATTRS = ("rank", "id")
+TERM_RE = re.compile(r"\w+")
+
+
+def is_enabled():
+    """Полнотекстовый индекс есть только в SQLite (FTS5)."""
+
+    return connection.vendor == "sqlite"
+
+
+def match_query(text):
+    """Запрос пользователя в синтаксисе MATCH FTS5.
+
+    Каждое слово берётся в кавычки, поэтому операторы FTS5 из ввода
+    не исполняются. Последнее слово ищется по префиксу, чтобы
+    находились и другие его формы.
+    """
+
+    terms = [f'"{term}"' for term in TERM_RE.findall(text)]
+    if not terms:
+        return ""
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def index_post(post_id, text):
+    """Добавляет пост в индекс или обновляет его текст."""
+
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [post_id]
+        )
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} (rowid, text) VALUES (%s, %s)",
+            [post_id, text],
+        )
+
+
+def remove_post(post_id):
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"DELETE FROM {SEARCH_TABLE} WHERE rowid = %s", [post_id]
+        )
+
+
+def rebuild(batch_size):
+    """Заполняет индекс заново пачками по первичному ключу постов.
+
+    Возвращает количество проиндексированных постов.
+    """
+
+    if not is_enabled():
+        return 0
+    indexed = 0
+    last_pk = 0
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {SEARCH_TABLE}")
+        while True:
+            rows = list(
+                Post.objects.filter(pk__gt=last_pk)
+                .order_by("pk")
+                .values_list("pk", "text")[:batch_size]
+            )
+            if not rows:
+                break
+            cursor.executemany(
+                f"INSERT INTO {SEARCH_TABLE} (rowid, text) VALUES (%s, %s)",
+                rows,
+            )
+            indexed += len(rows)
+            last_pk = rows[-1][0]
+        # Сливает сегменты индекса после массовой вставки.
+        cursor.execute(
+            f"INSERT INTO {SEARCH_TABLE} ({SEARCH_TABLE}) VALUES ('optimize')"
+        )
+    return indexed
+
+
+def search_posts(text):
+    """Посты, подходящие под запрос, и параметры их курсорной сортировки.
+
+    В SQLite посты выбираются из индекса FTS5 и сортируются по BM25,
+    в остальных базах — обычным поиском подстрок по свежести.
+    """
+
+    posts = Post.objects.for_feed()
+    query = match_query(text)
+    if not query:
+        return posts.none(), FEED_ORDERING, None
+    if not is_enabled():
+        terms = Q()
+        for term in TERM_RE.findall(text):
+            terms &= Q(text__icontains=term)
+        return posts.filter(terms), FEED_ORDERING, None
+    return (
+        posts.filter(search__text__match=query).annotate(
+            rank=F("search__rank")
+        ),
+        SEARCH_ORDERING,
+        SEARCH_CURSOR_ATTRS,
+    )
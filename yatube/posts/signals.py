@@ -0,0 +1,202 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import cache, search, thumbnails, timeline
+from .counters import change_counter, change_user_counter
+from .models import (
+    Comment,
+    Follow,
+    Group,
+    Post,
+    StoredFile,
+    User,
+    UserStats,
+)
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+
+
+@receiver(pre_save, sender=Post)
+def remember_previous_post(sender, instance, raw=False, **kwargs):
+    """Запоминает прежние группу и картинку, чтобы перенести счётчики."""
+
+    if raw or instance._state.adding:
+        return
+    previous = (
+        Post.objects.filter(pk=instance.pk)
+        .values_list("group_id", "image")
+        .first()
+    )
+    if previous is not None:
+        instance._previous_group_id, instance._previous_image = previous
+
+
+@receiver(post_save, sender=Post)
+def count_saved_post(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        change_user_counter(instance.author_id, "posts_count", 1)
+        if instance.group_id:
+            change_counter(
+                Group.objects.filter(pk=instance.group_id), "posts_count", 1
+            )
+        return
+    previous_group_id = getattr(instance, "_previous_group_id", None)
+    if previous_group_id == instance.group_id:
+        return
+    if previous_group_id:
+        change_counter(
+            Group.objects.filter(pk=previous_group_id), "posts_count", -1
+        )
+    if instance.group_id:
+        change_counter(
+            Group.objects.filter(pk=instance.group_id), "posts_count", 1
+        )
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    change_user_counter(instance.author_id, "posts_count", -1)
+    if instance.group_id:
+        change_counter(
+            Group.objects.filter(pk=instance.group_id), "posts_count", -1
+        )
+
+
+@receiver(post_save, sender=Comment)
+def count_saved_comment(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(
+            Post.objects.filter(pk=instance.post_id), "comments_count", 1
+        )
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    change_counter(
+        Post.objects.filter(pk=instance.post_id), "comments_count", -1
+    )
+
+
+@receiver(post_save, sender=Follow)
+def count_saved_follow(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_user_counter(instance.author_id, "followers_count", 1)
+        change_user_counter(instance.user_id, "following_count", 1)
+
+
+@receiver(post_delete, sender=Follow)
+def count_deleted_follow(sender, instance, **kwargs):
+    change_user_counter(instance.author_id, "followers_count", -1)
+    change_user_counter(instance.user_id, "following_count", -1)
+
+
+@receiver(post_save, sender=Post)
+def fan_out_saved_post(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.fan_out_post(instance)
+
+
+@receiver(post_save, sender=Follow)
+def backfill_timeline(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        timeline.backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Follow)
+def trim_timeline(sender, instance, **kwargs):
+    timeline.trim(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=Post)
+def invalidate_saved_post(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    cache.bump_post_scopes(
+        instance.pk,
+        instance.author_id,
+        instance.group_id,
+        getattr(instance, "_previous_group_id", None),
+    )
+
+
+@receiver(post_delete, sender=Post)
+def invalidate_deleted_post(sender, instance, **kwargs):
+    cache.bump_post_scopes(
+        instance.pk, instance.author_id, instance.group_id
+    )
+
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+def invalidate_commented_post(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    post = (
+        Post.objects.filter(pk=instance.post_id)
+        .values_list("pk", "author_id", "group_id")
+        .first()
+    )
+    if post is not None:
+        cache.bump_post_scopes(*post)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_group(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache.bump_versions(cache.group_scope(instance.pk))
+
+
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def invalidate_follows(sender, instance, raw=False, **kwargs):
+    if not raw:
+        cache.bump_versions(cache.follow_scope(instance.user_id))
+
+
+@receiver(post_save, sender=Post)
+def index_saved_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_post(instance.pk, instance.text)
+
+
+@receiver(post_delete, sender=Post)
+def unindex_deleted_post(sender, instance, **kwargs):
+    search.remove_post(instance.pk)
+
+
+@receiver(post_save, sender=Post)
+def enqueue_thumbnails(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image:
+        thumbnails.enqueue(instance.image.name)
+
+
+def change_refcount(name, delta):
+    if name:
+        change_counter(
+            StoredFile.objects.filter(name=name), "refcount", delta
+        )
+
+
+@receiver(post_save, sender=Post)
+def count_image_references(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        change_refcount(instance.image.name, 1)
+        return
+    previous_image = getattr(instance, "_previous_image", None)
+    if previous_image != instance.image.name:
+        change_refcount(previous_image, -1)
+        change_refcount(instance.image.name, 1)
+
+
+@receiver(post_delete, sender=Post)
+def release_image_reference(sender, instance, **kwargs):
+    change_refcount(instance.image.name, -1)
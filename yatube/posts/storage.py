@@ -0,0 +1,66 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+HASH_CHUNK_SIZE = 64 * 1024
+INCOMING_PREFIX = ".incoming-"
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, в котором имя файла — хеш его содержимого.
+
+    Файл сохраняется как <папка>/<aa>/<sha256>.<расширение>: одинаковые
+    загрузки попадают в один файл, а значит, и миниатюры с вариантами,
+    которые привязаны к имени, у них общие. Хеш считается по ходу
+    записи во временный файл, поэтому загрузка читается один раз.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        # Имя всё равно заменяется хешем, суффиксы не нужны.
+        return name
+
+    def _save(self, name, content):
+        directory = posixpath.dirname(name)
+        extension = posixpath.splitext(name)[1].lower()
+        os.makedirs(self.location, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(
+            dir=self.location, prefix=INCOMING_PREFIX, delete=False
+        ) as incoming:
+            if hasattr(content, "seek"):
+                content.seek(0)
+            for chunk in content.chunks(HASH_CHUNK_SIZE):
+                digest.update(chunk)
+                incoming.write(chunk)
+                size += len(chunk)
+        hexdigest = digest.hexdigest()
+        name = posixpath.join(
+            directory, hexdigest[:2], f"{hexdigest}{extension}"
+        )
+        full_path = self.path(name)
+        try:
+            # Свежая дата изменения не даёт сборщику мусора удалить
+            # файл, который снова стал нужен.
+            os.utime(full_path)
+        except FileNotFoundError:
+            os.makedirs(os.path.dirname(full_path), exist_ok=True)
+            os.replace(incoming.name, full_path)
+            os.chmod(full_path, self.file_permissions_mode or 0o644)
+        else:
+            os.unlink(incoming.name)
+        register_stored_file(name, size)
+        return name
+
+
+def register_stored_file(name, size):
+    """Заводит учёт ссылок на файл; счётчик ведут сигналы Post."""
+
+    from .models import StoredFile
+
+    StoredFile.objects.get_or_create(name=name, defaults={"size": size})
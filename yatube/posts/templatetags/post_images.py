@@ -0,0 +1,26 @@
+from django import template
+
+from posts import images
+
+register = template.Library()
+
+
+@register.simple_tag
+def post_image(post, page=None):
+    """Готовые версии картинки поста или пустой PostImage.
+
+    Если передана страница, при первом вызове разрешаются картинки
+    всех её постов сразу, а результат запоминается на странице, так
+    что тег внутри {% for post in page_obj %} не делает запрос на пост.
+    """
+
+    if not post.image:
+        return images.EMPTY
+    if not page:
+        resolved = images.resolve([post.image])
+    else:
+        resolved = getattr(page, "_post_images", None)
+        if resolved is None:
+            resolved = images.resolve(item.image for item in page)
+            page._post_images = resolved
+    return resolved.get(post.image.name, images.EMPTY)
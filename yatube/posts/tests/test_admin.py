@@ -0,0 +1,97 @@
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..models import Comment, Follow, Group, Post
+
+User = get_user_model()
+
+
+class AdminChangelistTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.admin = User.objects.create_superuser(
+            'changelist_admin', 'admin@example.com', 'password')
+        cls.author = User.objects.create_user(username='changelist_author')
+        cls.group = Group.objects.create(
+            title='Группа', slug='changelist-group', description='')
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Пост')
+        Comment.objects.create(
+            post=cls.post, author=cls.author, text='Комментарий')
+        Follow.objects.create(user=cls.admin, author=cls.author)
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def changelist_queries(self, model, rows):
+        Post.objects.bulk_create(
+            Post(author=self.author, group=self.group, text=f'Пост {i}')
+            for i in range(rows)
+        )
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.author, text=f'Текст {i}')
+            for i in range(rows)
+        )
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse(f'admin:posts_{model}_changelist'))
+        self.assertEqual(response.status_code, 200)
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_changelist_queries_do_not_depend_on_rows(self):
+        """Строки списка не догружают автора, группу и пост по одной."""
+        for model in ('comment', 'follow', 'group'):
+            with self.subTest(model=model):
+                self.assertEqual(
+                    len(self.changelist_queries(model, 0)),
+                    len(self.changelist_queries(model, 20)),
+                )
+
+    def test_post_changelist_loads_only_selected_groups(self):
+        """Редактируемая колонка группы читает только выбранную группу."""
+        empty = self.changelist_queries('post', 0)
+        full = self.changelist_queries('post', 20)
+        extra = full[len(empty):]
+        self.assertEqual(len(extra), 20)
+        self.assertTrue(all(
+            '"posts_group"."id" IN' in sql for sql in extra))
+        self.assertFalse(any(
+            'FROM "posts_group"' in sql and 'WHERE' not in sql
+            for sql in full
+        ))
+
+    def test_group_column_is_autocomplete(self):
+        """list_editable с группой не выводит все группы в <select>."""
+        other = Group.objects.create(
+            title='Другая', slug='changelist-other', description='')
+        response = self.client.get(reverse('admin:posts_post_changelist'))
+        self.assertContains(response, 'admin-autocomplete')
+        self.assertNotContains(response, f'<option value="{other.pk}"')
+
+    def test_comment_search_by_author_username(self):
+        """Комментарии ищутся по имени автора."""
+        response = self.client.get(
+            reverse('admin:posts_comment_changelist'),
+            {'q': 'changelist_author'})
+        self.assertEqual(response.context['cl'].result_count, 1)
+
+    def test_large_table_count_is_estimated(self):
+        """Без фильтров большой таблицы COUNT(*) не выполняется."""
+        Post.objects.create(
+            pk=self.post.pk + 100000, author=self.author, text='Последний')
+        with mock.patch('posts.utils.ESTIMATED_COUNT_LIMIT', 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(
+                    reverse('admin:posts_post_changelist'))
+        self.assertEqual(
+            response.context['cl'].result_count, self.post.pk + 100000)
+        self.assertFalse(any(
+            'COUNT(*)' in query['sql'] and 'posts_post' in query['sql']
+            for query in queries.captured_queries
+        ))
@@ -0,0 +1,278 @@
+import json
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db.models import Count
+from django.test import TestCase, override_settings
+from django.urls import resolve
+from PIL import Image
+from sorl.thumbnail.models import KVStore
+
+from .. import thumbnails, variants
+from .. import urls as posts_urls
+from ..models import (
+    Comment,
+    Follow,
+    Group,
+    Post,
+    PostImageVariant,
+    StoredFile,
+    ThumbnailJob,
+    TimelineEntry,
+    UserStats,
+)
+
+User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+class BenchViewsCommandTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        call_command(
+            'seed', users=20, groups=3, posts=120, comments=200, follows=4,
+            stdout=StringIO(),
+        )
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        self.output = os.path.join(self.output_dir, 'bench.json')
+
+    def bench(self, **options):
+        call_command(
+            'bench_views', repeat=3, output=self.output, stdout=StringIO(),
+            **options,
+        )
+        with open(self.output) as output:
+            return json.load(output)['results']
+
+    def test_every_view_is_measured(self):
+        """Замер покрывает все виды posts и пишет p50, p95 и запросы."""
+        results = self.bench()
+        measured = {
+            resolve(result['url'].split('?')[0]).view_name
+            for result in results.values()
+        }
+        self.assertEqual(
+            measured,
+            {f'posts:{pattern.name}' for pattern in posts_urls.urlpatterns},
+        )
+        for name, result in results.items():
+            with self.subTest(name=name):
+                self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+                self.assertGreater(result['queries'], 0)
+        self.assertEqual(Comment.objects.count(), 200)
+
+    def test_query_regression_fails(self):
+        """Лишний запрос относительно базового замера — ошибка."""
+        baseline = self.bench()
+        baseline['index']['queries'] -= 1
+        baseline_path = os.path.join(self.output_dir, 'baseline.json')
+        with open(baseline_path, 'w') as output:
+            json.dump({'results': baseline}, output)
+        with self.assertRaisesRegex(CommandError, 'index: запросов'):
+            self.bench(baseline=baseline_path)
+
+
+class SeedCommandTest(TestCase):
+    OPTIONS = {
+        'users': 40,
+        'groups': 4,
+        'posts': 300,
+        'comments': 500,
+        'follows': 5,
+        'seed': 7,
+        'batch_size': 64,
+    }
+
+    def seed(self, **options):
+        out = StringIO()
+        call_command('seed', stdout=out, **dict(self.OPTIONS, **options))
+        return out.getvalue()
+
+    def snapshot(self):
+        return (
+            list(User.objects.order_by('pk').values_list('pk', 'username')),
+            list(Post.objects.order_by('pk').values_list(
+                'pk', 'author_id', 'group_id', 'text'
+            )),
+            list(Follow.objects.order_by('pk').values_list(
+                'user_id', 'author_id'
+            )),
+        )
+
+    def test_seed_creates_consistent_data(self):
+        """Команда seed создаёт строки и пересчитывает производные."""
+        out = self.seed()
+        self.assertEqual(User.objects.count(), 40)
+        self.assertEqual(Group.objects.count(), 4)
+        self.assertEqual(Post.objects.count(), 300)
+        self.assertEqual(Comment.objects.count(), 500)
+        self.assertRegex(out, r'posts\.Post: 300 строк за [\d.]+ с')
+        self.assertIn('строк/с', out)
+
+        followers = Follow.objects.values('author_id').annotate(
+            total=Count('pk')).order_by('-total').values_list(
+            'total', flat=True)
+        self.assertGreater(followers[0], 4 * followers[len(followers) // 2])
+        self.assertEqual(Post.objects.values('pub_date').distinct().count(),
+                         300)
+
+        self.assertTrue(Post._meta.get_field('pub_date').auto_now_add)
+        self.assertLess(
+            Comment.objects.order_by('created').first().created,
+            Comment.objects.order_by('created').last().created,
+        )
+        post = Post.objects.create(author=User.objects.first(), text='Новый')
+        self.assertGreater(post.pk, 300)
+
+        stats = UserStats.objects.get(user_id=Post.objects.first().author_id)
+        self.assertEqual(
+            stats.posts_count,
+            Post.objects.filter(author_id=stats.user_id).count(),
+        )
+        self.assertTrue(TimelineEntry.objects.exists())
+
+    def test_seed_is_deterministic(self):
+        """Один и тот же seed даёт те же данные."""
+        self.seed(skip_derived=True)
+        first = self.snapshot()
+        User.objects.all().delete()
+        Group.objects.all().delete()
+        self.seed(skip_derived=True)
+        self.assertEqual(self.snapshot(), first)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class MediaGarbageCollectorTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username='collector')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        # Записи sorl кэшируются и переживают откат транзакции теста.
+        cache.clear()
+
+    def create_post(self, color, author=None):
+        content = BytesIO()
+        Image.new('RGB', (4, 4), color).save(content, 'PNG')
+        post = Post.objects.create(
+            author=author or self.user,
+            text='Картинка',
+            image=SimpleUploadedFile('a.png', content.getvalue()),
+        )
+        self.build_media(post.image.name)
+        return post
+
+    @staticmethod
+    def build_media(name):
+        """Миниатюра с записями sorl и варианты, как после воркера."""
+        variants.store_variants(name, variants.render_variants(name))
+        geometry, options = thumbnails.THUMBNAIL_PRESETS['card']
+        thumbnail, _ = thumbnails.backend.thumbnail_file(
+            name, geometry, options
+        )
+        default_storage.save(thumbnail.name, ContentFile(b'thumbnail'))
+        thumbnails.backend.store(name, (4, 4), [(thumbnail.name, (960, 339))])
+
+    def media(self, name):
+        geometry, options = thumbnails.THUMBNAIL_PRESETS['card']
+        thumbnail, _ = thumbnails.backend.thumbnail_file(
+            name, geometry, options
+        )
+        return [name, thumbnail.name] + list(
+            PostImageVariant.objects.filter(image=name)
+            .values_list('file', flat=True)
+        )
+
+    def collect(self, *args):
+        out = StringIO()
+        call_command(
+            'collect_media_garbage', '--min-age=0', *args, stdout=out
+        )
+        return out.getvalue()
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(TEMP_MEDIA_ROOT, name))
+
+    def test_unreferenced_media_is_collected(self):
+        """Заменённая и удалённая с автором картинки удаляются целиком."""
+        other = User.objects.create_user(username='leaving')
+        deleted = self.create_post('red', author=other)
+        edited = self.create_post('green')
+        kept = self.create_post('blue')
+        deleted_media = self.media(deleted.image.name)
+        edited_media = self.media(edited.image.name)
+        kept_media = self.media(kept.image.name)
+        edited_name = edited.image.name
+        edited.image = ''
+        edited.save()
+        other.delete()
+
+        output = self.collect('--dry-run')
+        self.assertIn('Оригиналы: проверено 3, будет удалено 2', output)
+        for name in deleted_media + edited_media:
+            self.assertTrue(self.exists(name), name)
+
+        output = self.collect()
+        self.assertIn('Оригиналы: проверено 3, удалено 2', output)
+        for name in deleted_media + edited_media:
+            self.assertFalse(self.exists(name), name)
+        for name in kept_media:
+            self.assertTrue(self.exists(name), name)
+        dead = [deleted_media[0], edited_name]
+        self.assertFalse(PostImageVariant.objects.filter(image__in=dead))
+        self.assertFalse(ThumbnailJob.objects.filter(image__in=dead))
+        self.assertFalse(StoredFile.objects.filter(name__in=dead))
+        # Остались только картинка, список миниатюр и миниатюра живого поста.
+        self.assertEqual(KVStore.objects.count(), 3)
+        self.assertTrue(
+            KVStore.objects.filter(value__contains=kept.image.name).exists()
+        )
+        self.assertNotRegex(self.collect(), r'удалено [1-9]')
+
+    def test_stray_files_are_collected(self):
+        """Файлы без записей в базе удаляются, файлы постов остаются."""
+        post = self.create_post('red')
+        strays = [
+            'posts/legacy.png',
+            'posts/variants/legacy_320.jpg',
+            'cache/ab/cd/abcdef.jpg',
+            '.incoming-crashed',
+        ]
+        for name in strays:
+            default_storage.save(name, ContentFile(b'stray'))
+        self.collect()
+        for name in strays:
+            self.assertFalse(self.exists(name), name)
+        for name in self.media(post.image.name):
+            self.assertTrue(self.exists(name), name)
+
+    def test_recent_files_are_kept(self):
+        """Свежие файлы не трогаются: их может использовать загрузка."""
+        post = self.create_post('red')
+        name = post.image.name
+        post.delete()
+        default_storage.save('posts/fresh.png', ContentFile(b'fresh'))
+        out = StringIO()
+        call_command('collect_media_garbage', stdout=out)
+        self.assertTrue(self.exists('posts/fresh.png'))
+        for media_name in self.media(name):
+            self.assertTrue(self.exists(media_name), media_name)
@@ -1,13 +1,27 @@
+import shutil
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, RequestFactory, TestCase, override_settings
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import (
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+from PIL import Image, ImageOps
 
 from posts.models import Group, Post
+from posts.uploads import LimitedTemporaryFileUploadHandler
 
 User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostCreateFormTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -25,6 +39,11 @@ class PostCreateFormTests(TestCase):
             group=cls.group,
         )
 
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
     def setUp(self):
         self.guest_client = Client()
         self.authorized_client = Client()
@@ -105,3 +124,119 @@ class PostCreateFormTests(TestCase):
         self.assertFalse(Post.objects.filter(
             text='Пост от неавторизованного пользователя').exists())
         self.assertRedirects(response, redirect)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class PostImageUploadTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="uploader")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    @staticmethod
+    def image_file(name, size, format_name="JPEG", exif=None):
+        content = BytesIO()
+        options = {"exif": exif.tobytes()} if exif else {}
+        Image.new("RGB", size, (10, 120, 200)).save(
+            content, format_name, **options)
+        return SimpleUploadedFile(name, content.getvalue(), "image/jpeg")
+
+    def create(self, image):
+        return self.client.post(
+            reverse("posts:post_create"),
+            data={"text": "Пост с картинкой", "image": image},
+        )
+
+    def test_create_saves_image(self):
+        """Картинка сохраняется и при создании поста."""
+        self.create(self.image_file("small.jpg", (40, 30)))
+        post = Post.objects.get(author=self.user)
+        self.assertTrue(post.image.name.startswith("posts/"))
+        self.assertTrue(post.image.name.endswith(".jpg"))
+        self.assertTrue(post.image.storage.exists(post.image.name))
+
+    def test_upload_over_size_limit_is_rejected(self):
+        """Слишком большой файл отклоняется, а на диск пишется не всё."""
+        image = self.image_file("large.jpg", (200, 200))
+        with mock.patch("posts.uploads.MAX_UPLOAD_SIZE", 100), \
+                mock.patch.object(
+                    TemporaryFileUploadHandler, "receive_data_chunk") as write:
+            response = self.create(image)
+        write.assert_not_called()
+        self.assertFormError(
+            response, "form", "image", "Файл больше 100\xa0байт.")
+        self.assertFalse(Post.objects.filter(author=self.user).exists())
+
+    def test_upload_over_size_limit_stops_parsing(self):
+        """Сверх лимита обработчик прерывает разбор, не дочитывая тело."""
+        request = RequestFactory().post("/")
+        handler = LimitedTemporaryFileUploadHandler(request)
+        handler.new_file("image", "large.jpg", "image/jpeg", None)
+        with mock.patch("posts.uploads.MAX_UPLOAD_SIZE", 100):
+            handler.receive_data_chunk(b"x" * 60, 0)
+            with self.assertRaises(StopUpload) as stop:
+                handler.receive_data_chunk(b"x" * 60, 60)
+        handler.file.close()
+        self.assertTrue(stop.exception.connection_reset)
+        self.assertEqual(request.oversized_uploads["image"].size, 120)
+
+    def test_too_many_pixels_are_rejected_before_decode(self):
+        """Число пикселей проверяется по заголовку, без декодирования."""
+        image = self.image_file("wide.jpg", (300, 200))
+        with mock.patch("posts.uploads.MAX_PIXELS", 50_000), \
+                mock.patch.object(Image.Image, "load") as load:
+            response = self.create(image)
+        load.assert_not_called()
+        self.assertFormError(
+            response, "form", "image", "Картинка больше 0.05 мегапикселей.")
+
+    def test_oversized_image_is_downscaled_without_exif(self):
+        """Большая картинка уменьшается, поворачивается и теряет EXIF."""
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Orientation: повернуть на 90° по часовой
+        exif[0x010F] = "Камера"
+        image = self.image_file("photo.jpg", (1600, 1200), exif=exif)
+        with mock.patch("posts.uploads.MAX_DIMENSION", 400):
+            self.create(image)
+        post = Post.objects.get(author=self.user)
+        with Image.open(post.image.path) as saved:
+            self.assertEqual(saved.size, (300, 400))
+            self.assertEqual(len(saved.getexif()), 0)
+            self.assertEqual(saved.format, "JPEG")
+
+    def test_wide_jpeg_is_reduced_while_decoding(self):
+        """Узкую сторону draft() учитывает: JPEG декодируется уменьшенным."""
+        image = self.image_file("wide.jpg", (1600, 400))
+        transpose = ImageOps.exif_transpose
+        decoded = []
+
+        def record_size(source):
+            decoded.append(source.size)
+            return transpose(source)
+
+        with mock.patch("posts.uploads.MAX_DIMENSION", 400), \
+                mock.patch("posts.uploads.ImageOps.exif_transpose",
+                           side_effect=record_size):
+            self.create(image)
+        self.assertEqual(decoded, [(400, 100)])
+        post = Post.objects.get(author=self.user)
+        with Image.open(post.image.path) as saved:
+            self.assertEqual(saved.size, (400, 100))
+
+    def test_small_image_without_exif_is_kept_as_is(self):
+        """Картинка в пределах лимитов сохраняется без пережатия."""
+        image = self.image_file("keep.png", (64, 64), "PNG")
+        original = image.read()
+        image.seek(0)
+        self.create(image)
+        post = Post.objects.get(author=self.user)
+        with post.image.open("rb") as saved:
+            self.assertEqual(saved.read(), original)
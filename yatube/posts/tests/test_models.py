@@ -1,7 +1,25 @@
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.template.defaultfilters import filesizeformat
+from django.test import TestCase, override_settings
+from PIL import Image
 
-from ..models import Group, Post
+from ..models import (
+    Comment,
+    Follow,
+    Group,
+    Post,
+    StoredFile,
+    ThumbnailJob,
+    UserStats,
+)
 
 User = get_user_model()
 
@@ -95,3 +113,158 @@ class GroupModelTest(TestCase):
                 self.assertEqual(
                     group._meta.get_field(value).help_text, expected
                 )
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="author")
+        cls.reader = User.objects.create_user(username="reader")
+        cls.group = Group.objects.create(
+            title="Группа",
+            slug="counters",
+            description="Тестовое описание",
+        )
+        cls.other_group = Group.objects.create(
+            title="Другая группа",
+            slug="other-counters",
+            description="Тестовое описание",
+        )
+
+    def assertCounters(self, user, **expected):
+        stats = UserStats.objects.get(user=user)
+        for field, value in expected.items():
+            with self.subTest(field=field):
+                self.assertEqual(getattr(stats, field), value)
+
+    def test_post_counters(self):
+        """Создание, перенос и удаление поста меняют счётчики."""
+        post = Post.objects.create(
+            author=self.author, text="Пост", group=self.group
+        )
+        self.assertCounters(self.author, posts_count=1)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 1)
+
+        post.group = self.other_group
+        post.save()
+        self.group.refresh_from_db()
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 0)
+        self.assertEqual(self.other_group.posts_count, 1)
+
+        post.delete()
+        self.assertCounters(self.author, posts_count=0)
+        self.other_group.refresh_from_db()
+        self.assertEqual(self.other_group.posts_count, 0)
+
+    def test_comment_counter(self):
+        """Комментарии считаются в посте."""
+        post = Post.objects.create(author=self.author, text="Пост")
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text="Комментарий"
+        )
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        comment.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+
+    def test_follow_counters(self):
+        """Подписка меняет счётчики обоих пользователей."""
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        self.assertCounters(self.author, followers_count=1)
+        self.assertCounters(self.reader, following_count=1)
+        follow.delete()
+        self.assertCounters(self.author, followers_count=0)
+        self.assertCounters(self.reader, following_count=0)
+
+    def test_reconcile_counters_fixes_drift(self):
+        """Команда reconcile_counters исправляет рассинхронизацию."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f"Пост {i}", group=self.group)
+            for i in range(3)
+        )
+        UserStats.objects.filter(user=self.reader).delete()
+        call_command("reconcile_counters", batch_size=1, stdout=StringIO())
+        self.assertCounters(self.author, posts_count=3)
+        self.assertCounters(self.reader, posts_count=0)
+        self.group.refresh_from_db()
+        self.assertEqual(self.group.posts_count, 3)
+
+
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ContentAddressedStorageTest(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.user = User.objects.create_user(username="storage")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @staticmethod
+    def upload(name, color):
+        content = BytesIO()
+        Image.new("RGB", (4, 4), color).save(content, "PNG")
+        return SimpleUploadedFile(name, content.getvalue(), "image/png")
+
+    def create_post(self, name, color="red"):
+        return Post.objects.create(
+            author=self.user, text="Картинка", image=self.upload(name, color)
+        )
+
+    def test_same_content_is_stored_once(self):
+        """Одинаковые загрузки хранятся одним файлом под хешем."""
+        first = self.create_post("cat.png")
+        second = self.create_post("другой кот.PNG")
+        self.assertEqual(first.image.name, second.image.name)
+        directory, bucket, filename = first.image.name.split("/")
+        self.assertEqual(directory, "posts")
+        self.assertTrue(filename.startswith(bucket))
+        self.assertTrue(filename.endswith(".png"))
+        self.assertEqual(
+            len(os.listdir(os.path.dirname(first.image.path))), 1
+        )
+        stored = StoredFile.objects.get(name=first.image.name)
+        self.assertEqual(stored.refcount, 2)
+        self.assertEqual(stored.size, first.image.size)
+        self.assertEqual(ThumbnailJob.objects.count(), 1)
+
+    def test_refcount_follows_edits_and_deletes(self):
+        first = self.create_post("a.png")
+        second = self.create_post("b.png")
+        name = first.image.name
+
+        second.image = self.upload("c.png", "blue")
+        second.save()
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 1)
+        self.assertEqual(
+            StoredFile.objects.get(name=second.image.name).refcount, 1
+        )
+
+        second.text = "Без новой картинки"
+        second.save()
+        self.assertEqual(
+            StoredFile.objects.get(name=second.image.name).refcount, 1
+        )
+
+        first.delete()
+        self.assertEqual(StoredFile.objects.get(name=name).refcount, 0)
+
+    def test_dedup_report(self):
+        post = self.create_post("a.png")
+        self.create_post("b.png")
+        self.create_post("c.png")
+        size = post.image.size
+        out = StringIO()
+        call_command("media_dedup_report", stdout=out)
+        output = out.getvalue()
+        self.assertIn(f"сэкономлено: {filesizeformat(2 * size)}", output)
+        self.assertIn(f"3 × {filesizeformat(size)} {post.image.name}", output)
@@ -1,8 +1,13 @@
+from unittest import mock
+
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.test import TestCase, Client
 from django.urls import reverse
 
-from posts.models import Post, Group
+from core.middleware import PUBLIC
+from posts import urls as posts_urls
+from posts.models import Follow, Post, Group
 
 User = get_user_model()
 
@@ -106,3 +111,112 @@ class PostURLTests(TestCase):
         """Страница не найденна."""
         response = self.guest_client.get("/unexisting_page/")
         self.assertEqual(response.status_code, 404)
+
+
+class CachePolicyTests(TestCase):
+    PUBLIC = "public, max-age=60, stale-while-revalidate=300"
+    REVALIDATE = "private, no-cache"
+    NO_STORE = "private, no-store"
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username="PolicyAuthor")
+        cls.reader = User.objects.create_user(username="PolicyReader")
+        cls.group = Group.objects.create(
+            title="Группа политики", slug="policy", description="Описание"
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text="Запись", group=cls.group
+        )
+        post = {"post_id": cls.post.pk}
+        author = {"username": cls.author.username}
+        # Имя URL → (адрес, метод, заголовок анониму, автору поста).
+        cls.cases = {
+            "index": (reverse("posts:index"), "get",
+                      cls.PUBLIC, cls.REVALIDATE),
+            "group_list": (
+                reverse("posts:group_list", kwargs={"slug": "policy"}),
+                "get", cls.PUBLIC, cls.REVALIDATE),
+            "profile": (reverse("posts:profile", kwargs=author), "get",
+                        cls.PUBLIC, cls.REVALIDATE),
+            "post_detail": (reverse("posts:post_detail", kwargs=post),
+                            "get", cls.PUBLIC, cls.REVALIDATE),
+            "post_comments": (reverse("posts:post_comments", kwargs=post),
+                              "get", cls.PUBLIC, cls.REVALIDATE),
+            "search": (reverse("posts:search") + "?q=Запись", "get",
+                       cls.PUBLIC, cls.REVALIDATE),
+            "post_edit": (reverse("posts:post_edit", kwargs=post), "get",
+                          cls.NO_STORE, cls.NO_STORE),
+            "post_create": (reverse("posts:post_create"), "get",
+                            cls.NO_STORE, cls.NO_STORE),
+            "add_comment": (reverse("posts:add_comment", kwargs=post),
+                            "post", cls.NO_STORE, cls.NO_STORE),
+            "follow_index": (reverse("posts:follow_index"), "get",
+                             cls.NO_STORE, cls.NO_STORE),
+            "profile_follow": (
+                reverse("posts:profile_follow",
+                        kwargs={"username": cls.reader.username}),
+                "get", cls.NO_STORE, cls.NO_STORE),
+            "profile_unfollow": (
+                reverse("posts:profile_unfollow",
+                        kwargs={"username": cls.reader.username}),
+                "get", cls.NO_STORE, cls.NO_STORE),
+        }
+
+    def request(self, client, name):
+        url, method, _, _ = self.cases[name]
+        if method == "post":
+            return client.post(url, {"text": "Комментарий"})
+        return client.get(url)
+
+    def test_every_url_has_policy(self):
+        """Для каждого имени из posts/urls.py проверены заголовки."""
+        names = {pattern.name for pattern in posts_urls.urlpatterns}
+        self.assertEqual(names, set(self.cases))
+
+    def test_cache_headers(self):
+        """Аноним получает public, автор — private; Vary: Cookie всегда."""
+        author = Client()
+        author.force_login(self.author)
+        for name, (_, _, anonymous, authorized) in self.cases.items():
+            for client, expected in (
+                (Client(), anonymous),
+                (author, authorized),
+            ):
+                with self.subTest(name=name, expected=expected):
+                    if name == "profile_unfollow":
+                        Follow.objects.get_or_create(
+                            user=self.author, author=self.reader)
+                    response = self.request(client, name)
+                    self.assertEqual(response["Cache-Control"], expected)
+                    self.assertIn("Cookie", response["Vary"])
+
+    def test_about_pages_are_public(self):
+        """Статические страницы about кэшируются для анонимов."""
+        for name in ("about:author", "about:tech"):
+            with self.subTest(name=name):
+                response = Client().get(reverse(name))
+                self.assertEqual(response["Cache-Control"], self.PUBLIC)
+
+    def test_not_found_is_not_public(self):
+        """Публичной политикой помечаются только удачные ответы."""
+        response = Client().get(
+            reverse("posts:group_list", kwargs={"slug": "missing"})
+        )
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response["Cache-Control"], self.REVALIDATE)
+
+    def test_pages_with_csrf_token_are_not_public(self):
+        """Страница с {% csrf_token %} не уходит в общий кэш."""
+        with mock.patch.dict(
+            "core.middleware.CACHE_POLICIES", {"users:signup": PUBLIC}
+        ):
+            response = Client().get(reverse("users:signup"))
+        self.assertIn(settings.CSRF_COOKIE_NAME, response.cookies)
+        self.assertEqual(response["Cache-Control"], self.REVALIDATE)
+
+    def test_views_own_headers_are_kept(self):
+        """Свои заголовки вида (never_cache у входа) не перезаписываются."""
+        response = Client().get(reverse("users:login"))
+        self.assertIn("max-age=0", response["Cache-Control"])
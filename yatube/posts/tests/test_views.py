@@ -1,16 +1,33 @@
+import base64
+import os
+import shutil
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
+
 from django import forms
 from django.contrib.auth import get_user_model
-from django.test import Client, TestCase
+from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
 
-from ..models import Group, Post, Follow
+from .. import cache, images, thumbnails, timeline, variants
+from ..models import (
+    Comment, Group, Post, PostImageVariant, Follow, StoredFile,
+    ThumbnailJob, TimelineEntry,
+)
 
 TEST_OF_POST: int = 13
 User = get_user_model()
+TEMP_MEDIA_ROOT = tempfile.mkdtemp(dir=settings.BASE_DIR)
 
 
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
 class PostsViewsTests(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -57,6 +74,11 @@ class PostsViewsTests(TestCase):
             )
         }
 
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
     def setUp(self):
         self.authorized_client = Client()
         self.authorized_client.force_login(self.user)
@@ -220,6 +242,76 @@ class PostsPaginatorViewsTests(TestCase):
         count_posts = len(response.context['page_obj'])
         self.assertEqual(count_posts, TEST_OF_POST % settings.POST_PER_PAGE)
 
+    def test_cursor_pages_match_numbered_pages(self):
+        """Курсор ?after= отдаёт те же записи, что и вторая страница."""
+        first_page = self.authorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        numbered = self.authorized_client.get(
+            reverse('posts:index') + '?page=2').context['page_obj']
+        cursor = self.authorized_client.get(
+            reverse('posts:index') + f'?after={first_page.next_cursor}'
+        ).context['page_obj']
+        self.assertTrue(cursor.is_cursor)
+        self.assertEqual(list(cursor), list(numbered))
+        self.assertFalse(cursor.has_next())
+        self.assertTrue(cursor.has_previous())
+
+    def test_cursor_before_returns_previous_page(self):
+        """Курсор ?before= возвращает на предыдущую страницу."""
+        first_page = self.authorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        second_page = self.authorized_client.get(
+            reverse('posts:index') + '?page=2').context['page_obj']
+        response = self.authorized_client.get(
+            reverse('posts:index')
+            + f'?before={second_page.previous_cursor}'
+        )
+        self.assertEqual(list(response.context['page_obj']), list(first_page))
+
+    def test_cursor_mode_skips_count(self):
+        """Курсорная страница не выполняет COUNT(*)."""
+        first_page = self.authorized_client.get(
+            reverse('posts:index')).context['page_obj']
+        with CaptureQueriesContext(connection) as queries:
+            self.authorized_client.get(
+                reverse('posts:index') + f'?after={first_page.next_cursor}')
+        self.assertFalse(
+            any('COUNT(' in query['sql'] for query in queries.captured_queries)
+        )
+
+    def test_deep_page_number_is_not_served_by_offset(self):
+        """Номер за пределом нумерации открывает последнюю нумерованную."""
+        with mock.patch('posts.utils.PAGINATOR_NUMBERED_PAGES', 1), \
+                CaptureQueriesContext(connection) as queries:
+            response = self.authorized_client.get(
+                reverse('posts:index') + '?page=2')
+        page = response.context['page_obj']
+        self.assertEqual(page.number, 1)
+        self.assertFalse(page.has_numbered_next)
+        self.assertContains(response, f'?after={page.next_cursor}')
+        self.assertNotContains(response, '?page=2')
+        count, = [
+            query['sql'] for query in queries.captured_queries
+            if 'COUNT(' in query['sql']
+        ]
+        self.assertIn('LIMIT 11', count)
+
+    def test_page_number_below_one_opens_first_page(self):
+        """?page=0 и отрицательный номер открывают первую страницу."""
+        for number in ('0', '-3'):
+            with self.subTest(number=number):
+                page = self.authorized_client.get(
+                    reverse('posts:index') + f'?page={number}'
+                ).context['page_obj']
+                self.assertEqual(page.number, 1)
+
+    def test_broken_cursor_falls_back_to_first_page(self):
+        """Испорченный токен открывает первую страницу."""
+        response = self.authorized_client.get(
+            reverse('posts:index') + '?after=broken')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['page_obj'].number, 1)
+
 
 class FollowViewsTest(TestCase):
     @classmethod
@@ -286,3 +378,788 @@ class FollowViewsTest(TestCase):
         response = self.author_client.get(
             reverse('posts:follow_index'))
         self.assertNotIn(post, response.context['page_obj'].object_list)
+
+
+class FeedQueryCountTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='feed_author')
+        cls.reader = User.objects.create_user(username='feed_reader')
+        cls.group = Group.objects.create(
+            title='Группа ленты',
+            slug='feed-group',
+            description='Тестовое описание',
+        )
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.feed_urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': cls.author.username}),
+            reverse('posts:follow_index'),
+        )
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        return len(queries)
+
+    def test_feed_queries_do_not_depend_on_page_size(self):
+        """Число запросов ленты не растёт вместе с числом постов."""
+        Post.objects.create(
+            text='Первый пост', author=self.author, group=self.group)
+        expected = {url: self.count_queries(url) for url in self.feed_urls}
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=self.author, group=self.group)
+            for i in range(settings.POST_PER_PAGE - 1)
+        )
+        call_command('reconcile_counters', stdout=StringIO())
+        for url in self.feed_urls:
+            with self.subTest(url=url):
+                self.assertEqual(self.count_queries(url), expected[url])
+
+
+class TimelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='timeline_author')
+        cls.reader = User.objects.create_user(username='timeline_reader')
+
+    def setUp(self):
+        self.client.force_login(self.reader)
+
+    def follow_page(self):
+        response = self.client.get(reverse('posts:follow_index'))
+        return list(response.context['page_obj'])
+
+    def test_new_post_is_fanned_out_to_followers(self):
+        """Новый пост попадает в ленты подписчиков при записи."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Новый пост')
+        self.assertTrue(
+            TimelineEntry.objects.filter(user=self.reader, post=post).exists()
+        )
+        self.assertEqual(self.follow_page(), [post])
+
+    def test_follow_backfills_and_unfollow_trims(self):
+        """Подписка заполняет ленту, отписка её очищает."""
+        post = Post.objects.create(author=self.author, text='Старый пост')
+        self.client.get(reverse(
+            'posts:profile_follow',
+            kwargs={'username': self.author.username}))
+        self.assertEqual(self.follow_page(), [post])
+        self.client.get(reverse(
+            'posts:profile_unfollow',
+            kwargs={'username': self.author.username}))
+        self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+        self.assertEqual(self.follow_page(), [])
+
+    def test_cursor_pages_have_unique_posts(self):
+        """Курсорные страницы ленты не повторяют посты других читателей."""
+        for i in range(3):
+            Follow.objects.create(
+                user=User.objects.create_user(username=f'other_reader_{i}'),
+                author=self.author,
+            )
+        Follow.objects.create(user=self.reader, author=self.author)
+        posts = [
+            Post.objects.create(author=self.author, text=f'Пост {i}')
+            for i in range(settings.POST_PER_PAGE * 2 + 5)
+        ]
+        expected = [post.pk for post in reversed(posts)]
+        url = reverse('posts:follow_index')
+        page = self.client.get(url).context['page_obj']
+        seen = [post.pk for post in page]
+        while page.has_next():
+            page = self.client.get(
+                url, {'after': page.next_cursor}).context['page_obj']
+            seen.extend(post.pk for post in page)
+        self.assertEqual(seen, expected)
+        back = self.client.get(
+            url, {'before': page.previous_cursor}).context['page_obj']
+        self.assertEqual(
+            [post.pk for post in back],
+            expected[-len(page) - settings.POST_PER_PAGE:-len(page)],
+        )
+
+    def test_failed_rebuild_keeps_timeline(self):
+        """Пересборка идёт одной транзакцией: при сбое лента остаётся."""
+        Follow.objects.create(user=self.reader, author=self.author)
+        post = Post.objects.create(author=self.author, text='Пост')
+        with mock.patch('posts.timeline.backfill', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                timeline.rebuild(self.reader.pk)
+        self.assertEqual(self.follow_page(), [post])
+
+    def test_popular_author_is_read_on_demand(self):
+        """Посты авторов сверх лимита подмешиваются при чтении."""
+        with mock.patch('posts.timeline.TIMELINE_FANOUT_LIMIT', 0):
+            Follow.objects.create(user=self.reader, author=self.author)
+            post = Post.objects.create(author=self.author, text='Пост')
+            self.assertFalse(TimelineEntry.objects.filter(user=self.reader))
+            self.assertEqual(self.follow_page(), [post])
+
+
+@override_settings(
+    POSTS_PAGE_CACHE_ENABLED=True,
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'pages': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'test-pages',
+        },
+        'page_versions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'test-pages-versions',
+        },
+    },
+)
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='cache_author')
+        cls.group = Group.objects.create(
+            title='Группа кэша',
+            slug='cache-group',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Закэшированный пост', group=cls.group)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': cls.author.username}),
+        )
+
+    def setUp(self):
+        cache.page_cache().clear()
+        cache.version_cache().clear()
+
+    def test_anonymous_pages_are_cached(self):
+        """Повторный запрос анонима отдаётся из кэша без запросов к БД."""
+        before = cache.stats()
+        for url in self.urls:
+            with self.subTest(url=url):
+                self.assertEqual(
+                    self.client.get(url)['X-Page-Cache'], 'MISS')
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'HIT')
+                self.assertLessEqual(len(queries), 1)
+        after = cache.stats()
+        self.assertEqual(after['hit'] - before['hit'], 3)
+        self.assertEqual(after['miss'] - before['miss'], 3)
+
+    def test_new_post_and_comment_invalidate_pages(self):
+        """Новый пост и комментарий сразу сбрасывают страницы."""
+        for url in self.urls:
+            self.client.get(url)
+        post = Post.objects.create(
+            author=self.author, text='Свежий пост', group=self.group)
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'MISS')
+                self.assertContains(response, post.text)
+        Comment.objects.create(post=post, author=self.author, text='Ответ')
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'MISS')
+
+    def test_evicting_pages_keeps_versions(self):
+        """Вытеснение страниц не меняет версии областей."""
+        versions = cache.get_versions([cache.FEED_SCOPE])
+        cache.page_cache().clear()
+        self.assertEqual(cache.get_versions([cache.FEED_SCOPE]), versions)
+
+    def test_authorized_pages_are_not_cached(self):
+        """Страницы авторизованных пользователей не кэшируются."""
+        self.client.force_login(self.author)
+        response = self.client.get(reverse('posts:index'))
+        self.assertFalse(response.has_header('X-Page-Cache'))
+
+
+@override_settings(
+    CACHES={
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        },
+        'pages': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'test-validators',
+        },
+        'page_versions': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'test-validators-versions',
+        },
+    },
+)
+class ConditionalGetTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='etag_author')
+        cls.reader = User.objects.create_user(username='etag_reader')
+        cls.group = Group.objects.create(
+            title='Группа валидаторов',
+            slug='etag-group',
+            description='Тестовое описание',
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, text='Пост с ETag', group=cls.group)
+        Follow.objects.create(user=cls.reader, author=cls.author)
+        cls.urls = (
+            reverse('posts:index'),
+            reverse('posts:group_list', kwargs={'slug': cls.group.slug}),
+            reverse('posts:profile',
+                    kwargs={'username': cls.author.username}),
+            reverse('posts:post_detail', kwargs={'post_id': cls.post.pk}),
+        )
+
+    def setUp(self):
+        cache.page_cache().clear()
+        cache.version_cache().clear()
+
+    def revalidate(self, url, response, client=None):
+        return (client or self.client).get(
+            url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_unchanged_page_is_not_modified(self):
+        """Совпавший ETag — 304 без запросов страницы и шаблона."""
+        for url in self.urls:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertIn('Last-Modified', response)
+                with CaptureQueriesContext(connection) as queries:
+                    revalidated = self.revalidate(url, response)
+                self.assertEqual(revalidated.status_code, 304)
+                self.assertEqual(revalidated.content, b'')
+                # Группа, автор и пост ищутся по ключу, выборки постов нет.
+                self.assertLessEqual(len(queries), 1)
+                modified_since = self.client.get(
+                    url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+                self.assertEqual(modified_since.status_code, 304)
+
+    def test_changes_invalidate_validators(self):
+        """Новый пост и комментарий меняют ETag затронутых страниц."""
+        responses = {url: self.client.get(url) for url in self.urls}
+        Comment.objects.create(
+            post=self.post, author=self.reader, text='Комментарий')
+        for url, response in responses.items():
+            with self.subTest(url=url):
+                self.assertEqual(self.revalidate(url, response).status_code,
+                                 200)
+
+        other_group = Group.objects.create(
+            title='Другая группа', slug='etag-other')
+        responses = {url: self.client.get(url) for url in self.urls}
+        Post.objects.create(
+            author=self.reader, text='Чужой пост', group=other_group)
+        statuses = {
+            url: self.revalidate(url, response).status_code
+            for url, response in responses.items()
+        }
+        self.assertEqual(statuses, {
+            self.urls[0]: 200,
+            self.urls[1]: 304,
+            self.urls[2]: 304,
+            self.urls[3]: 304,
+        })
+
+    def test_follow_feed_depends_on_user_and_follows(self):
+        """Лента подписок различается по пользователю и подпискам."""
+        url = reverse('posts:follow_index')
+        reader = Client()
+        reader.force_login(self.reader)
+        response = reader.get(url)
+        self.assertEqual(self.revalidate(url, response, reader).status_code,
+                         304)
+        author = Client()
+        author.force_login(self.author)
+        self.assertEqual(self.revalidate(url, response, author).status_code,
+                         200)
+        other = User.objects.create_user(username='etag_other_author')
+        Follow.objects.create(user=self.reader, author=other)
+        self.assertEqual(self.revalidate(url, response, reader).status_code,
+                         200)
+
+    def test_missing_page_has_no_validators(self):
+        """Для несуществующей группы валидаторов нет, отдаётся 404."""
+        response = self.client.get(
+            reverse('posts:group_list', kwargs={'slug': 'no-such-group'}))
+        self.assertEqual(response.status_code, 404)
+        self.assertNotIn('ETag', response)
+
+
+class PostCommentsTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='comment_author')
+        cls.post = Post.objects.create(author=cls.author, text='Пост')
+        cls.other_post = Post.objects.create(
+            author=cls.author, text='Другой пост')
+        Comment.objects.create(
+            post=cls.other_post, author=cls.author, text='Чужой')
+        for i in range(settings.COMMENTS_PER_PAGE + 5):
+            Comment.objects.create(
+                post=cls.post, author=cls.author, text=f'Комментарий {i}')
+        cls.url = reverse('posts:post_detail', kwargs={'post_id': cls.post.pk})
+        cls.fragment_url = reverse(
+            'posts:post_comments', kwargs={'post_id': cls.post.pk})
+
+    def test_only_own_comments_are_shown(self):
+        """На странице поста только его комментарии, первая страница."""
+        comments = self.client.get(self.url).context['comments']
+        self.assertEqual(len(comments), settings.COMMENTS_PER_PAGE)
+        self.assertTrue(all(c.post_id == self.post.pk for c in comments))
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        self.assertTrue(comments.has_next())
+
+    def test_newest_order(self):
+        """?order=newest показывает сначала новые комментарии."""
+        comments = self.client.get(
+            self.url + '?order=newest').context['comments']
+        self.assertEqual(
+            comments[0].text,
+            f'Комментарий {settings.COMMENTS_PER_PAGE + 4}',
+        )
+
+    def test_next_page_as_json(self):
+        """JSON-эндпоинт отдаёт следующую страницу по курсору."""
+        first = self.client.get(self.url).context['comments']
+        response = self.client.get(
+            self.fragment_url,
+            {'format': 'json', 'after': first.next_cursor},
+        )
+        data = response.json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertEqual(data['comments'][0]['text'], 'Комментарий 20')
+        self.assertIsNone(data['next'])
+
+    def test_next_page_as_fragment(self):
+        """HTML-фрагмент рендерится без страницы поста."""
+        first = self.client.get(self.url).context['comments']
+        response = self.client.get(
+            self.fragment_url, {'after': first.next_cursor})
+        self.assertTemplateUsed(response, 'posts/includes/comments.html')
+        self.assertTemplateNotUsed(response, 'posts/post_detail.html')
+        self.assertContains(response, 'Комментарий 24')
+
+    def test_stale_counter_does_not_hide_comments(self):
+        """Отставший счётчик не прячет комментарии и следующую страницу."""
+        Post.objects.filter(pk=self.post.pk).update(comments_count=0)
+        comments = self.client.get(self.url).context['comments']
+        self.assertEqual(len(comments), settings.COMMENTS_PER_PAGE)
+        self.assertTrue(comments.has_next())
+
+    def test_comment_queries_do_not_depend_on_comment_count(self):
+        """Число запросов не зависит от количества комментариев."""
+        with CaptureQueriesContext(connection) as full_page:
+            self.client.get(self.url)
+        with CaptureQueriesContext(connection) as short_page:
+            self.client.get(reverse(
+                'posts:post_detail',
+                kwargs={'post_id': self.other_post.pk}))
+        self.assertEqual(len(full_page), len(short_page))
+
+
+class GroupFeedTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='group_author')
+        cls.group = Group.objects.create(
+            title='Большая группа',
+            slug='big-group',
+            description='Тестовое описание',
+        )
+        cls.other_group = Group.objects.create(
+            title='Другая группа',
+            slug='other-group',
+            description='Тестовое описание',
+        )
+        Post.objects.bulk_create(
+            Post(text=f'Пост {i}', author=cls.author, group=cls.group)
+            for i in range(settings.POST_PER_PAGE + 3)
+        )
+        call_command('reconcile_counters', stdout=StringIO())
+        cls.foreign_post = Post.objects.create(
+            text='Пост другой группы', author=cls.author,
+            group=cls.other_group)
+        cls.url = reverse('posts:group_list', kwargs={'slug': 'big-group'})
+
+    @staticmethod
+    def explain(sql):
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def feed_query_plan(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        feed_queries = [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT')
+            and 'FROM "posts_post"' in query['sql']
+            and 'LIMIT' in query['sql']
+        ]
+        self.assertEqual(len(feed_queries), 1)
+        return response, self.explain(feed_queries[0])
+
+    def test_group_feed_contains_only_group_posts(self):
+        """Лента группы не содержит постов других групп."""
+        page_obj = self.client.get(self.url).context['page_obj']
+        self.assertTrue(all(post.group_id == self.group.pk
+                            for post in page_obj))
+        self.assertEqual(page_obj.paginator.num_pages, 2)
+
+    def test_stale_counter_does_not_hide_posts(self):
+        """Счётчик группы меньше настоящего: посты и ссылка дальше есть."""
+        Group.objects.filter(pk=self.group.pk).update(posts_count=1)
+        response = self.client.get(self.url)
+        page_obj = response.context['page_obj']
+        self.assertEqual(len(page_obj), settings.POST_PER_PAGE)
+        self.assertTrue(page_obj.has_next())
+        self.assertContains(response, '?page=2')
+        second = self.client.get(self.url + '?page=2').context['page_obj']
+        self.assertEqual(second.number, 2)
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+
+    @skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN SQLite')
+    def test_group_feed_uses_composite_index(self):
+        """Первая и курсорная страницы читаются по индексу группы."""
+        response, first_plan = self.feed_query_plan(self.url)
+        next_cursor = response.context['page_obj'].next_cursor
+        _, cursor_plan = self.feed_query_plan(
+            self.url + f'?after={next_cursor}')
+        for plan in (first_plan, cursor_plan):
+            with self.subTest(plan=plan):
+                self.assertTrue(any(
+                    'posts_post USING INDEX post_group_pub_date_idx' in step
+                    for step in plan
+                ))
+                self.assertFalse(any(
+                    step.startswith('SCAN') or 'TEMP B-TREE' in step
+                    for step in plan
+                ))
+        self.assertIn('pub_date<', ' '.join(cursor_plan))
+
+
+@skipUnless(connection.vendor == 'sqlite', 'Индекс FTS5 есть только в SQLite')
+class SearchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='search_author')
+        cls.strong = Post.objects.create(
+            author=cls.author, text='Котики, котики, котики')
+        cls.weak = Post.objects.create(
+            author=cls.author, text='Котики и длинный рассказ о погоде')
+        Post.objects.create(author=cls.author, text='Про собак')
+        cls.url = reverse('posts:search')
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {'q': query, **params})
+        return response.context['page_obj']
+
+    def test_results_are_ranked_by_bm25(self):
+        """Пост с большим числом совпадений выше, лишние не попадают."""
+        self.assertEqual(
+            [post.pk for post in self.search('котики')],
+            [self.strong.pk, self.weak.pk],
+        )
+
+    def test_query_syntax_is_escaped(self):
+        """Операторы FTS5 и кавычки из запроса не ломают поиск."""
+        self.assertEqual(
+            len(self.search('котики" OR NEAR(собак')), 0)
+        self.assertEqual(len(self.search('"*:')), 0)
+
+    def test_index_follows_post_changes(self):
+        """Правка и удаление поста сразу видны в поиске."""
+        post = Post.objects.create(author=self.author, text='Ёжик')
+        self.assertEqual(len(self.search('ёжик')), 1)
+        post.text = 'Черепаха'
+        post.save()
+        self.assertEqual(len(self.search('ёжик')), 0)
+        self.assertEqual(len(self.search('черепаха')), 1)
+        post.delete()
+        self.assertEqual(len(self.search('черепаха')), 0)
+
+    def test_cursor_pagination(self):
+        """Страницы результатов идут по курсору без COUNT(*)."""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Закат {i}')
+            for i in range(settings.POST_PER_PAGE + 3)
+        )
+        call_command('rebuild_search_index', stdout=StringIO())
+        with CaptureQueriesContext(connection) as queries:
+            first = self.search('закат')
+        self.assertFalse(any(
+            'COUNT(' in query['sql'] for query in queries.captured_queries))
+        self.assertEqual(len(first), settings.POST_PER_PAGE)
+        self.assertTrue(first.has_next())
+        self.assertFalse(first.has_previous())
+        second = self.search('закат', after=first.next_cursor)
+        self.assertEqual(len(second), 3)
+        self.assertFalse(second.has_next())
+        seen = {post.pk for post in first} | {post.pk for post in second}
+        self.assertEqual(len(seen), settings.POST_PER_PAGE + 3)
+        back = self.search('закат', before=second.previous_cursor)
+        self.assertEqual(list(back), list(first))
+
+    def test_rebuild_command_indexes_existing_posts(self):
+        """Команда заполняет индекс постами, созданными в обход сигналов."""
+        Post.objects.bulk_create([Post(author=self.author, text='Радуга')])
+        self.assertEqual(len(self.search('радуга')), 0)
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(len(self.search('радуга')), 1)
+        self.assertEqual(len(self.search('котики')), 2)
+
+    def test_admin_search_uses_index(self):
+        """Поиск в админке идёт через MATCH, а не LIKE."""
+        admin = User.objects.create_superuser(
+            'search_admin', 'admin@example.com', 'password')
+        self.client.force_login(admin)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse('admin:posts_post_changelist'), {'q': 'котики'})
+        self.assertEqual(response.context['cl'].result_count, 2)
+        sql = ' '.join(query['sql'] for query in queries.captured_queries)
+        self.assertIn('MATCH', sql)
+        self.assertNotIn('LIKE', sql)
+
+
+@override_settings(MEDIA_ROOT=TEMP_MEDIA_ROOT)
+class ThumbnailPipelineTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='thumbnail_author')
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(TEMP_MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @staticmethod
+    def png(name, size=(1200, 800)):
+        content = BytesIO()
+        Image.new('RGB', size, (200, 30, 30)).save(content, 'PNG')
+        return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+    def create_post(self, image):
+        return Post.objects.create(
+            author=self.author, text='С картинкой', image=image)
+
+    def run_worker(self):
+        stderr = StringIO()
+        call_command(
+            'thumbnail_worker', '--once', '--workers=1',
+            stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def detail(self, post):
+        return self.client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+
+    def test_placeholder_until_worker_runs(self):
+        """Страница не рисует миниатюру сама, пока её нет — заглушка."""
+        post = self.create_post(self.png('first.png'))
+        job = ThumbnailJob.objects.get(image=post.image.name)
+        self.assertEqual(job.status, ThumbnailJob.PENDING)
+        response = self.detail(post)
+        self.assertContains(response, 'aspect-ratio: 960 / 339')
+        self.assertFalse(os.path.exists(
+            os.path.join(TEMP_MEDIA_ROOT, 'cache')))
+
+    @skipUnless(
+        hasattr(Image, 'ANTIALIAS'), 'sorl-thumbnail 12.7 требует Pillow < 10')
+    def test_worker_generates_configured_thumbnails(self):
+        """После воркера страница отдаёт готовую миниатюру."""
+        post = self.create_post(self.png('second.png'))
+        self.assertEqual(self.run_worker(), '')
+        job = ThumbnailJob.objects.get(image=post.image.name)
+        self.assertEqual(job.status, ThumbnailJob.DONE)
+        self.assertTrue(PostImageVariant.objects.filter(
+            image=post.image.name).exists())
+        response = self.detail(post)
+        self.assertContains(response, 'width="960" height="339"')
+        self.assertNotContains(response, 'aspect-ratio')
+
+    def test_broken_image_is_retried_then_failed(self):
+        """Битая картинка возвращается в очередь, пока есть попытки."""
+        post = self.create_post(
+            SimpleUploadedFile('broken.png', b'not an image', 'image/png'))
+        job = ThumbnailJob.objects.get(image=post.image.name)
+        thumbnails.fail(job, 'ошибка')
+        job.refresh_from_db()
+        self.assertEqual(job.status, ThumbnailJob.PENDING)
+        self.assertEqual(job.attempts, 1)
+        self.assertIn(post.image.name, self.run_worker())
+        job.refresh_from_db()
+        self.assertEqual(job.status, ThumbnailJob.FAILED)
+        self.assertEqual(job.attempts, thumbnails.THUMBNAIL_MAX_ATTEMPTS)
+        self.assertContains(self.detail(post), 'aspect-ratio')
+
+    def test_variants_are_rendered_for_each_width_and_format(self):
+        """Варианты не шире исходника, в WebP и JPEG, с кадром 960x339."""
+        post = self.create_post(self.png('wide.png', size=(1000, 700)))
+        variants.store_variants(
+            post.image.name, variants.render_variants(post.image.name))
+        stored = PostImageVariant.objects.filter(image=post.image.name)
+        self.assertEqual(
+            sorted(stored.values_list('format', 'width', 'height')),
+            [
+                ('jpeg', 320, 113), ('jpeg', 640, 226), ('jpeg', 960, 339),
+                ('webp', 320, 113), ('webp', 640, 226), ('webp', 960, 339),
+            ],
+        )
+        for variant in stored:
+            with Image.open(variant.file.path) as image:
+                self.assertEqual(
+                    image.size, (variant.width, variant.height))
+                self.assertEqual(image.format, variant.format.upper())
+            self.assertEqual(variant.size, variant.file.size)
+
+    def test_small_image_is_not_upscaled(self):
+        """Картинка уже самой узкой ширины не увеличивается."""
+        post = self.create_post(self.png('small.png', size=(100, 80)))
+        variants.store_variants(
+            post.image.name, variants.render_variants(post.image.name))
+        stored = PostImageVariant.objects.filter(image=post.image.name)
+        self.assertEqual(
+            sorted(stored.values_list('format', 'width', 'height')),
+            [('jpeg', 100, 35), ('webp', 100, 35)],
+        )
+        self.assertEqual(variants.variant_widths(2000, 100), [283])
+        self.assertEqual(variants.variant_widths(2000, 300), [320, 640])
+
+    def test_detail_page_emits_picture_with_srcset(self):
+        """Страница строит <picture> по строкам модели."""
+        post = self.create_post(self.png('picture.png', size=(1600, 900)))
+        variants.store_variants(
+            post.image.name, variants.render_variants(post.image.name))
+        response = self.detail(post)
+        self.assertContains(response, '<source type="image/webp"')
+        self.assertContains(response, '_960.webp 960w')
+        self.assertContains(response, '_1280.jpg 1280w')
+        self.assertContains(response, 'width="960" height="339"')
+
+    def test_image_is_described_for_placeholders(self):
+        """Воркер записывает размеры, основной цвет и заглушку картинки."""
+        post = self.create_post(self.png('described.png', size=(900, 1300)))
+        image = variants.load(post.image.name)
+        variants.store_metadata(post.image.name, variants.describe(image))
+        stored = StoredFile.objects.get(name=post.image.name)
+        self.assertEqual((stored.width, stored.height), (900, 1300))
+        self.assertEqual(stored.dominant_color, '#c81e1e')
+        prefix, data = stored.placeholder.split(',')
+        self.assertEqual(prefix, 'data:image/jpeg;base64')
+        self.assertLess(len(data), 1024)
+        with Image.open(BytesIO(base64.b64decode(data))) as placeholder:
+            self.assertEqual(placeholder.size, (24, 8))
+
+        images.cache.clear()
+        response = self.detail(post)
+        self.assertContains(
+            response, 'aspect-ratio: 960 / 339; background: #c81e1e url(')
+        variants.store_variants(
+            post.image.name, variants.render_variants(post.image.name, image))
+        images.cache.clear()
+        response = self.detail(post)
+        self.assertContains(response, 'width="640" height="226"')
+        self.assertContains(
+            response, f'style="background: #c81e1e url({stored.placeholder})')
+
+    def test_claimed_jobs_are_not_claimed_twice(self):
+        """Захваченное задание не достаётся второму воркеру."""
+        self.create_post(self.png('third.png'))
+        self.assertEqual(len(thumbnails.claim(10)), 1)
+        self.assertEqual(thumbnails.claim(10), [])
+
+
+class PostImageBatchTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.author = User.objects.create_user(username='batch_author')
+
+    def setUp(self):
+        images.cache.clear()
+
+    def create_posts(self, count, with_variants=True):
+        posts = [
+            Post.objects.create(
+                author=self.author, text=f'Пост {i}',
+                image=f'posts/batch_{Post.objects.count()}_{i}.png')
+            for i in range(count)
+        ]
+        if with_variants:
+            for post in posts:
+                PostImageVariant.objects.create(
+                    image=post.image.name, format='jpeg', width=320,
+                    height=113, file=f'{post.image.name}_320.jpg', size=1)
+        return posts
+
+    def index_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('posts:index'))
+        return [query['sql'] for query in queries.captured_queries]
+
+    def test_page_images_resolved_in_one_query(self):
+        """Картинки всех постов страницы читаются одним запросом."""
+        self.create_posts(2)
+        few = self.index_queries()
+        images.cache.clear()
+        self.create_posts(settings.POST_PER_PAGE)
+        many = self.index_queries()
+        self.assertEqual(len(few), len(many))
+        self.assertEqual(
+            sum('posts_postimagevariant' in sql for sql in many), 1)
+
+    def test_ready_images_are_served_from_lru(self):
+        """Повторный показ готовых картинок не обращается к базе."""
+        self.create_posts(3)
+        self.index_queries()
+        self.assertFalse(any(
+            'posts_postimagevariant' in sql or 'thumbnail_kvstore' in sql
+            for sql in self.index_queries()
+        ))
+
+    def test_missing_images_fall_back_to_sorl_thumbnails(self):
+        """Без вариантов берётся миниатюра sorl, без неё — заглушка."""
+        ready, pending = self.create_posts(2, with_variants=False)
+        geometry, options = thumbnails.THUMBNAIL_PRESETS[images.IMAGE_PRESET]
+        thumbnail, _ = thumbnails.backend.thumbnail_file(
+            ready.image.name, geometry, options)
+        thumbnails.backend.store(
+            ready.image.name, (1200, 800), [(thumbnail.name, (960, 339))])
+        resolved = images.resolve([ready.image, pending.image])
+        self.assertEqual(
+            resolved[ready.image.name].thumbnail.name, thumbnail.name)
+        self.assertNotIn(pending.image.name, resolved)
+        self.assertNotIn(pending.image.name, images.cache.get_many(
+            [pending.image.name]))
+
+    def test_lru_is_bounded(self):
+        """LRU вытесняет самые давно прочитанные записи."""
+        lru = images.LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get_many(['a'])
+        lru.set('c', 3)
+        self.assertEqual(len(lru), 2)
+        self.assertEqual(lru.get_many(['a', 'b', 'c']), {'a': 1, 'c': 3})
@@ -0,0 +1,192 @@
+import uuid
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.utils import timezone
+from sorl.thumbnail import default
+from sorl.thumbnail.base import ThumbnailBackend
+from sorl.thumbnail.conf import defaults as sorl_defaults
+from sorl.thumbnail.conf import settings as sorl_settings
+from sorl.thumbnail.images import ImageFile
+
+from . import cache, variants
+from .models import Post, ThumbnailJob
+
+# Миниатюры, которые готовятся заранее: имя → (геометрия, опции sorl).
+THUMBNAIL_PRESETS = getattr(settings, "POSTS_THUMBNAIL_PRESETS", {
+    "card": ("960x339", {"crop": "center", "upscale": True}),
+})
+THUMBNAIL_MAX_ATTEMPTS = getattr(settings, "POSTS_THUMBNAIL_MAX_ATTEMPTS", 3)
+# Через сколько секунд задание зависшего воркера возвращается в очередь.
+THUMBNAIL_CLAIM_TIMEOUT = getattr(
+    settings, "POSTS_THUMBNAIL_CLAIM_TIMEOUT", 10 * 60
+)
+
+
+class PresetThumbnailBackend(ThumbnailBackend):
+    """Бэкенд sorl, в котором поиск, отрисовка и запись разделены.
+
+    Страница только ищет готовую миниатюру в KV-хранилище. Отрисовка
+    не обращается к базе и может идти в отдельном процессе, а запись
+    в KV-хранилище делает процесс, который раздаёт задания.
+    """
+
+    def thumbnail_file(self, file_, geometry, options):
+        """Миниатюра с тем же именем, что дал бы get_thumbnail."""
+
+        source = ImageFile(file_)
+        options = dict(options)
+        if sorl_settings.THUMBNAIL_PRESERVE_FORMAT:
+            options.setdefault("format", self._get_format(source))
+        for key, value in self.default_options.items():
+            options.setdefault(key, value)
+        for key, attr in self.extra_options:
+            value = getattr(sorl_settings, attr)
+            if value != getattr(sorl_defaults, attr):
+                options.setdefault(key, value)
+        name = self._get_thumbnail_filename(source, geometry, options)
+        return ImageFile(name, default.storage), options
+
+    def render(self, file_, presets):
+        """Рисует файлы миниатюр и возвращает их размеры."""
+
+        source_image = default.engine.get_image(ImageFile(file_))
+        try:
+            source_size = default.engine.get_image_size(source_image)
+            image_info = default.engine.get_image_info(source_image)
+            rendered = []
+            for geometry, options in presets:
+                thumbnail, options = self.thumbnail_file(
+                    file_, geometry, options
+                )
+                # Хранилище не перезаписывает файлы: готовую миниатюру
+                # оставляем и только читаем её размер.
+                if thumbnail.exists():
+                    thumbnail.set_size()
+                else:
+                    options["image_info"] = image_info
+                    self._create_thumbnail(
+                        source_image, geometry, options, thumbnail
+                    )
+                    self._create_alternative_resolutions(
+                        source_image, geometry, options, thumbnail.name
+                    )
+                rendered.append((thumbnail.name, thumbnail.size))
+        finally:
+            default.engine.cleanup(source_image)
+        return source_size, rendered
+
+    def store(self, file_, source_size, rendered):
+        """Записывает готовые миниатюры в KV-хранилище sorl."""
+
+        source = ImageFile(file_)
+        source.set_size(source_size)
+        default.kvstore.get_or_set(source)
+        for name, size in rendered:
+            thumbnail = ImageFile(name, default.storage)
+            thumbnail.set_size(size)
+            default.kvstore.set(thumbnail, source)
+
+
+backend = PresetThumbnailBackend()
+
+
+def enqueue(image_name):
+    """Ставит картинку в очередь, если её там ещё не было."""
+
+    ThumbnailJob.objects.bulk_create(
+        [ThumbnailJob(image=image_name)], ignore_conflicts=True
+    )
+
+
+def queue_depth():
+    return ThumbnailJob.objects.filter(status=ThumbnailJob.PENDING).count()
+
+
+def init_worker():
+    """Инициализация процесса пула: Django нужен для хранилища и sorl."""
+
+    django.setup()
+
+
+def render_image(image_name):
+    """Задание для процесса пула: миниатюры, варианты и описание картинки."""
+
+    source_size, rendered = backend.render(
+        image_name, THUMBNAIL_PRESETS.values()
+    )
+    image = variants.load(image_name)
+    return (
+        source_size,
+        rendered,
+        variants.render_variants(image_name, image),
+        variants.describe(image),
+    )
+
+
+def release_stale():
+    """Возвращает в очередь задания, которые воркер не успел закончить."""
+
+    deadline = timezone.now() - timedelta(seconds=THUMBNAIL_CLAIM_TIMEOUT)
+    return ThumbnailJob.objects.filter(
+        status=ThumbnailJob.RUNNING, updated__lt=deadline
+    ).update(status=ThumbnailJob.PENDING, claim_token="")
+
+
+def claim(limit):
+    """Забирает из очереди до limit заданий.
+
+    Задания помечаются токеном одним UPDATE с условием на статус,
+    поэтому параллельные воркеры не получают одно задание дважды.
+    """
+
+    ids = list(
+        ThumbnailJob.objects.filter(status=ThumbnailJob.PENDING)
+        .order_by("id")
+        .values_list("id", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+    token = uuid.uuid4().hex
+    ThumbnailJob.objects.filter(
+        pk__in=ids, status=ThumbnailJob.PENDING
+    ).update(
+        status=ThumbnailJob.RUNNING,
+        claim_token=token,
+        updated=timezone.now(),
+    )
+    return list(ThumbnailJob.objects.filter(claim_token=token).order_by("id"))
+
+
+def complete(job, source_size, rendered, image_variants, metadata):
+    backend.store(job.image, source_size, rendered)
+    variants.store_variants(job.image, image_variants)
+    variants.store_metadata(job.image, metadata)
+    ThumbnailJob.objects.filter(pk=job.pk).update(
+        status=ThumbnailJob.DONE,
+        claim_token="",
+        error="",
+        updated=timezone.now(),
+    )
+    # Заглушка на страницах сменилась картинкой.
+    for post in Post.objects.filter(image=job.image).values_list(
+        "pk", "author_id", "group_id"
+    ):
+        cache.bump_post_scopes(*post)
+
+
+def fail(job, error):
+    """Возвращает задание в очередь или помечает его проваленным."""
+
+    attempts = job.attempts + 1
+    status = ThumbnailJob.PENDING
+    if attempts >= THUMBNAIL_MAX_ATTEMPTS:
+        status = ThumbnailJob.FAILED
+    ThumbnailJob.objects.filter(pk=job.pk).update(
+        status=status,
+        attempts=attempts,
+        claim_token="",
+        error=error,
+        updated=timezone.now(),
+    )
@@ -0,0 +1,143 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .utils import FEED_ORDERING
+
+# Авторам с большим числом подписчиков посты не раскладываются по лентам,
+# их посты подмешиваются в ленту при чтении.
+TIMELINE_FANOUT_LIMIT = getattr(settings, "TIMELINE_FANOUT_LIMIT", 10000)
+TIMELINE_BACKFILL_SIZE = getattr(settings, "TIMELINE_BACKFILL_SIZE", 200)
+TIMELINE_BATCH_SIZE = getattr(settings, "TIMELINE_BATCH_SIZE", 1000)
+
+# Сортировка и курсор идут по аннотации feed_date: она берётся из того же
+# JOIN, что и условие на читателя. Условие курсора по
+# timeline_entries__pub_date в отдельном filter() добавило бы второй
+# JOIN по записям всех подписчиков, и пост повторился бы на странице
+# столько раз, сколько у автора подписчиков.
+TIMELINE_ORDERING = ("-feed_date", "-id")
+TIMELINE_CURSOR_ATTRS = ("feed_date", "id")
+
+
+def is_fanout_author(author_id):
+    """Посты автора раскладываются по лентам подписчиков при записи."""
+
+    followers = (
+        UserStats.objects.filter(user_id=author_id)
+        .values_list("followers_count", flat=True)
+        .first()
+    )
+    return (followers or 0) <= TIMELINE_FANOUT_LIMIT
+
+
+def _entries(user_id, posts):
+    return [
+        TimelineEntry(
+            user_id=user_id,
+            post_id=post_id,
+            author_id=author_id,
+            pub_date=pub_date,
+        )
+        for post_id, author_id, pub_date in posts
+    ]
+
+
+def fan_out_post(post):
+    """Добавляет новый пост в ленты подписчиков автора пачками."""
+
+    if not is_fanout_author(post.author_id):
+        return 0
+    written = 0
+    last_user_id = 0
+    while True:
+        follower_ids = list(
+            Follow.objects.filter(
+                author_id=post.author_id, user_id__gt=last_user_id
+            )
+            .order_by("user_id")
+            .values_list("user_id", flat=True)[:TIMELINE_BATCH_SIZE]
+        )
+        if not follower_ids:
+            return written
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(
+                    user_id=user_id,
+                    post_id=post.pk,
+                    author_id=post.author_id,
+                    pub_date=post.pub_date,
+                )
+                for user_id in follower_ids
+            ],
+            ignore_conflicts=True,
+        )
+        written += len(follower_ids)
+        last_user_id = follower_ids[-1]
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту свежие посты автора после подписки."""
+
+    if not is_fanout_author(author_id):
+        return 0
+    posts = (
+        Post.objects.filter(author_id=author_id)
+        .order_by(*FEED_ORDERING)
+        .values_list("pk", "author_id", "pub_date")[:TIMELINE_BACKFILL_SIZE]
+    )
+    entries = _entries(user_id, posts)
+    TimelineEntry.objects.bulk_create(entries, ignore_conflicts=True)
+    return len(entries)
+
+
+def trim(user_id, author_id):
+    """Убирает из ленты посты автора после отписки."""
+
+    TimelineEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def follow_feed(user):
+    """Посты ленты подписок и параметры их курсорной сортировки.
+
+    Если пользователь не подписан на авторов с огромным числом
+    подписчиков, лента читается только из TimelineEntry. Иначе посты
+    таких авторов подмешиваются при чтении.
+    """
+
+    posts = Post.objects.for_feed()
+    celebrity_ids = list(
+        Follow.objects.filter(
+            user=user,
+            author__stats__followers_count__gt=TIMELINE_FANOUT_LIMIT,
+        ).values_list("author_id", flat=True)
+    )
+    if not celebrity_ids:
+        return (
+            posts.filter(timeline_entries__user=user).annotate(
+                feed_date=F("timeline_entries__pub_date")
+            ),
+            TIMELINE_ORDERING,
+            TIMELINE_CURSOR_ATTRS,
+        )
+    own_posts = TimelineEntry.objects.filter(user=user).values("post_id")
+    return (
+        posts.filter(Q(pk__in=own_posts) | Q(author_id__in=celebrity_ids)),
+        FEED_ORDERING,
+        None,
+    )
+
+
+@transaction.atomic
+def rebuild(user_id):
+    """Собирает ленту пользователя заново по его подпискам.
+
+    Удаление и заполнение идут одной транзакцией: читатель не увидит
+    пустую или недособранную ленту.
+    """
+
+    TimelineEntry.objects.filter(user_id=user_id).delete()
+    author_ids = Follow.objects.filter(user_id=user_id).values_list(
+        "author_id", flat=True
+    )
+    return sum(backfill(user_id, author_id) for author_id in author_ids)
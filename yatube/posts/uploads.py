@@ -0,0 +1,126 @@
+from tempfile import SpooledTemporaryFile
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import UploadedFile
+from django.core.files.uploadhandler import (
+    StopUpload,
+    TemporaryFileUploadHandler,
+)
+from django.template.defaultfilters import filesizeformat
+from PIL import Image, ImageOps
+
+MAX_UPLOAD_SIZE = getattr(
+    settings, "POSTS_IMAGE_MAX_UPLOAD_SIZE", 20 * 1024 * 1024
+)
+MAX_PIXELS = getattr(settings, "POSTS_IMAGE_MAX_PIXELS", 40_000_000)
+# Длинная сторона оригинала; картинки больше пережимаются.
+MAX_DIMENSION = getattr(settings, "POSTS_IMAGE_MAX_DIMENSION", 2560)
+# Форматы, которые можно пережать без потери анимации.
+REENCODE_OPTIONS = {
+    "JPEG": {"quality": 85, "optimize": True, "progressive": True},
+    "PNG": {"optimize": True},
+    "WEBP": {"quality": 85},
+}
+
+
+class LimitedTemporaryFileUploadHandler(TemporaryFileUploadHandler):
+    """Пишет загрузку во временный файл, но не дальше лимита.
+
+    На первом куске сверх лимита разбор запроса прекращается, а остаток
+    тела не читается. Файл запоминается в request.oversized_uploads
+    с полученным размером: форма отклонит его по request_files.
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.received = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        if self.received > MAX_UPLOAD_SIZE:
+            oversized = getattr(self.request, "oversized_uploads", {})
+            oversized[self.field_name] = UploadedFile(
+                name=self.file_name,
+                content_type=self.content_type,
+                size=self.received,
+            )
+            self.request.oversized_uploads = oversized
+            raise StopUpload(connection_reset=True)
+        return super().receive_data_chunk(raw_data, start)
+
+
+def request_files(request):
+    """request.FILES вместе с файлами, загрузка которых была прервана."""
+
+    oversized = getattr(request, "oversized_uploads", None)
+    if not oversized:
+        return request.FILES
+    files = request.FILES.copy()
+    files.update(oversized)
+    return files
+
+
+def _reencode(upload, image, format_name):
+    """Уменьшает картинку и сохраняет её заново без EXIF."""
+
+    target = (MAX_DIMENSION, MAX_DIMENSION)
+    # Для JPEG декодер сразу уменьшает картинку в 2, 4 или 8 раз, но
+    # только пока обе стороны не меньше запрошенных. Поэтому просим
+    # размер, который получится после thumbnail, а не квадрат.
+    width, height = image.size
+    scale = min(1, MAX_DIMENSION / max(width, height))
+    image.draft(
+        image.mode,
+        (max(1, int(width * scale)), max(1, int(height * scale))),
+    )
+    image = ImageOps.exif_transpose(image)
+    image.thumbnail(target, Image.LANCZOS)
+    # PNG сохраняет EXIF из info, если его не убрать явно.
+    image.info.pop("exif", None)
+
+    if format_name == "JPEG" and image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    content = SpooledTemporaryFile(
+        max_size=settings.FILE_UPLOAD_MAX_MEMORY_SIZE
+    )
+    image.save(content, format_name, **REENCODE_OPTIONS[format_name])
+    size = content.tell()
+    content.seek(0)
+    return UploadedFile(content, upload.name, upload.content_type, size)
+
+
+def check_size(upload):
+    if upload.size > MAX_UPLOAD_SIZE:
+        raise ValidationError(
+            "Файл больше %(limit)s.",
+            code="file_too_large",
+            params={"limit": filesizeformat(MAX_UPLOAD_SIZE)},
+        )
+
+
+def process_image(upload):
+    """Проверяет загруженную картинку и при необходимости пережимает её.
+
+    Число пикселей проверяется до декодирования: Pillow читает только
+    заголовок. Большие картинки и картинки с EXIF сохраняются заново,
+    остальные остаются как есть.
+    """
+
+    check_size(upload)
+    upload.seek(0)
+    with Image.open(upload) as image:
+        width, height = image.size
+        if width * height > MAX_PIXELS:
+            raise ValidationError(
+                "Картинка больше %(limit)s мегапикселей.",
+                code="too_many_pixels",
+                params={"limit": f"{MAX_PIXELS / 1_000_000:g}"},
+            )
+        needs_reencode = image.format in REENCODE_OPTIONS and (
+            max(width, height) > MAX_DIMENSION or image.getexif()
+        )
+        if needs_reencode:
+            return _reencode(upload, image, image.format)
+    upload.seek(0)
+    return upload
@@ -1,12 +1,333 @@
+import binascii
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+
 from django.conf import settings
-from django.core.paginator import Paginator
+from django.core.exceptions import ValidationError
+from django.core.paginator import EmptyPage, Page, Paginator
+from django.db import connections
+from django.db.models import Max, Q
+from django.utils.functional import cached_property
 
 POST_PER_PAGE = getattr(settings, "POST_PER_PAGE", None)
+COMMENTS_PER_PAGE = getattr(settings, "COMMENTS_PER_PAGE", 20)
+PAGINATOR_NUMBERED_PAGES = getattr(settings, "PAGINATOR_NUMBERED_PAGES", 10)
+ESTIMATED_COUNT_LIMIT = getattr(settings, "ESTIMATED_COUNT_LIMIT", 10000)
+FEED_ORDERING = ("-pub_date", "-id")
+COMMENTS_ORDERINGS = {
+    "oldest": ("created", "id"),
+    "newest": ("-created", "-id"),
+}
+
+CURSOR_SEPARATOR = "|"
+
+
+def encode_cursor(values):
+    """Упаковывает значения ключа сортировки в непрозрачный токен."""
+
+    raw = CURSOR_SEPARATOR.join(
+        value.isoformat() if hasattr(value, "isoformat") else str(value)
+        for value in values
+    )
+    return urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(token, fields):
+    """Распаковывает токен в значения полей или возвращает None."""
+
+    padded = token + "=" * (-len(token) % 4)
+    try:
+        raw = urlsafe_b64decode(padded.encode()).decode()
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    parts = raw.split(CURSOR_SEPARATOR)
+    if len(parts) != len(fields):
+        return None
+    try:
+        values = [field.to_python(part) for field, part in zip(fields, parts)]
+    except ValidationError:
+        return None
+    if any(value is None for value in values):
+        return None
+    return values
+
+
+class CursorPage(Page):
+    """Страница курсорного режима.
+
+    Номер страницы неизвестен (number is None), а наличие соседних
+    страниц определяется без COUNT(*).
+    """
+
+    def __init__(self, object_list, paginator, has_next, has_previous):
+        super().__init__(object_list, None, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        return "<Cursor page>"
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+
+class CursorPaginator(Paginator):
+    """Пагинатор с номерами для первых страниц и курсорами для остальных.
+
+    Курсор строится по паре полей сортировки (по умолчанию pub_date, id),
+    поэтому глубокие страницы читаются диапазоном по индексу
+    без COUNT(*) и OFFSET. Номера есть только у первых
+    PAGINATOR_NUMBERED_PAGES страниц: OFFSET и подсчёт записей ограничены
+    ими. Если сортировка идёт по полям связанной таблицы, в cursor_attrs
+    указываются атрибуты объекта с теми же значениями.
+    """
+
+    def __init__(self, object_list, per_page, ordering=FEED_ORDERING,
+                 cursor_attrs=None, **kwargs):
+        super().__init__(object_list, per_page, **kwargs)
+        self.ordering = ordering
+        self.field_names = [name.lstrip("-") for name in ordering]
+        self.cursor_attrs = cursor_attrs or self.field_names
+
+    @cached_property
+    def count(self):
+        """Число записей, но не больше, чем на страницах с номерами.
+
+        Дальше номеров нет, поэтому полный COUNT(*) не нужен: лишняя
+        строка сверх предела лишь показывает, что записи есть и дальше.
+        """
+
+        limit = PAGINATOR_NUMBERED_PAGES * self.per_page + 1
+        return self.object_list.order_by().values("pk")[:limit].count()
+
+    @property
+    def numbered_page_range(self):
+        return range(1, min(self.num_pages, PAGINATOR_NUMBERED_PAGES) + 1)
+
+    def cursor_for(self, obj):
+        return encode_cursor(getattr(obj, name) for name in self.cursor_attrs)
+
+    def _attach_cursors(self, page, is_cursor):
+        """Добавляет странице курсоры соседних страниц для шаблона."""
+
+        page.is_cursor = is_cursor
+        page.has_numbered_next = (
+            not is_cursor
+            and page.has_next()
+            and page.number < PAGINATOR_NUMBERED_PAGES
+        )
+        page.next_cursor = page.previous_cursor = ""
+        if len(page):
+            page.next_cursor = self.cursor_for(page[len(page) - 1])
+            page.previous_cursor = self.cursor_for(page[0])
+        return page
+
+    def page(self, number):
+        """Страница с номером, не обрезанная по count.
+
+        count может прийти из счётчика и отставать от таблицы, поэтому
+        номер не сверяется с num_pages, а читается на одну строку больше
+        страницы: если она есть, count поднимается так, чтобы у страницы
+        была следующая. Счётчик нужен только для ссылок на страницы.
+        """
+
+        number = int(number)
+        if number < 1:
+            raise EmptyPage("Номер страницы меньше 1")
+        bottom = (number - 1) * self.per_page
+        object_list = list(
+            self.object_list[bottom:bottom + self.per_page + 1]
+        )
+        count = max(self.count, bottom + len(object_list))
+        if count != self.count:
+            self.__dict__["count"] = count
+            self.__dict__.pop("num_pages", None)
+        return self._get_page(object_list[:self.per_page], number, self)
+
+    def get_page(self, number):
+        """Страница с номером не дальше PAGINATOR_NUMBERED_PAGES.
 
+        Номер больше предела открывает последнюю нумерованную страницу:
+        дальше читают по курсору, а не через OFFSET. Номер меньше
+        единицы открывает первую.
+        """
 
-def paginations(request, post_list):
-    paginator = Paginator(post_list, POST_PER_PAGE)
+        try:
+            number = max(1, min(int(number), PAGINATOR_NUMBERED_PAGES))
+        except (TypeError, ValueError):
+            number = 1
+        return self._attach_cursors(self.page(number), False)
+
+    def _keyset_filter(self, values, forward):
+        """Условие «строго после курсора» для пары полей сортировки.
+
+        (a < x) OR (a = x AND b < y) записано как
+        a <= x AND (a < x OR b < y): так база может начать чтение
+        индекса прямо с курсора, а не фильтровать строки с начала.
+        """
+
+        (first, second) = self.ordering
+        (first_value, second_value) = values
+
+        def lookup(name):
+            descending = name.startswith("-")
+            return "lt" if descending == forward else "gt"
+
+        first_name, second_name = self.field_names
+        return Q(**{f"{first_name}__{lookup(first)}e": first_value}) & (
+            Q(**{f"{first_name}__{lookup(first)}": first_value})
+            | Q(**{f"{second_name}__{lookup(second)}": second_value})
+        )
+
+    def _cursor_field(self, name):
+        """Поле модели или аннотации, из которого берётся значение курсора."""
+
+        annotation = self.object_list.query.annotations.get(name)
+        if annotation is not None:
+            return annotation.output_field
+        return self.object_list.model._meta.get_field(name)
+
+    def get_cursor_page(self, after=None, before=None, numbered=True):
+        """Страница после (или до) записи, закодированной в токене.
+
+        Без токена возвращается первая страница: обычная с номером
+        или, если numbered=False, курсорная без COUNT(*).
+        """
+
+        fields = [self._cursor_field(name) for name in self.cursor_attrs]
+        values = decode_cursor(after or before or "", fields)
+        forward = bool(after) or values is None
+        if values is None and numbered:
+            return self.get_page(1)
+
+        ordering = self.ordering
+        if not forward:
+            ordering = [
+                name[1:] if name.startswith("-") else f"-{name}"
+                for name in ordering
+            ]
+        queryset = self.object_list.order_by(*ordering)
+        if values is not None:
+            queryset = queryset.filter(self._keyset_filter(values, forward))
+        object_list = list(queryset[:self.per_page + 1])
+        has_more = len(object_list) > self.per_page
+        object_list = object_list[:self.per_page]
+        if forward:
+            page = CursorPage(
+                object_list,
+                self,
+                has_next=has_more,
+                has_previous=values is not None,
+            )
+        else:
+            object_list.reverse()
+            page = CursorPage(
+                object_list, self, has_next=True, has_previous=has_more,
+            )
+        return self._attach_cursors(page, True)
+
+
+def estimated_row_count(model, using="default"):
+    """Примерное число строк таблицы без полного прохода по ней.
+
+    В PostgreSQL берётся из статистики планировщика, в остальных
+    базах — максимальный первичный ключ, который читается по индексу.
+    """
+
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE relname = %s",
+                [model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        if row and row[0] > 0:
+            return row[0]
+    return (
+        model._default_manager.using(using)
+        .aggregate(last_pk=Max("pk"))["last_pk"]
+        or 0
+    )
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор для списков админки без точного COUNT(*) по таблице.
+
+    Для списка без фильтров количество берётся из estimated_row_count,
+    если таблица большая. С фильтрами строки считаются, но не больше
+    ESTIMATED_COUNT_LIMIT, поэтому дальние страницы выборки недоступны.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_row_count(queryset.model, queryset.db)
+            if estimate > ESTIMATED_COUNT_LIMIT:
+                return estimate
+        return (
+            queryset.order_by().values("pk")[:ESTIMATED_COUNT_LIMIT].count()
+        )
+
+
+def paginations(request, post_list, ordering=FEED_ORDERING, count=None,
+                cursor_attrs=None):
+    """Страница ленты.
+
+    Если количество записей уже известно (например, из счётчика),
+    его можно передать в count, и пагинатор не будет делать COUNT(*).
+    Без count записи считаются только в пределах страниц с номерами.
+    """
+
+    post_list = post_list.order_by(*ordering)
+    paginator = CursorPaginator(
+        post_list, POST_PER_PAGE, ordering=ordering, cursor_attrs=cursor_attrs
+    )
+    if count is not None:
+        paginator.count = count
+    after = request.GET.get("after")
+    before = request.GET.get("before")
+    if after or before:
+        return paginator.get_cursor_page(after=after, before=before)
     page_number = request.GET.get("page")
     page_obj = paginator.get_page(page_number)
 
     return page_obj
+
+
+def comments_page(request, post):
+    """Курсорная страница комментариев поста.
+
+    Номера страниц не поддерживаются: и первая, и любая следующая
+    страница читается диапазоном по (post, created) без OFFSET,
+    а общее количество берётся из счётчика поста.
+    """
+
+    order = request.GET.get("order")
+    if order not in COMMENTS_ORDERINGS:
+        order = "oldest"
+    ordering = COMMENTS_ORDERINGS[order]
+    comments = post.comments.select_related("author").order_by(*ordering)
+    paginator = CursorPaginator(comments, COMMENTS_PER_PAGE, ordering=ordering)
+    paginator.count = post.comments_count
+    page = paginator.get_cursor_page(
+        after=request.GET.get("after"), before=request.GET.get("before")
+    )
+    page.order = order
+    return page
+
+
+def search_page(request, post_list, ordering, cursor_attrs=None):
+    """Курсорная страница результатов поиска без COUNT(*)."""
+
+    paginator = CursorPaginator(
+        post_list, POST_PER_PAGE, ordering=ordering, cursor_attrs=cursor_attrs
+    )
+    return paginator.get_cursor_page(
+        after=request.GET.get("after"),
+        before=request.GET.get("before"),
+        numbered=False,
+    )
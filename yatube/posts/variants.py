@@ -0,0 +1,173 @@
+import posixpath
+from base64 import b64encode
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import PostImageVariant, StoredFile
+
+# Ширины вариантов картинки и пропорции кадра (как у миниатюры 960x339).
+IMAGE_VARIANT_WIDTHS = getattr(
+    settings, "POSTS_IMAGE_VARIANT_WIDTHS", (320, 640, 960, 1280)
+)
+IMAGE_VARIANT_RATIO = getattr(settings, "POSTS_IMAGE_VARIANT_RATIO", 960 / 339)
+IMAGE_VARIANT_DIR = "posts/variants"
+# Параметры сохранения Pillow для каждого формата.
+IMAGE_VARIANT_FORMATS = {
+    PostImageVariant.WEBP: ("WEBP", "webp", {"quality": 75, "method": 4}),
+    PostImageVariant.JPEG: (
+        "JPEG",
+        "jpg",
+        {"quality": 80, "optimize": True, "progressive": True},
+    ),
+}
+SIZES = "(min-width: 768px) 75vw, 100vw"
+# Заглушка: кадр варианта шириной в несколько пикселей, браузер
+# растягивает его с размытием, пока грузится картинка.
+PLACEHOLDER_WIDTH = 24
+PLACEHOLDER_OPTIONS = {"quality": 40, "optimize": True}
+# Сколько цветов оставить, чтобы выбрать основной.
+PALETTE_SIZE = 8
+
+
+def variant_widths(source_width, source_height):
+    """Ширины вариантов, для которых исходник не придётся увеличивать.
+
+    Кадр варианта вырезается с пропорцией IMAGE_VARIANT_RATIO, поэтому
+    ширину ограничивает и высота исходника. Если исходник уже самой
+    узкой ширины, остаётся один вариант в его собственную ширину.
+    """
+
+    largest = max(
+        1, min(source_width, int(source_height * IMAGE_VARIANT_RATIO))
+    )
+    widths = [width for width in IMAGE_VARIANT_WIDTHS if width <= largest]
+    return widths or [largest]
+
+
+def _flatten(image):
+    """RGB-копия картинки: прозрачность заливается белым."""
+
+    if image.mode in ("RGBA", "LA") or "transparency" in image.info:
+        image = image.convert("RGBA")
+        background = Image.new("RGB", image.size, (255, 255, 255))
+        background.paste(image, mask=image.getchannel("A"))
+        return background
+    return image.convert("RGB")
+
+
+def _save(name, image, format_name, options):
+    content = BytesIO()
+    image.save(content, format_name, **options)
+    data = content.getvalue()
+    # Хранилище не перезаписывает файлы, а добавляет к имени суффикс.
+    if default_storage.exists(name):
+        default_storage.delete(name)
+    default_storage.save(name, ContentFile(data))
+    return len(data)
+
+
+def load(image_name):
+    """Исходник в RGB, повёрнутый по EXIF, как его видит читатель."""
+
+    with default_storage.open(image_name) as source:
+        return _flatten(ImageOps.exif_transpose(Image.open(source)))
+
+
+def render_variants(image_name, image=None):
+    """Рисует все варианты картинки и возвращает их описание.
+
+    С базой не работает, поэтому выполняется в процессе пула воркера.
+    """
+
+    if image is None:
+        image = load(image_name)
+    # Расширение исходника входит в имя: a.png и a.jpg не столкнутся.
+    stem = posixpath.basename(image_name).replace(".", "_")
+    variants = []
+    for width in variant_widths(image.width, image.height):
+        height = max(1, round(width / IMAGE_VARIANT_RATIO))
+        frame = ImageOps.fit(image, (width, height), Image.LANCZOS)
+        for variant_format, (format_name, extension, options) in (
+            IMAGE_VARIANT_FORMATS.items()
+        ):
+            name = f"{IMAGE_VARIANT_DIR}/{stem}_{width}.{extension}"
+            variants.append({
+                "format": variant_format,
+                "width": width,
+                "height": height,
+                "file": name,
+                "size": _save(name, frame, format_name, options),
+            })
+    return variants
+
+
+def store_variants(image_name, variants):
+    PostImageVariant.objects.filter(image=image_name).delete()
+    PostImageVariant.objects.bulk_create(
+        PostImageVariant(image=image_name, **variant) for variant in variants
+    )
+
+
+def describe(image):
+    """Размеры, основной цвет и заглушка картинки для StoredFile."""
+
+    small = image.copy()
+    small.thumbnail((64, 64))
+    palette = small.quantize(colors=PALETTE_SIZE)
+    _, index = max(palette.getcolors())
+    red, green, blue = palette.getpalette()[index * 3:index * 3 + 3]
+    height = max(1, round(PLACEHOLDER_WIDTH / IMAGE_VARIANT_RATIO))
+    frame = ImageOps.fit(small, (PLACEHOLDER_WIDTH, height), Image.LANCZOS)
+    content = BytesIO()
+    frame.save(content, "JPEG", **PLACEHOLDER_OPTIONS)
+    return {
+        "width": image.width,
+        "height": image.height,
+        "dominant_color": f"#{red:02x}{green:02x}{blue:02x}",
+        "placeholder": "data:image/jpeg;base64,"
+        + b64encode(content.getvalue()).decode("ascii"),
+    }
+
+
+def store_metadata(image_name, metadata):
+    StoredFile.objects.filter(name=image_name).update(**metadata)
+
+
+class VariantSet:
+    """Варианты одной картинки в виде, удобном для <picture>."""
+
+    sizes = SIZES
+
+    def __init__(self, variants):
+        self.by_format = {}
+        for variant in sorted(variants, key=lambda variant: variant.width):
+            self.by_format.setdefault(variant.format, []).append(variant)
+
+    def __bool__(self):
+        return bool(self.by_format.get(PostImageVariant.JPEG))
+
+    def _srcset(self, variant_format):
+        return ", ".join(
+            f"{variant.file.url} {variant.width}w"
+            for variant in self.by_format.get(variant_format, [])
+        )
+
+    @property
+    def webp_srcset(self):
+        return self._srcset(PostImageVariant.WEBP)
+
+    @property
+    def jpeg_srcset(self):
+        return self._srcset(PostImageVariant.JPEG)
+
+    @property
+    def fallback(self):
+        """JPEG для браузеров без srcset: самый широкий не больше 960."""
+
+        jpegs = self.by_format[PostImageVariant.JPEG]
+        suitable = [variant for variant in jpegs if variant.width <= 960]
+        return (suitable or jpegs)[-1]
@@ -1,24 +1,42 @@
 from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import JsonResponse
 from django.shortcuts import get_object_or_404, redirect, render
 
+from . import uploads
+from .cache import (
+    cache_anonymous_page,
+    conditional_page,
+    follow_scopes,
+    group_scopes,
+    index_scopes,
+    post_scopes,
+    profile_scopes,
+)
 from .forms import CommentForm, PostForm
-from .models import Group, Post, User, Comment, Follow
-from .utils import paginations
+from .models import Group, Post, User, Follow, UserStats
+from .search import search_posts
+from .timeline import follow_feed
+from .utils import comments_page, paginations, search_page
 
 
+@conditional_page(index_scopes)
+@cache_anonymous_page(index_scopes)
 def index(request):
     template = 'posts/index.html'
-    post_list = Post.objects.all()
+    post_list = Post.objects.for_feed()
     page_obj = paginations(request, post_list)
     context = {'page_obj': page_obj}
     return render(request, template, context)
 
 
+@conditional_page(group_scopes)
+@cache_anonymous_page(group_scopes)
 def group_posts(request, slug):
     group = get_object_or_404(Group, slug=slug)
     template = 'posts/group_list.html'
-    post_list = Post.objects.select_related('group')
-    page_obj = paginations(request, post_list)
+    post_list = Post.objects.for_feed().filter(group=group)
+    page_obj = paginations(request, post_list, count=group.posts_count)
     context = {
         'page_obj': page_obj,
         'group': group,
@@ -26,14 +44,13 @@ def group_posts(request, slug):
     return render(request, template, context)
 
 
+@conditional_page(profile_scopes)
+@cache_anonymous_page(profile_scopes)
 def profile(request, username):
     profile = get_object_or_404(User, username=username)
-    post_list = (
-        Post.objects.select_related("author", "group")
-        .filter(author=profile).all()
-    )
-    posts_count = post_list.count()
-    page_obj = paginations(request, post_list)
+    post_list = Post.objects.for_feed().filter(author=profile)
+    posts_count = UserStats.for_user(profile).posts_count
+    page_obj = paginations(request, post_list, count=posts_count)
     following = request.user.is_authenticated
     if following:
         following = profile.following.filter(user=request.user).exists()
@@ -47,15 +64,19 @@ def profile(request, username):
     return render(request, template, context)
 
 
+@conditional_page(post_scopes)
 def post_detail(request, post_id):
     """Страница поста и количество постов пользователя."""
 
-    post = get_object_or_404(Post, pk=post_id)
+    post = get_object_or_404(
+        Post.objects.select_related("author", "group"), pk=post_id
+    )
     form = CommentForm()
-    comments = Comment.objects.select_related('post')
+    comments = comments_page(request, post)
     template = "posts/post_detail.html"
     context = {
         "post": post,
+        "posts_count": UserStats.for_user(post.author).posts_count,
         "form": form,
         "comments": comments
     }
@@ -63,13 +84,57 @@ def post_detail(request, post_id):
     return render(request, template, context)
 
 
+def post_comments(request, post_id):
+    """Следующая страница комментариев: HTML-фрагмент или JSON."""
+
+    post = get_object_or_404(
+        Post.objects.only("id", "comments_count"), pk=post_id
+    )
+    comments = comments_page(request, post)
+    if request.GET.get("format") == "json":
+        return JsonResponse({
+            "comments": [
+                {
+                    "id": comment.pk,
+                    "author": comment.author.username,
+                    "text": comment.text,
+                    "created": comment.created.isoformat(),
+                }
+                for comment in comments
+            ],
+            "next": comments.next_cursor if comments.has_next() else None,
+        })
+    context = {
+        "post": post,
+        "comments": comments,
+    }
+    return render(request, "posts/includes/comments.html", context)
+
+
+def search(request):
+    """Поиск постов по тексту: самые релевантные сначала."""
+
+    query = request.GET.get("q", "").strip()
+    post_list, ordering, cursor_attrs = search_posts(query)
+    page_obj = search_page(request, post_list, ordering, cursor_attrs)
+    context = {
+        "query": query,
+        "page_obj": page_obj,
+    }
+    return render(request, "posts/search.html", context)
+
+
 @login_required(login_url="users:login")
+@transaction.atomic
 def post_create(request):
     """Добавления поста."""
 
     template = "posts/create_post.html"
 
-    form = PostForm(request.POST or None)
+    form = PostForm(
+        request.POST or None,
+        files=uploads.request_files(request) or None,
+    )
     context = {
         "form": form,
     }
@@ -83,6 +148,7 @@ def post_create(request):
 
 
 @login_required(login_url="users:login")
+@transaction.atomic
 def post_edit(request, post_id):
     """Редактирование поста. Доступно только автору."""
 
@@ -92,7 +158,7 @@ def post_edit(request, post_id):
 
     form = PostForm(
         request.POST or None,
-        files=request.FILES or None,
+        files=uploads.request_files(request) or None,
         instance=post
     )
     if form.is_valid():
@@ -107,6 +173,7 @@ def post_edit(request, post_id):
 
 
 @login_required
+@transaction.atomic
 def add_comment(request, post_id):
     # Получите пост и сохраните его в переменную post.
     form = CommentForm(request.POST or None)
@@ -120,21 +187,13 @@ def add_comment(request, post_id):
 
 
 @login_required
+@conditional_page(follow_scopes)
 def follow_index(request):
     template = "posts/follow.html"
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginations(request, post_list)
-    context = {
-        "page_obj": page_obj,
-    }
-    return render(request, template, context)
-
-
-@login_required
-def follow_index(request):
-    template = "posts/follow.html"
-    post_list = Post.objects.filter(author__following__user=request.user)
-    page_obj = paginations(request, post_list)
+    post_list, ordering, cursor_attrs = follow_feed(request.user)
+    page_obj = paginations(
+        request, post_list, ordering=ordering, cursor_attrs=cursor_attrs
+    )
     context = {
         "page_obj": page_obj,
     }
@@ -142,6 +201,7 @@ def follow_index(request):
 
 
 @login_required
+@transaction.atomic
 def profile_follow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -153,6 +213,7 @@ def profile_follow(request, username):
 
 
 @login_required
+@transaction.atomic
 def profile_unfollow(request, username):
     author = get_object_or_404(User, username=username)
     if author != request.user:
@@ -50,7 +50,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "core.middleware.ServerTimingMiddleware",
+    "core.middleware.QueryBudgetMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    # Выше сессий и CSRF, чтобы видеть выставленные ими cookie
+    "core.middleware.CachePolicyMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -64,7 +68,8 @@ ROOT_URLCONF = "yatube.urls"
 TEMPLATES_DIR = os.path.join(BASE_DIR, "templates")
 TEMPLATES = [
     {
-        "BACKEND": "django.template.backends.django.DjangoTemplates",
+        # Обычные шаблоны Django, которые замеряют время отрисовки
+        "BACKEND": "core.timing.TimedDjangoTemplates",
         "DIRS": [TEMPLATES_DIR],
         "APP_DIRS": True,
         "OPTIONS": {
@@ -93,6 +98,62 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+# "pages" хранит страницы лент, "page_versions" — версии областей кэша.
+# Оба должны быть общими для всех процессов сервера, поэтому используется
+# файловый кэш.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Кэши страниц и версий должны быть общими для всех воркеров.
+    # В продакшене их лучше держать в memcached или redis: файловый кэш
+    # при каждой записи перечисляет каталог и, дойдя до MAX_ENTRIES,
+    # удаляет каждый CULL_FREQUENCY-й файл.
+    "pages": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "pages"),
+        "OPTIONS": {"MAX_ENTRIES": 20000, "CULL_FREQUENCY": 10},
+    },
+    # Версии областей отдельно от страниц: вытеснение страниц
+    # не должно сбрасывать версии
+    "page_versions": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": os.path.join(BASE_DIR, "cache", "page_versions"),
+        "OPTIONS": {"MAX_ENTRIES": 1000000},
+    },
+}
+
+# Кэш страниц лент для анонимных пользователей
+POSTS_PAGE_CACHE_ENABLED = False
+POSTS_PAGE_CACHE_ALIAS = "pages"
+POSTS_VERSION_CACHE_ALIAS = "page_versions"
+POSTS_PAGE_CACHE_TIMEOUT = 60 * 60
+
+# Cache-Control публичных страниц для nginx (core.middleware.CACHE_POLICIES)
+CACHE_POLICY_MAX_AGE = 60
+CACHE_POLICY_STALE_WHILE_REVALIDATE = 5 * 60
+
+# Замеры запросов: заголовок Server-Timing, журнал yatube.requests (INFO)
+# и журнал медленных запросов yatube.slow (WARNING) с самыми дорогими SQL
+SLOW_REQUEST_MS = 500
+SLOW_REQUEST_QUERIES = 50
+SLOW_REQUEST_TOP_SQL = 5
+# Проверка бюджетов запросов core.middleware.QUERY_BUDGETS при DEBUG:
+# "log" — предупреждение в журнал yatube.budget, "raise" — исключение
+QUERY_BUDGET_MODE = None
+# Метрики для /metrics: каждый процесс раз в секунду сбрасывает свои
+# счётчики в общий файл SQLite, поэтому видны суммы по всем воркерам
+METRICS_DB_PATH = os.path.join(BASE_DIR, "cache", "metrics.sqlite3")
+METRICS_FLUSH_INTERVAL = 1.0
+METRICS_FLUSH_MAX_PENDING = 1000
+# Кто может читать /metrics без входа: сборщик Prometheus на этом хосте.
+# Сотрудникам (is_staff) метрики доступны с любого адреса
+METRICS_ALLOWED_IPS = ["127.0.0.1", "::1"]
+
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
@@ -133,6 +194,10 @@ STATIC_URL = "/static/"
 STATICFILES_DIRS = [
     os.path.join(BASE_DIR, "static")
 ]
+STATIC_ROOT = os.path.join(BASE_DIR, "collected_static")
+# Имена с хешем содержимого и копии .gz/.br: core.views.static_file
+# отдаёт их с Cache-Control на год
+STATICFILES_STORAGE = "core.storage.CompressedManifestStaticFilesStorage"
 
 LOGIN_URL = "users:login"
 LOGIN_REDIRECT_URL = "posts:index"
@@ -142,6 +207,36 @@ EMAIL_BACKEND = "django.core.mail.backends.filebased.EmailBackend"
 EMAIL_FILE_PATH = os.path.join(BASE_DIR, "sent_emails")
 
 POST_PER_PAGE = 10
+COMMENTS_PER_PAGE = 20
+# Сколько первых страниц ленты доступны по номеру, дальше — курсоры
+PAGINATOR_NUMBERED_PAGES = 10
+# Списки в админке: точный COUNT(*) считается не дальше этого числа строк
+ESTIMATED_COUNT_LIMIT = 10000
+
+# Лента подписок: посты авторов, у которых подписчиков больше лимита,
+# не раскладываются по лентам при записи, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 10000
+TIMELINE_BACKFILL_SIZE = 200
+
+# Миниатюры картинок постов готовит воркер thumbnail_worker,
+# страницы только ищут готовые: имя → (геометрия, опции sorl)
+POSTS_THUMBNAIL_PRESETS = {
+    "card": ("960x339", {"crop": "center", "upscale": True}),
+}
+POSTS_THUMBNAIL_MAX_ATTEMPTS = 3
+# Загрузка картинок: поток пишется во временный файл не дальше лимита,
+# картинки больше MAX_DIMENSION и с EXIF пережимаются
+FILE_UPLOAD_HANDLERS = ["posts.uploads.LimitedTemporaryFileUploadHandler"]
+POSTS_IMAGE_MAX_UPLOAD_SIZE = 20 * 1024 * 1024
+POSTS_IMAGE_MAX_PIXELS = 40_000_000
+POSTS_IMAGE_MAX_DIMENSION = 2560
+# Тот же воркер готовит варианты картинки для srcset: WebP и JPEG
+POSTS_IMAGE_VARIANT_WIDTHS = (320, 640, 960, 1280)
+# Сколько готовых картинок помнит каждый процесс (LRU)
+POSTS_IMAGE_CACHE_SIZE = 1024
+# Сборщик мусора медиа (collect_media_garbage) не трогает файлы и записи
+# моложе часа: их может прямо сейчас использовать загрузка или воркер
+POSTS_MEDIA_GC_MIN_AGE = 60 * 60
 
 CSRF_FAILURE_VIEW = 'core.views.csrf_failure'
 